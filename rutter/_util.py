@@ -0,0 +1,44 @@
+""" Helpers shared by rutter's mounts and wrappers.
+"""
+
+_COMPRESSIBLE_TYPES = frozenset([
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml',
+])
+
+
+def _asbool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', 'yes', 'on', 'y', 't', '1')
+    return bool(value)
+
+
+def _compressible(content_type):
+    return (content_type.startswith('text/')
+            or content_type in _COMPRESSIBLE_TYPES)
+
+
+def _accepts_gzip(environ):
+    for coding in environ.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = coding.partition(';')
+        if name.strip().lower() == 'gzip':
+            qvalue = 1.0
+            for param in params.split(';'):
+                key, _, value = param.partition('=')
+                if key.strip().lower() == 'q':
+                    try:
+                        qvalue = float(value)
+                    except ValueError:
+                        qvalue = 0.0
+            return qvalue > 0
+    return False
+
+
+def _error(start_response, status, headers=()):
+    body = status.encode('ascii')
+    start_response(status, [('Content-Type', 'text/plain'),
+                            ('Content-Length', str(len(body)))]
+                   + list(headers))
+    return [body]
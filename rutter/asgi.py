@@ -0,0 +1,231 @@
+""" Map URL prefixes to ASGI applications.  See ``ASGIURLMap``
+"""
+import asyncio
+import time
+
+from .urlmap import URLMap
+from .urlmap import _normalize_path_info
+from .urlmap import _split_host
+
+
+class LifespanError(Exception):
+    """ A mounted application failed to start up or shut down.
+
+    ``mount`` is the ``(domain, path)`` key of the (first) mount for the
+    application.
+    """
+    def __init__(self, mount, message):
+        super(LifespanError, self).__init__(
+            'Mount %r: %s' % (mount, message))
+        self.mount = mount
+
+
+async def _default_not_found_app(scope, receive, send):
+    body = ('Not Found: %s' % scope.get('path', '')).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': 404,
+        'headers': [(b'content-type', b'text/plain; charset=utf-8'),
+                    (b'content-length', str(len(body)).encode('ascii'))],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class _AppLifespan(object):
+    """ Drive the lifespan protocol for one mounted application.
+    """
+    task = None
+    supported = True
+
+    def __init__(self, mount, app, scope):
+        self.mount = mount
+        self.app = app
+        self.scope = scope
+        self._to_app = asyncio.Queue()
+        self._from_app = asyncio.Queue()
+
+    async def _run(self):
+        try:
+            await self.app(self.scope, self._to_app.get, self._from_app.put)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Per the ASGI spec, an app which raises instead of
+            # answering doesn't support the lifespan protocol.
+            pass
+
+    async def _exchange(self, event, timeout):
+        await self._to_app.put({'type': 'lifespan.%s' % event})
+        reply = asyncio.ensure_future(self._from_app.get())
+        done, _ = await asyncio.wait(
+            [reply, self.task], timeout=timeout,
+            return_when=asyncio.FIRST_COMPLETED)
+        if reply not in done:
+            reply.cancel()
+            if not done:
+                raise LifespanError(
+                    self.mount, '%s timed out after %ss' % (event, timeout))
+            self.supported = False
+            return
+        message = reply.result()
+        if message['type'] == 'lifespan.%s.failed' % event:
+            raise LifespanError(
+                self.mount, '%s failed: %s'
+                % (event, message.get('message', '')))
+        if message['type'] != 'lifespan.%s.complete' % event:
+            raise LifespanError(
+                self.mount, 'unexpected message %r' % (message['type'],))
+
+    async def startup(self, timeout):
+        self.task = asyncio.ensure_future(self._run())
+        await self._exchange('startup', timeout)
+
+    async def shutdown(self, timeout):
+        if self.supported:
+            try:
+                await self._exchange('shutdown', timeout)
+            finally:
+                self.cancel()
+
+    def cancel(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+
+class ASGIURLMap(URLMap):
+    """Dispatch to one of several ASGI applications based on the URL.
+
+    Mounts are keyed and matched just as for ``URLMap``.  On a match, the
+    prefix is appended to the scope's ``root_path``, and removed from its
+    ``path``.  Mounted ``ASGIURLMap`` instances are resolved in the same
+    walk.
+
+    Lifespan events are fanned out to all mounted applications
+    concurrently.  Each application's startup (or shutdown) must complete
+    within ``startup_timeout`` (or ``shutdown_timeout``) seconds, if given.
+    Startup fails as soon as any one application fails, cancelling the rest.
+    After startup, ``startup_times`` maps each mount key to the seconds its
+    application took to start.
+    """
+    def __init__(self, not_found_app=_default_not_found_app,
+                 startup_timeout=None, shutdown_timeout=None):
+        super(ASGIURLMap, self).__init__(not_found_app)
+        self.startup_timeout = startup_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.startup_times = {}
+        self._lifespans = []
+
+    def _mounted_apps(self):
+        """Return ``[(app, [key, ...])]``, each application only once.
+        """
+        by_id = {}
+        for dom_url, app in self.applications:
+            if id(app) in by_id:
+                by_id[id(app)][1].append(dom_url)
+            else:
+                by_id[id(app)] = (app, [dom_url])
+        return list(by_id.values())
+
+    async def startup(self, scope):
+        """Run the lifespan startup of all mounted applications.
+
+        Raise ``LifespanError`` if any of them fails or times out.
+        """
+        self.startup_times = {}
+        self._lifespans = []
+
+        async def _start(app, keys):
+            lifespan = _AppLifespan(keys[0], app, scope)
+            self._lifespans.append(lifespan)
+            started = time.perf_counter()
+            await lifespan.startup(self.startup_timeout)
+            elapsed = time.perf_counter() - started
+            for key in keys:
+                self.startup_times[key] = elapsed
+
+        tasks = [asyncio.ensure_future(_start(app, keys))
+                 for app, keys in self._mounted_apps()]
+        if not tasks:
+            return
+        done, pending = await asyncio.wait(
+            tasks, return_when=asyncio.FIRST_EXCEPTION)
+        failed = [task for task in done if task.exception() is not None]
+        if failed:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for lifespan in self._lifespans:
+                lifespan.cancel()
+            raise failed[0].exception()
+
+    async def shutdown(self):
+        """Run the lifespan shutdown of all started applications.
+
+        Every application is asked to shut down, even if others fail;
+        afterwards, raise the first ``LifespanError``, if any.
+        """
+        lifespans, self._lifespans = self._lifespans, []
+        results = await asyncio.gather(
+            *[lifespan.shutdown(self.shutdown_timeout)
+              for lifespan in lifespans],
+            return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    async def _lifespan(self, scope, receive, send):
+        await receive()
+        try:
+            await self.startup(scope)
+        except LifespanError as e:
+            await send({'type': 'lifespan.startup.failed',
+                        'message': str(e)})
+            return
+        await send({'type': 'lifespan.startup.complete'})
+        await receive()
+        try:
+            await self.shutdown()
+        except LifespanError as e:
+            await send({'type': 'lifespan.shutdown.failed',
+                        'message': str(e)})
+            return
+        await send({'type': 'lifespan.shutdown.complete'})
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(scope, receive, send)
+        scheme = scope.get('scheme', 'http')
+        host = None
+        for name, value in scope.get('headers', ()):
+            if name == b'host':
+                host = value.decode('latin-1')
+                break
+        if host is None:
+            server = scope.get('server')
+            if not server:
+                host = ''
+            elif server[1] is None:  # e.g. a unix socket
+                host = server[0]
+            else:
+                host = '%s:%d' % tuple(server)
+        host, hostport = _split_host(
+            host, '80' if scheme in ('http', 'ws') else '443')
+        path = _normalize_path_info(scope['path'])
+        app_url, app = self._match(host, hostport, path)
+        if app is None:
+            return await self.not_found_application(scope, receive, send)
+        scope = dict(scope)
+        root_path = scope.get('root_path', '') + app_url
+        path = path[len(app_url):]
+        # As for ``URLMap``, resolve nested maps here.
+        while type(app) is ASGIURLMap:
+            urlmap = app
+            app_url, app = urlmap._match(host, hostport, path)
+            if app is None:
+                scope['root_path'], scope['path'] = root_path, path
+                return await urlmap.not_found_application(
+                    scope, receive, send)
+            root_path += app_url
+            path = path[len(app_url):]
+        scope['root_path'], scope['path'] = root_path, path
+        return await app(scope, receive, send)
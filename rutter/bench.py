@@ -0,0 +1,494 @@
+""" Load harness for ``URLMap`` dispatch.  See ``run_load``
+
+Drives a ``URLMap`` with a configurable number of mounts from concurrent
+client threads, requesting Zipf-distributed paths, and reports throughput
+along with percentiles of the *dispatch overhead*:  the time from entering
+the map to entering the mounted application.
+
+``run_scaling`` instead measures how in-process throughput of a single
+shared map scales with the number of threads (on free-threaded builds of
+Python, it should scale near-linearly).
+
+``run_allocations`` measures the memory allocated by each dispatch, for
+requests which hit a path mount, hit a domain mount, or miss.
+
+``run_replay`` replays the requests of a capture (see ``rutter.capture``)
+against the mounts of an index file (see ``URLMap.dump_index``).
+
+Run from the command line, e.g.::
+
+    $ python -m rutter.bench --mounts 500 --clients 16 --mode http
+    $ python -m rutter.bench --scaling 1,2,4,8
+    $ python -m rutter.bench --allocations
+    $ python -m rutter.bench --replay capture.jsonl --index routes.json
+"""
+import argparse
+import bisect
+import gc
+import http.client
+import itertools
+import math
+import random
+import socketserver
+import sys
+import threading
+import time
+import tracemalloc
+from wsgiref.simple_server import WSGIRequestHandler
+from wsgiref.simple_server import WSGIServer
+from wsgiref.simple_server import make_server
+
+from .capture import read_capture
+from .urlmap import URLMap
+
+_START_KEY = 'rutter.bench.start'
+_BODY = [b'OK']
+
+
+def percentile(ordered, fraction):
+    """ Return the value at ``fraction`` (0 to 1) of the sorted ``ordered``.
+
+    Uses the nearest-rank method;  return ``None`` for an empty sequence.
+    """
+    if not ordered:
+        return None
+    rank = max(int(math.ceil(round(fraction * len(ordered), 9))), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(latencies_ns, count, elapsed):
+    """ Return a report dict for ``count`` requests taking ``elapsed`` s.
+
+    ``latencies_ns`` are the measured dispatch overheads, in nanoseconds;
+    percentiles are reported in microseconds.
+    """
+    ordered = sorted(latencies_ns)
+    report = {
+        'requests': count,
+        'seconds': elapsed,
+        'throughput': count / elapsed if elapsed else 0.0,
+    }
+    for name, fraction in (('p50', 0.5), ('p99', 0.99), ('p999', 0.999)):
+        value = percentile(ordered, fraction)
+        report[name + '_us'] = None if value is None else value / 1000.0
+    return report
+
+
+def format_report(report):
+    """ Return ``report`` as lines of text.
+    """
+    lines = ['%-12s %s' % ('requests', report['requests']),
+             '%-12s %.3f' % ('seconds', report['seconds']),
+             '%-12s %.1f req/s' % ('throughput', report['throughput'])]
+    for name in ('p50', 'p99', 'p999'):
+        value = report[name + '_us']
+        lines.append('%-12s %s' % (
+            name, 'n/a' if value is None else '%.2f us' % value))
+    return '\n'.join(lines)
+
+
+def make_app(latencies):
+    """ Return a WSGI app which records its dispatch overhead.
+
+    The overhead is measured from the ``rutter.bench.start`` environ key,
+    set by ``timed``, and appended to ``latencies``.
+    """
+    def app(environ, start_response):
+        now = time.perf_counter_ns()
+        started = environ.get(_START_KEY)
+        if started is not None:
+            latencies.append(now - started)
+        start_response('200 OK', [('Content-Type', 'text/plain'),
+                                  ('Content-Length', '2')])
+        return _BODY
+    return app
+
+
+def timed(app):
+    """ Wrap ``app`` (the map under test) to stamp the dispatch start time.
+    """
+    def wrapper(environ, start_response):
+        environ[_START_KEY] = time.perf_counter_ns()
+        return app(environ, start_response)
+    return wrapper
+
+
+def make_urlmap(mounts, latencies, depth=2):
+    """ Return ``(urlmap, paths)``:  a map with ``mounts`` mounts.
+
+    Each mount is at a path ``depth`` segments deep, and records its
+    dispatch overhead into ``latencies``;  so does the map's not-found
+    application.
+    """
+    app = make_app(latencies)
+    urlmap = URLMap(not_found_app=app)
+    paths = []
+    for i in range(mounts):
+        path = '/'.join([''] + ['m%d' % i] * depth)
+        paths.append(path)
+    urlmap.update((path, app) for path in paths)
+    return urlmap, paths
+
+
+def zipf_paths(paths, count, s=1.1, miss_ratio=0.0, seed=None):
+    """ Return ``count`` request paths, drawn from ``paths`` by Zipf's law.
+
+    The mount at rank ``k`` (1-based) is requested with weight ``1 / k**s``.
+    A ``miss_ratio`` fraction of the requests are for unmounted paths.
+    Each path gets a trailing sub-path, as a real request would.
+    """
+    rnd = random.Random(seed)
+    cumulative = list(itertools.accumulate(
+        1.0 / (rank ** s) for rank in range(1, len(paths) + 1)))
+    total = cumulative[-1] if cumulative else 0.0
+    result = []
+    for i in range(count):
+        if not paths or rnd.random() < miss_ratio:
+            result.append('/nonesuch/%d' % i)
+        else:
+            index = bisect.bisect_left(cumulative, rnd.random() * total)
+            result.append(paths[min(index, len(paths) - 1)] + '/item/%d' % i)
+    return result
+
+
+def _environ(path):
+    return {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'HTTP_HOST': 'localhost',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'wsgi.url_scheme': 'http',
+    }
+
+
+def _start_response(status, headers, exc_info=None):
+    pass
+
+
+def _run_clients(clients, requests, work):
+    """ Run ``work(batch)`` in ``clients`` threads, splitting ``requests``.
+
+    Return the elapsed wall-clock seconds.
+    """
+    batches = [requests[i::clients] for i in range(clients)]
+    barrier = threading.Barrier(clients + 1)
+
+    def _client(batch):
+        barrier.wait()
+        work(batch)
+
+    threads = [threading.Thread(target=_client, args=(batch,))
+               for batch in batches]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def run_inprocess(urlmap, paths, clients=4):
+    """ Dispatch ``paths`` through ``urlmap`` directly from client threads.
+
+    Return the elapsed seconds.
+    """
+    app = timed(urlmap)
+
+    def _work(batch):
+        for path in batch:
+            app(_environ(path), _start_response)
+
+    return _run_clients(clients, paths, _work)
+
+
+class _ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_http(urlmap, paths, clients=4):
+    """ Serve ``urlmap`` on a localhost port and request ``paths`` over HTTP.
+
+    Uses a threaded ``wsgiref`` server, with one ``http.client`` connection
+    per request from each client thread.  Return the elapsed seconds.
+    """
+    server = make_server('127.0.0.1', 0, timed(urlmap),
+                         server_class=_ThreadingWSGIServer,
+                         handler_class=_QuietHandler)
+    port = server.server_address[1]
+    serving = threading.Thread(target=server.serve_forever,
+                               kwargs={'poll_interval': 0.05})
+    serving.start()
+
+    def _work(batch):
+        for path in batch:
+            conn = http.client.HTTPConnection('127.0.0.1', port)
+            try:
+                conn.request('GET', path)
+                conn.getresponse().read()
+            finally:
+                conn.close()
+
+    try:
+        return _run_clients(clients, paths, _work)
+    finally:
+        server.shutdown()
+        server.server_close()
+        serving.join()
+
+
+_MODES = {'inprocess': run_inprocess, 'http': run_http}
+
+
+def run_load(mounts=100, clients=4, requests=10000, mode='inprocess',
+             s=1.1, miss_ratio=0.0, seed=None):
+    """ Run a load test, returning a report dict (see ``summarize``).
+    """
+    latencies = []
+    urlmap, mount_paths = make_urlmap(mounts, latencies)
+    paths = zipf_paths(mount_paths, requests, s, miss_ratio, seed)
+    elapsed = _MODES[mode](urlmap, paths, clients)
+    return summarize(latencies, len(paths), elapsed)
+
+
+def gil_enabled():
+    """ Return whether the GIL is enabled in this interpreter.
+    """
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+
+def run_scaling(mounts=100, threads=(1, 2, 4, 8), requests=20000, s=1.1,
+                seed=None):
+    """ Measure throughput of one shared map at each of ``threads`` counts.
+
+    Each thread dispatches the same ``requests`` Zipf-distributed requests,
+    without recording latencies, so that the threads share nothing but the
+    map.  Return a list of ``{'threads', 'throughput', 'speedup'}`` dicts,
+    where ``speedup`` is relative to the first thread count.
+    """
+    urlmap, mount_paths = make_urlmap(mounts, [])
+    paths = zipf_paths(mount_paths, requests, s, 0.0, seed)
+
+    def _work(batch):
+        for path in batch:
+            urlmap(_environ(path), _start_response)
+
+    results = []
+    for count in threads:
+        elapsed = _run_clients(count, paths * count, _work)
+        throughput = count * len(paths) / elapsed
+        base = results[0]['throughput'] if results else throughput
+        results.append({'threads': count,
+                        'throughput': throughput,
+                        'speedup': throughput / base})
+    return results
+
+
+def format_scaling(results):
+    """ Return the results of ``run_scaling`` as lines of text.
+    """
+    lines = ['GIL enabled: %s' % gil_enabled(),
+             '%8s %14s %8s' % ('threads', 'req/s', 'speedup')]
+    for result in results:
+        lines.append('%8d %14.1f %7.2fx' % (
+            result['threads'], result['throughput'], result['speedup']))
+    return '\n'.join(lines)
+
+
+def _noop_app(environ, start_response):
+    return _BODY
+
+
+def allocation_scenarios(mounts=100):
+    """ Return ``(urlmap, scenarios)`` for measuring dispatch allocations.
+
+    ``urlmap`` has ``mounts`` path mounts, plus one domain mount;  all its
+    applications (including the not-found one) allocate nothing.
+    ``scenarios`` maps ``'hit'``, ``'domain'`` and ``'miss'`` to a request
+    environ hitting a path mount, hitting the domain mount, or missing.
+    """
+    urlmap, paths = make_urlmap(mounts, [])
+    urlmap.update((path, _noop_app) for path in paths)
+    urlmap['http://example.com:8080/d'] = _noop_app
+    urlmap.not_found_application = _noop_app
+    scenarios = {
+        'hit': _environ(paths[-1] + '/item'),
+        'domain': dict(_environ('/d/item'), HTTP_HOST='Example.com:8080'),
+        'miss': _environ('/nonesuch/item'),
+    }
+    return urlmap, scenarios
+
+
+def measure_allocations(app, environ, iterations=1000):
+    """ Measure the memory allocated by calling ``app`` with ``environ``.
+
+    Each call gets its own copy of ``environ``, made beforehand.  Return a
+    dict of per-call means:  ``blocks``, the memory blocks allocated and
+    still live after the call (as counted by ``sys.getallocatedblocks``),
+    and ``bytes``, their size;  and ``peak_bytes``, the median over calls
+    of the most memory live at once during a call, including temporaries
+    (as traced by ``tracemalloc``).  The median ignores one-off
+    allocations, e.g. by a tracer or profiler seeing new code.
+    """
+    def _copies():
+        return [dict(environ) for i in range(iterations)]
+
+    for copy in _copies()[:10]:  # warm up any caches
+        app(copy, _start_response)
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        copies = _copies()
+        before = sys.getallocatedblocks()
+        for copy in copies:
+            app(copy, _start_response)
+        blocks = sys.getallocatedblocks() - before
+        del copies
+
+        copies = _copies()
+        total, peaks = 0, []
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        try:
+            for copy in copies:
+                tracemalloc.clear_traces()
+                app(copy, _start_response)
+                current, call_peak = tracemalloc.get_traced_memory()
+                total += current
+                peaks.append(call_peak)
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return {'blocks': blocks / iterations,
+            'bytes': total / iterations,
+            'peak_bytes': percentile(sorted(peaks), 0.5)}
+
+
+def run_allocations(mounts=100, iterations=1000):
+    """ Measure dispatch allocations for each of ``allocation_scenarios``.
+
+    Return a dict mapping scenario names to ``measure_allocations`` results.
+    """
+    urlmap, scenarios = allocation_scenarios(mounts)
+    return dict((name, measure_allocations(urlmap, environ, iterations))
+                for name, environ in scenarios.items())
+
+
+def format_allocations(results):
+    """ Return the results of ``run_allocations`` as lines of text.
+    """
+    lines = ['%-8s %8s %8s %10s' % ('scenario', 'blocks', 'bytes', 'peak')]
+    for name in sorted(results):
+        result = results[name]
+        lines.append('%-8s %8.2f %8.1f %10d' % (
+            name, result['blocks'], result['bytes'], result['peak_bytes']))
+    return '\n'.join(lines)
+
+
+def replay_environs(records):
+    """ Return a request environ for each capture record.
+    """
+    return [dict(_environ(path_info), HTTP_HOST=hostport,
+                 **{'wsgi.url_scheme': scheme})
+            for hostport, scheme, path_info, mount, elapsed in records]
+
+
+def run_replay(capture_fp, index_fp, clients=4):
+    """ Replay a capture against the mounts of an index, in-process.
+
+    Each captured request is dispatched, from ``clients`` threads, through
+    a map loaded from ``index_fp``, with every mount (and the not-found
+    application) recording its dispatch overhead.  Return a report dict
+    (see ``summarize``), with the count of requests whose ``mount``
+    differs from the captured one as ``mismatched``.
+    """
+    records = list(read_capture(capture_fp))
+    latencies = []
+    app = make_app(latencies)
+    urlmap = URLMap.load_index(index_fp, lambda dom_url: app, app)
+    environs = replay_environs(records)
+    # Captured hosts include the port, so the scheme doesn't matter here.
+    resolved = urlmap.resolve_many(
+        (hostport, path_info)
+        for hostport, scheme, path_info, mount, elapsed in records)
+    mismatched = sum(
+        1 for record, result in zip(records, resolved)
+        if (None if result is None else result[1]) != record[3])
+    timed_map = timed(urlmap)
+
+    def _work(batch):
+        for environ in batch:
+            timed_map(environ, _start_response)
+
+    elapsed = _run_clients(clients, environs, _work)
+    report = summarize(latencies, len(environs), elapsed)
+    report['mismatched'] = mismatched
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m rutter.bench',
+        description='Measure URLMap throughput and dispatch overhead '
+                    'under concurrent load.')
+    parser.add_argument('--mounts', type=int, default=100)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--mode', choices=sorted(_MODES), default='inprocess')
+    parser.add_argument('--zipf', type=float, default=1.1,
+                        help='Zipf exponent for the path distribution')
+    parser.add_argument('--miss-ratio', type=float, default=0.0,
+                        help='fraction of requests for unmounted paths')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--scaling', default=None, metavar='N,N,...',
+                        help='instead, measure in-process throughput of '
+                             'one shared map at each thread count')
+    parser.add_argument('--allocations', action='store_true',
+                        help='instead, measure the memory allocated by '
+                             'each dispatch')
+    parser.add_argument('--replay', default=None, metavar='CAPTURE',
+                        help='instead, replay the requests of a capture '
+                             'file against the mounts of --index')
+    parser.add_argument('--index', default=None, metavar='INDEX',
+                        help='routing index file, as written by '
+                             'URLMap.dump_index')
+    args = parser.parse_args(argv)
+    if args.replay:
+        if not args.index:
+            parser.error('--replay needs --index')
+        with open(args.replay) as capture_fp, open(args.index) as index_fp:
+            report = run_replay(capture_fp, index_fp, args.clients)
+        print(format_report(report))
+        print('%-12s %d' % ('mismatched', report['mismatched']))
+        return report
+    if args.allocations:
+        results = run_allocations(args.mounts)
+        print(format_allocations(results))
+        return results
+    if args.scaling:
+        threads = [int(count) for count in args.scaling.split(',')]
+        results = run_scaling(args.mounts, threads, args.requests,
+                              args.zipf, args.seed)
+        print(format_scaling(results))
+        return results
+    report = run_load(args.mounts, args.clients, args.requests, args.mode,
+                      args.zipf, args.miss_ratio, args.seed)
+    print(format_report(report))
+    return report
+
+
+if __name__ == '__main__':  # pragma: NO COVER
+    main()
@@ -0,0 +1,72 @@
+""" Sample ``URLMap`` dispatches to a capture file.  See ``Recorder``
+
+Captures are replayed by ``python -m rutter.bench --replay``.
+"""
+import json
+import random
+import threading
+import time
+
+
+class Recorder(object):
+    """ Record a sample of a ``URLMap``'s dispatches to the text file ``fp``.
+
+    Attach it to the map, e.g.::
+
+        urlmap.recorder = Recorder(open('capture.jsonl', 'w'), rate=0.01)
+
+    A ``rate`` fraction of requests (chosen at random) is recorded, up to
+    ``max_records``, if given;  unsampled requests cost one random draw.
+    Each record is a JSON line ``[hostport, scheme, path_info, mount, ns]``:
+    the lowercased ``host:port``, the URL scheme, the ``PATH_INFO`` as
+    received, the ``SCRIPT_NAME`` suffix of the matched mount (``null`` for
+    a miss), and the nanoseconds spent resolving the mount.
+    """
+    def __init__(self, fp, rate=0.01, max_records=None, seed=None):
+        self.fp = fp
+        self.rate = rate
+        self.max_records = max_records
+        self.recorded = 0
+        self._random = random.Random(seed).random
+        self._lock = threading.Lock()
+
+    def start(self):
+        """ Return the start time of a sampled dispatch, or ``None``.
+        """
+        if self.rate < 1 and self._random() >= self.rate:
+            return None
+        return time.perf_counter_ns()
+
+    def record(self, hostport, scheme, path_info, mount, started):
+        """ Record a dispatch started (per ``start``) at ``started``.
+        """
+        elapsed = time.perf_counter_ns() - started
+        line = json.dumps([hostport, scheme, path_info, mount, elapsed],
+                          separators=(',', ':')) + '\n'
+        with self._lock:
+            if (self.max_records is not None
+                    and self.recorded >= self.max_records):
+                return
+            self.fp.write(line)
+            self.recorded += 1
+
+    def close(self):
+        """ Flush and close the capture file.
+        """
+        with self._lock:
+            self.fp.close()
+
+
+def read_capture(fp):
+    """ Yield the records of a capture file written by a ``Recorder``.
+
+    Each record is a ``(hostport, scheme, path_info, mount, ns)`` tuple.
+    """
+    for number, line in enumerate(fp, 1):
+        if not line.strip():
+            continue
+        try:
+            hostport, scheme, path_info, mount, elapsed = json.loads(line)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid capture record at line %d' % number)
+        yield hostport, scheme, path_info, mount, elapsed
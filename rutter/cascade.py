@@ -0,0 +1,208 @@
+""" Try several applications in turn.  See ``Cascade``
+
+Forked from ``paste.cascade``, adding a learned per-path routing cache.
+"""
+from collections import OrderedDict
+import tempfile
+import threading
+
+
+def _discard(data):
+    pass
+
+
+def _close(iterable):
+    close = getattr(iterable, 'close', None)
+    if close is not None:
+        close()
+
+
+class Cascade(object):
+    """ Try ``apps`` in order until one doesn't answer with a ``catch`` status.
+
+    Like ``URLMap`` falling back to its ``not_found_application``, but with
+    any number of fallbacks;  the last application's response is returned
+    regardless of its status.
+
+    The cascade remembers, in a cache of up to ``cache_size`` entries,
+    which member answered each (host, ``SCRIPT_NAME``, ``PATH_INFO``), so
+    that repeat requests go straight to it, falling back to the others only
+    if it no longer answers.  Lookups take no lock;  instead of moving an
+    entry on each hit, eviction gives entries hit since they were last
+    considered a second chance (approximating LRU).  Changing the members,
+    via ``apps``, ``append`` or ``remove``, clears the cache.
+
+    Request bodies are buffered (in memory, or in a temporary file beyond
+    ``spool_size`` bytes), so that each member sees the whole body.
+    """
+    def __init__(self, apps=(), catch=(404,), cache_size=1024,
+                 spool_size=1024 * 1024):
+        self.catch = frozenset(int(status) for status in catch)
+        self.cache_size = cache_size
+        self.spool_size = spool_size
+        self._lock = threading.Lock()
+        # ``(apps, generation, cache)``, replaced as a whole when the
+        # members change, so that requests read it without the lock.  The
+        # cache maps each key to ``[index, hit since last considered]``.
+        self._state = ((), 0, OrderedDict())
+        self.apps = apps
+
+    @property
+    def apps(self):
+        return self._state[0]
+
+    @apps.setter
+    def apps(self, apps):
+        with self._lock:
+            self._state = (tuple(apps), self._state[1] + 1, OrderedDict())
+
+    def append(self, app):
+        self.apps = self.apps + (app,)
+
+    def remove(self, app):
+        apps = list(self.apps)
+        apps.remove(app)
+        self.apps = apps
+
+    def _remember(self, generation, key, index):
+        with self._lock:
+            apps, current, cache = self._state
+            if generation != current or self.cache_size < 1:
+                return
+            if key not in cache:
+                while len(cache) >= self.cache_size:
+                    old, entry = cache.popitem(last=False)
+                    if entry[1]:  # hit:  give it a second chance
+                        entry[1] = False
+                        cache[old] = entry
+            cache[key] = [index, False]
+            cache.move_to_end(key)
+
+    def _forget(self, generation, key):
+        with self._lock:
+            apps, current, cache = self._state
+            if generation == current:
+                cache.pop(key, None)
+
+    def _try(self, app, environ, start_response):
+        """ Call ``app``;  return its response, or ``None`` if caught.
+        """
+        caught = []
+
+        def _start_response(status, headers, exc_info=None):
+            if int(status.split(None, 1)[0]) in self.catch:
+                caught.append(status)
+                return _discard
+            return start_response(status, headers, exc_info)
+
+        iterable = app(environ, _start_response)
+        if caught:
+            _close(iterable)
+            return None
+        return iterable
+
+    def __call__(self, environ, start_response):
+        key = (environ.get('HTTP_HOST', environ.get('SERVER_NAME')),
+               environ.get('SCRIPT_NAME', ''),
+               environ.get('PATH_INFO', ''))
+        apps, generation, cache = self._state
+        entry = cache.get(key)
+        cached = None
+        if entry is not None:
+            cached, entry[1] = entry[0], True
+        if len(apps) == 1:
+            return apps[0](environ, start_response)
+
+        copy_environ, body = _environ_copier(environ, self.spool_size)
+        if body is not None:
+            return _Closing(self._cascade(apps, generation, key, cached,
+                                          copy_environ, start_response),
+                            body)
+        return self._cascade(apps, generation, key, cached, copy_environ,
+                             start_response)
+
+    def _cascade(self, apps, generation, key, cached, copy_environ,
+                 start_response):
+        order = list(range(len(apps)))
+        if cached is not None:
+            iterable = self._try(apps[cached], copy_environ(), start_response)
+            if iterable is not None:
+                return iterable
+            self._forget(generation, key)
+            order.remove(cached)
+        for index in order[:-1]:
+            iterable = self._try(apps[index], copy_environ(), start_response)
+            if iterable is not None:
+                if index:
+                    self._remember(generation, key, index)
+                return iterable
+        index = order[-1]
+
+        def _start_response(status, headers, exc_info=None):
+            if index and int(status.split(None, 1)[0]) not in self.catch:
+                self._remember(generation, key, index)
+            return start_response(status, headers, exc_info)
+
+        return apps[index](copy_environ(), _start_response)
+
+
+class _Closing(object):
+    """ Response iterable which also closes the buffered request body.
+    """
+    def __init__(self, iterable, body):
+        self._iterable = iterable
+        self._body = body
+
+    def __iter__(self):
+        return iter(self._iterable)
+
+    def close(self):
+        try:
+            _close(self._iterable)
+        finally:
+            self._body.close()
+
+
+def _environ_copier(environ, spool_size):
+    """ Return ``(copy, body)``:  a function making copies of ``environ``
+    for each attempt, and the buffered request body (or ``None``).
+
+    Each copy gets the rewound buffered body, if any.
+    """
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length <= 0:
+        return environ.copy, None
+    body = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    source = environ['wsgi.input']
+    remaining = length
+    while remaining > 0:
+        chunk = source.read(min(remaining, 65536))
+        if not chunk:
+            break
+        body.write(chunk)
+        remaining -= len(chunk)
+
+    def _copy():
+        body.seek(0)
+        copy = environ.copy()
+        copy['wsgi.input'] = body
+        return copy
+    return _copy, body
+
+
+def cascade_factory(loader, global_conf, catch='404', cache_size='1024',
+                    **local_conf):
+    """ ``paste.composite_factory`` for ``Cascade``.
+
+    Members are the apps named by options starting with ``app``, in
+    sorted order;  ``catch`` is a whitespace-separated list of statuses.
+    """
+    names = sorted(name for name in local_conf if name.startswith('app'))
+    apps = [loader.get_app(local_conf[name], global_conf=global_conf)
+            for name in names]
+    if not apps:
+        raise ValueError("A cascade needs at least one 'app...' option")
+    return Cascade(apps, catch=catch.split(), cache_size=int(cache_size))
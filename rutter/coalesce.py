@@ -0,0 +1,177 @@
+""" Coalesce identical concurrent requests to a mounted app.  See ``Coalesce``
+"""
+import threading
+
+_SAFE_METHODS = ('GET', 'HEAD')
+# Requests carrying credentials are coalesced only if these are in ``vary``.
+_PRIVATE_HEADERS = ('HTTP_AUTHORIZATION', 'HTTP_COOKIE')
+
+
+class _Flight(object):
+    """ An in-flight application call, shared by identical requests.
+
+    Once ``done`` is set, ``response`` is ``(status, headers, body)``, or
+    ``None`` if the response could not be shared.
+    """
+    response = None
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.followers = 0
+
+
+class Coalesce(object):
+    """ WSGI wrapper making identical concurrent requests share one call.
+
+    Mount it in place of the application, e.g.::
+
+        urlmap['/api'] = Coalesce(api_app, vary=['HTTP_ACCEPT'])
+
+    Requests are identical if they have the same method (one of
+    ``methods``), URL scheme, host, ``SCRIPT_NAME`` and ``PATH_INFO``, query
+    string and values of the environ keys listed in ``vary``.  While one such request
+    (the leader) is calling ``app``, the others wait for, and then replay,
+    its buffered response.
+
+    Followers fall back to calling ``app`` themselves if the response
+    body is larger than ``max_size`` bytes, sets cookies, varies (per its
+    ``Vary`` header) on request headers not listed in ``vary``, or fails,
+    or if the leader takes longer than ``timeout`` seconds.  Requests with
+    ``Authorization`` or ``Cookie`` headers are not coalesced unless those
+    headers are listed in ``vary``.
+    """
+    def __init__(self, app, vary=(), max_size=1024 * 1024,
+                 methods=_SAFE_METHODS, timeout=None):
+        self.app = app
+        self.vary = tuple(vary)
+        self.max_size = max_size
+        self.methods = frozenset(methods)
+        self.timeout = timeout
+        self._private = tuple(
+            name for name in _PRIVATE_HEADERS if name not in self.vary)
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def _key(self, environ):
+        for name in self._private:
+            if environ.get(name):
+                return None
+        return (environ['REQUEST_METHOD'],
+                environ.get('wsgi.url_scheme', 'http'),
+                environ.get('HTTP_HOST', environ.get('SERVER_NAME', '')
+                            ).lower(),
+                environ.get('SCRIPT_NAME', ''),
+                environ.get('PATH_INFO', ''),
+                environ.get('QUERY_STRING', ''),
+               ) + tuple(environ.get(name) for name in self.vary)
+
+    def _varied(self, headers):
+        """ Return whether ``vary`` lists each request header named by the
+        response's ``Vary`` headers.
+        """
+        for name, value in headers:
+            if name.lower() != 'vary':
+                continue
+            for field in value.split(','):
+                field = field.strip().upper().replace('-', '_')
+                if not field:
+                    continue
+                if field not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                    field = 'HTTP_' + field  # '*' is never listed
+                if field not in self.vary:
+                    return False
+        return True
+
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] not in self.methods:
+            return self.app(environ, start_response)
+        key = self._key(environ)
+        if key is None:
+            return self.app(environ, start_response)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.followers += 1
+        if leader:
+            return self._lead(key, flight, environ, start_response)
+        if flight.done.wait(self.timeout) and flight.response is not None:
+            status, headers, body = flight.response
+            start_response(status, list(headers))
+            return [body]
+        return self.app(environ, start_response)
+
+    def _lead(self, key, flight, environ, start_response):
+        """ Call the app, buffering its response for the followers.
+        """
+        started = []
+        written = []
+
+        def _capture(status, headers, exc_info=None):
+            started[:] = [status, headers, exc_info]
+            write = start_response(status, headers, exc_info)
+
+            def _write(data):
+                written.append(data)
+                return write(data)
+            return _write
+
+        shared = iterable = None
+        try:
+            iterable = self.app(environ, _capture)
+            chunks, size, shareable = [], 0, True
+            iterator = iter(iterable)
+            for chunk in iterator:
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > self.max_size:
+                    shareable = False
+                    break
+            status, headers, exc_info = started
+            if (shareable and exc_info is None
+                    and not any(name.lower() == 'set-cookie'
+                                for name, value in headers)
+                    and self._varied(headers)):
+                shared = (status, tuple(headers),
+                          b''.join(written) + b''.join(chunks))
+        except:
+            _close(iterable)
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.response = shared
+            flight.done.set()
+        if shareable:
+            _close(iterable)
+            return chunks
+        return _Remainder(chunks, iterator, iterable)
+
+
+def _close(iterable):
+    close = getattr(iterable, 'close', None)
+    if close is not None:
+        close()
+
+
+class _Remainder(object):
+    """ Response iterable for a leader whose response was too large to share.
+
+    Yields the already-buffered chunks, then the rest of the original
+    iterable, which it closes.
+    """
+    def __init__(self, chunks, iterator, iterable):
+        self._chunks = chunks
+        self._iterator = iterator
+        self._iterable = iterable
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield chunk
+        for chunk in self._iterator:
+            yield chunk
+
+    def close(self):
+        _close(self._iterable)
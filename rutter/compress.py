@@ -0,0 +1,262 @@
+""" Gzip-compress a mounted app's responses.  See ``Compress``
+"""
+from collections import OrderedDict
+import threading
+import zlib
+
+from ._util import _accepts_gzip
+from ._util import _compressible
+
+_NO_BODY_STATUSES = ('1', '204', '304')
+
+
+def _header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _gzip_etag(etag):
+    """ Return the ETag of the gzipped variant of an entity tagged ``etag``.
+
+    Weak ETags are unchanged;  return ``None`` for no ETag.
+    """
+    if etag is None or etag.startswith('W/'):
+        return etag
+    return etag[:-1] + '-gz"'
+
+
+def _request_uri(environ):
+    """ Return the request's host, path and query string, as one string.
+    """
+    uri = (environ.get('HTTP_HOST', environ.get('SERVER_NAME', ''))
+           + environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', ''))
+    query = environ.get('QUERY_STRING')
+    if query:
+        uri += '?' + query
+    return uri
+
+
+def _discard(data):
+    pass
+
+
+class _Stage(object):
+    """ Per-request state of a ``Compress`` stage.
+    """
+    started = False
+    compressor = None
+    cached = None
+    cache_key = None
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.chunks = []
+        self.size = 0
+
+    def keep(self, data):
+        """ Keep compressed ``data`` for the cache, unless it's too large.
+        """
+        if self.cache_key is None:
+            return
+        self.size += len(data)
+        if self.size > self.max_size:
+            self.cache_key = None
+            self.chunks = []
+        else:
+            self.chunks.append(data)
+
+
+class Compress(object):
+    """ WSGI wrapper gzip-compressing the responses of ``app``.
+
+    Mount it in place of the application, e.g.::
+
+        urlmap['/api'] = Compress(api_app)
+
+    Responses are compressed if the client accepts ``gzip``, and the
+    response has a compressible ``Content-Type`` (``text/*``, JSON, XML,
+    JavaScript or SVG), a body (of at least ``min_size`` bytes, if its
+    ``Content-Length`` is given), and neither a ``Content-Encoding`` nor a
+    ``Cache-Control: no-transform``.  The body is compressed incrementally,
+    as ``app`` produces it, at ``level``.
+
+    Compressed bodies of responses with a strong ``ETag`` (of up to
+    ``cache_body_size`` bytes) are kept in an LRU cache of up to
+    ``cache_entries`` bodies and ``cache_bytes`` bytes, keyed by the
+    request URI (host, path and query string) and the ``ETag``, so that
+    repeated responses are not compressed again.  The compressed variant
+    gets its own ``ETag``:  the original, suffixed by ``-gz``.  Conditional
+    requests for it are passed to ``app`` as for the original.
+    """
+    def __init__(self, app, level=6, min_size=256, cache_entries=256,
+                 cache_bytes=16 * 1024 * 1024, cache_body_size=1024 * 1024):
+        self.app = app
+        self.level = level
+        self.min_size = min_size
+        self.cache_entries = cache_entries
+        self.cache_bytes = cache_bytes
+        self.cache_body_size = cache_body_size
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+    def _compressible(self, status, headers):
+        if status.startswith(_NO_BODY_STATUSES):
+            return False
+        content_type = _header(headers, 'Content-Type')
+        if content_type is None or not _compressible(
+                content_type.split(';', 1)[0].strip().lower()):
+            return False
+        if _header(headers, 'Content-Encoding') is not None:
+            return False
+        if 'no-transform' in (_header(headers, 'Cache-Control') or ''):
+            return False
+        length = _header(headers, 'Content-Length')
+        return length is None or not length.isdigit() or (
+            int(length) >= self.min_size)
+
+    def _cache_get(self, key):
+        with self._lock:
+            body = self._cache.get(key)
+            if body is not None:
+                self._cache.move_to_end(key)
+            return body
+
+    def _cache_put(self, key, body):
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old is not None:
+                self._cached_bytes -= len(old)
+            self._cache[key] = body
+            self._cached_bytes += len(body)
+            while self._cache and (
+                    len(self._cache) > self.cache_entries
+                    or self._cached_bytes > self.cache_bytes):
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_bytes -= len(evicted)
+
+    def __call__(self, environ, start_response):
+        gzip = environ['REQUEST_METHOD'] != 'HEAD' and _accepts_gzip(environ)
+        if gzip:
+            if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+            if if_none_match and '-gz"' in if_none_match:
+                environ['HTTP_IF_NONE_MATCH'] = if_none_match.replace(
+                    '-gz"', '"')
+        uri = _request_uri(environ)
+        stage = _Stage(self.cache_body_size)
+
+        def _start_response(status, headers, exc_info=None):
+            stage.started = True
+            if not gzip:
+                if self._compressible(status, headers):
+                    headers = _add_vary(headers)
+                return start_response(status, headers, exc_info)
+            etag = _header(headers, 'ETag')
+            if status.startswith('304'):
+                if etag is not None:
+                    headers = _replace(headers, 'ETag', _gzip_etag(etag))
+                return start_response(status, headers, exc_info)
+            if not self._compressible(status, headers):
+                return start_response(status, headers, exc_info)
+            headers = _add_vary(_replace(headers, 'Content-Length', None))
+            headers.append(('Content-Encoding', 'gzip'))
+            if etag is not None:
+                headers = _replace(headers, 'ETag', _gzip_etag(etag))
+                if not etag.startswith('W/'):
+                    stage.cache_key = (uri, etag)
+                    stage.cached = self._cache_get(stage.cache_key)
+            if stage.cached is not None:
+                headers.append(('Content-Length', str(len(stage.cached))))
+                start_response(status, headers, exc_info)
+                return _discard
+            compressor = stage.compressor = zlib.compressobj(
+                self.level, zlib.DEFLATED, 31)  # gzip container
+            write = start_response(status, headers, exc_info)
+
+            def _write(data):
+                data = compressor.compress(data)
+                if data:
+                    stage.keep(data)
+                    write(data)
+            return _write
+
+        iterable = self.app(environ, _start_response)
+        if stage.started and stage.compressor is None and (
+                stage.cached is None):
+            return iterable
+        return _Compressing(self, stage, iterable)
+
+
+def _replace(headers, name, value):
+    """ Return ``headers``, without ``name``, and with ``value``, if given.
+    """
+    lowered = name.lower()
+    headers = [(key, old) for key, old in headers if key.lower() != lowered]
+    if value is not None:
+        headers.append((name, value))
+    return headers
+
+
+def _add_vary(headers):
+    vary = _header(headers, 'Vary')
+    if vary is None:
+        return list(headers) + [('Vary', 'Accept-Encoding')]
+    if 'accept-encoding' in vary.lower() or vary.strip() == '*':
+        return list(headers)
+    return _replace(headers, 'Vary', vary + ', Accept-Encoding')
+
+
+class _Compressing(object):
+    """ Response iterable compressing (or replaying) ``iterable``'s body.
+    """
+    def __init__(self, compress, stage, iterable):
+        self._compress = compress
+        self._stage = stage
+        self._iterable = iterable
+
+    def __iter__(self):
+        stage = self._stage
+        if stage.cached is not None:
+            yield stage.cached
+            return
+        for chunk in self._iterable:
+            # The app may start its response lazily, on first iteration.
+            if stage.cached is not None:
+                yield stage.cached
+                return
+            if stage.compressor is None:
+                yield chunk
+                continue
+            data = stage.compressor.compress(chunk)
+            if data:
+                stage.keep(data)
+                yield data
+        if stage.compressor is not None:
+            data = stage.compressor.flush()
+            stage.keep(data)
+            if stage.cache_key is not None:
+                self._compress._cache_put(
+                    stage.cache_key, b''.join(stage.chunks))
+            yield data
+
+    def close(self):
+        close = getattr(self._iterable, 'close', None)
+        if close is not None:
+            close()
+
+
+def compress_factory(app, level='6', min_size='256', cache_entries='256',
+                     cache_bytes=str(16 * 1024 * 1024),
+                     cache_body_size=str(1024 * 1024)):
+    """ Wrap ``app`` in ``Compress``, from string-valued options.
+
+    Used by ``urlmap_factory`` for mounts with a ``compress`` option.
+    """
+    return Compress(app, level=int(level), min_size=int(min_size),
+                    cache_entries=int(cache_entries),
+                    cache_bytes=int(cache_bytes),
+                    cache_body_size=int(cache_body_size))
+
@@ -0,0 +1,197 @@
+""" Load mounted apps on demand, and evict idle ones.  See ``LazyMount``
+"""
+from collections import OrderedDict
+import os
+import threading
+import time
+
+
+class MountPool(object):
+    """ Eviction policy shared by a set of ``LazyMount`` instances.
+
+    Loaded mounts are kept in least-recently-used order.  Using a mount
+    evicts the least recently used ones beyond ``max_loaded``, and those
+    idle for more than ``idle_ttl`` seconds (either limit may be ``None``).
+    Call ``sweep`` to evict idle mounts without waiting for a request;  or,
+    given ``sweep_interval``, a daemon thread calls it that often, from
+    the first use of a mount in each process (so, also in the workers of a
+    preforking server) until ``close`` is called.
+    """
+    def __init__(self, max_loaded=None, idle_ttl=None, clock=time.monotonic,
+                 sweep_interval=None):
+        self.max_loaded = max_loaded
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self._clock = clock
+        self._loaded = OrderedDict()  # mount -> last used
+        self._lock = threading.Lock()
+        self._sweeper_pid = None
+        self._closed = threading.Event()
+
+    def __len__(self):
+        return len(self._loaded)
+
+    def _victims(self, now):
+        """ Remove and return the mounts to evict.  Call with the lock held.
+        """
+        loaded = self._loaded
+        victims = []
+        if self.max_loaded is not None:
+            while len(loaded) > self.max_loaded:
+                victims.append(loaded.popitem(last=False)[0])
+        if self.idle_ttl is not None:
+            for mount, last_used in loaded.items():
+                if now - last_used <= self.idle_ttl:
+                    break
+                victims.append(mount)
+            for mount in victims:
+                loaded.pop(mount, None)
+        return victims
+
+    def touch(self, mount):
+        """ Record a use of the loaded ``mount``;  evict others as needed.
+        """
+        now = self._clock()
+        with self._lock:
+            self._loaded[mount] = now
+            self._loaded.move_to_end(mount)
+            victims = self._victims(now)
+            if (self.sweep_interval is not None
+                    and self._sweeper_pid != os.getpid()):
+                self._start_sweeper()
+        for victim in victims:
+            victim.evict()
+
+    def _start_sweeper(self):
+        """ Start sweeping in this process.  Call with the lock held.
+        """
+        self._sweeper_pid = os.getpid()
+        threading.Thread(target=self._sweep_until_closed,
+                         name='rutter-mount-pool-sweeper',
+                         daemon=True).start()
+
+    def _sweep_until_closed(self):
+        while not self._closed.wait(self.sweep_interval):
+            self.sweep()
+
+    def close(self):
+        """ Stop the sweeper thread, if any.
+        """
+        self._closed.set()
+
+    def sweep(self):
+        """ Evict the mounts idle for more than ``idle_ttl``.
+        """
+        with self._lock:
+            victims = self._victims(self._clock())
+        for victim in victims:
+            victim.evict()
+
+    def discard(self, mount):
+        """ Forget the unloaded ``mount``.
+        """
+        with self._lock:
+            self._loaded.pop(mount, None)
+
+
+class LazyMount(object):
+    """ WSGI application built by calling ``factory`` on first use.
+
+    Mount it in place of the application, e.g.::
+
+        pool = MountPool(max_loaded=100, idle_ttl=600)
+        for tenant in tenants:
+            urlmap['/t/' + tenant] = LazyMount(
+                functools.partial(make_tenant_app, tenant), pool)
+
+    If given, ``pool`` may evict the application when idle (see
+    ``MountPool``);  the next request calls ``factory`` again.  An
+    application evicted while serving requests is kept until their
+    responses are closed, then dropped (and closed, if it has a ``close``
+    method).  For its memory to be freed, ``factory`` must build a new
+    application each time, rather than returning a shared one.
+    """
+    def __init__(self, factory, pool=None):
+        self.factory = factory
+        self.pool = pool
+        self._app = None
+        self._active = 0
+        self._evicting = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._app is not None
+
+    def _acquire(self):
+        with self._lock:
+            app = self._app
+            if app is None:
+                app = self._app = self.factory()
+            self._active += 1
+            self._evicting = False
+        return app
+
+    def _release(self):
+        with self._lock:
+            self._active -= 1
+            if self._active or not self._evicting:
+                return
+            app = self._unload()
+        _close(app)
+
+    def _unload(self):
+        """ Drop the application.  Call with the lock held.
+        """
+        app, self._app = self._app, None
+        self._evicting = False
+        if self.pool is not None:
+            self.pool.discard(self)
+        return app
+
+    def evict(self):
+        """ Drop the application, once no request is using it.
+        """
+        with self._lock:
+            if self._active:
+                self._evicting = True
+                return
+            app = self._unload()
+        _close(app)
+
+    def __call__(self, environ, start_response):
+        app = self._acquire()
+        try:
+            if self.pool is not None:
+                self.pool.touch(self)
+            iterable = app(environ, start_response)
+        except BaseException:
+            self._release()
+            raise
+        return _Releasing(iterable, self)
+
+
+def _close(app):
+    close = getattr(app, 'close', None)
+    if close is not None:
+        close()
+
+
+class _Releasing(object):
+    """ Response iterable releasing its ``LazyMount`` when closed.
+    """
+    def __init__(self, iterable, mount):
+        self._iterable = iterable
+        self._mount = mount
+
+    def __iter__(self):
+        return iter(self._iterable)
+
+    def close(self):
+        mount, self._mount = self._mount, None
+        if mount is None:
+            return
+        try:
+            _close(self._iterable)
+        finally:
+            mount._release()
@@ -0,0 +1,160 @@
+""" Load ``URLMap`` mounts from a JSONL or CSV manifest.  See ``load_manifest``
+
+Each manifest entry carries a path, an optional domain and port, and an
+application spec (optionally followed by mount options, as for
+``urlmap_factory``)::
+
+    {"path": "/tenant-1", "domain": "example.com", "app": "egg:tenants#main"}
+
+or, as CSV (the header row is required)::
+
+    path,domain,port,app
+    /tenant-1,example.com,,egg:tenants#main
+"""
+import csv
+import importlib
+import json
+
+from .urlmap import _normalize_url
+from .urlmap import _parse_path_expression
+
+_FIELDS = ('path', 'domain', 'port', 'app')
+
+
+def resolve_app_spec(spec):
+    """ Return the WSGI application named by ``spec``.
+
+    ``spec`` is either ``'egg:<distribution>#<name>'``, naming a
+    ``paste.app_factory`` entry point (called with an empty global config),
+    or ``'<module>:<attribute>'``, naming the application object itself.
+    """
+    if spec.startswith('egg:'):
+        dist_name, _, name = spec[4:].partition('#')
+        name = name or 'main'
+        try:
+            from importlib.metadata import distribution
+        except ImportError:  # pragma: NO COVER Python < 3.8
+            from importlib_metadata import distribution
+        for ep in distribution(dist_name).entry_points:
+            if ep.group == 'paste.app_factory' and ep.name == name:
+                return ep.load()({})
+        raise LookupError("No 'paste.app_factory' entry point %r in %r"
+                          % (name, dist_name))
+    module_name, _, attr = spec.partition(':')
+    if not module_name or not attr:
+        raise ValueError(
+            "App spec must be 'egg:dist#name' or 'module:attr' (got %r)"
+            % spec)
+    obj = importlib.import_module(module_name)
+    for name in attr.split('.'):
+        obj = getattr(obj, name)
+    return obj
+
+
+def _iter_jsonl(fp):
+    for lineno, line in enumerate(fp, 1):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield lineno, line
+
+
+def _iter_csv(fp):
+    reader = csv.DictReader(fp)
+    if reader.fieldnames is None or 'app' not in reader.fieldnames:
+        raise ValueError("CSV manifest needs a header row with an 'app' "
+                         "column (fields: %s)" % ', '.join(_FIELDS))
+    for record in reader:
+        yield reader.line_num, record
+
+
+def _parse_entry(record):
+    if not isinstance(record, dict):
+        try:
+            record = json.loads(record)
+        except ValueError as e:
+            raise ValueError('invalid JSON: %s' % e)
+        if not isinstance(record, dict):
+            raise ValueError('entry must be a JSON object')
+    if None in record:  # csv.DictReader's key for extra columns
+        raise ValueError('too many columns')
+    unknown = set(record) - set(_FIELDS)
+    if unknown:
+        raise ValueError('unknown fields: %s' % ', '.join(sorted(unknown)))
+    for field in _FIELDS:
+        value = record.get(field)
+        if value is None:
+            continue
+        if field == 'port' and isinstance(value, int) and not isinstance(
+                value, bool):
+            continue
+        if not isinstance(value, str):
+            raise ValueError("%r must be a string%s (got %r)" % (
+                field, ' or an integer' if field == 'port' else '', value))
+        if field != 'app' and len(value.split()) > 1:
+            raise ValueError("%r must not contain whitespace (got %r)"
+                             % (field, value))
+    spec = record.get('app')
+    if not spec or not spec.strip():
+        raise ValueError("missing 'app'")
+    expression = []
+    for field in ('domain', 'port'):
+        value = record.get(field)
+        if value:
+            expression.extend((field, str(value)))
+    path = record.get('path')
+    if path:
+        expression.append(path)
+    url = _parse_path_expression(' '.join(expression))
+    return _normalize_url(url), spec
+
+
+def iter_manifest(fp, format='jsonl', name='<manifest>'):
+    """ Yield ``((domain, path), spec)`` for each entry in ``fp``.
+
+    ``format`` is ``'jsonl'`` or ``'csv'``.  Entries are read and validated
+    one at a time;  the first invalid one raises ``ValueError``, naming
+    ``name`` and its line number.
+    """
+    if format == 'jsonl':
+        records = _iter_jsonl(fp)
+    elif format == 'csv':
+        records = _iter_csv(fp)
+    else:
+        raise ValueError("Unknown manifest format %r" % format)
+    for lineno, record in records:
+        try:
+            entry = _parse_entry(record)
+        except ValueError as e:
+            raise ValueError('%s:%d: %s' % (name, lineno, e))
+        yield entry
+
+
+def load_manifest(urlmap, source, get_app=resolve_app_spec, format=None):
+    """ Mount the applications listed in a manifest onto ``urlmap``.
+
+    ``source`` is a filename or an open text file.  ``format`` defaults to
+    ``'csv'`` for filenames ending in ``.csv``, and to ``'jsonl'``
+    otherwise.  ``get_app`` turns each entry's app spec into an
+    application.  The manifest is streamed into a single ``urlmap.update``.
+    """
+    urlmap.update(
+        (dom_url, get_app(spec))
+        for dom_url, spec in _iter_source(source, format))
+
+
+def _iter_source(source, format=None):
+    """ Yield the entries of a manifest file or filename;  see
+    ``load_manifest``.
+    """
+    if hasattr(source, 'read'):
+        name = getattr(source, 'name', '<manifest>')
+        if format is None:
+            format = 'jsonl'
+        for entry in iter_manifest(source, format, name):
+            yield entry
+        return
+    if format is None:
+        format = 'csv' if source.lower().endswith('.csv') else 'jsonl'
+    with open(source, newline='') as fp:
+        for entry in iter_manifest(fp, format, source):
+            yield entry
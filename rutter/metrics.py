@@ -0,0 +1,388 @@
+""" Per-mount metrics shared by the worker processes of a server.
+
+See ``instrument`` and ``SharedMetrics``.
+"""
+from bisect import bisect_left
+import contextlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import weakref
+
+try:
+    import fcntl
+except ImportError:  # pragma: NO COVER Windows
+    fcntl = None
+
+_MAGIC = b'RUTTERM1'
+_HEADER = struct.Struct('<8sI')
+# Upper bounds (in seconds) of the latency histogram buckets.
+DEFAULT_BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                  1.0, 2.5, 5.0, 10.0)
+NOT_FOUND = '<not found>'
+# Per-mount fields, before the histogram buckets.
+_REQUESTS, _ERRORS, _LATENCY = range(3)
+
+
+def _align(size):
+    return (size + 7) & ~7
+
+
+class SharedMetrics(object):
+    """ Request counts, error counts and latency histograms per mount, in a
+    memory-mapped file shared by worker processes.
+
+    Each worker process claims a row of the file (at most ``workers`` at
+    once;  on POSIX, a row left by a dead process is reclaimed, keeping its
+    counts), in which it alone updates a fixed slot per mount, without
+    locks.
+    Each counter is an aligned 64-bit word, so readers never see one half
+    updated;  but updates racing between threads of one worker may rarely
+    be lost.  ``snapshot`` sums the rows of all workers.
+
+    Create the file with ``create`` in the server's master process, before
+    forking, and the workers inherit the mapping;  or, in each worker, with
+    ``open_or_create``, which reuses a compatible existing file.  Other
+    processes, e.g. for reporting, can ``open`` it.
+    """
+    def __init__(self, path):
+        self.path = path
+        # Read the layout from the very file mapped, even if ``path`` is
+        # replaced meanwhile.
+        self._fd = os.open(path, os.O_RDWR)
+        try:
+            with os.fdopen(os.dup(self._fd), 'rb') as f:
+                header = f.read(_HEADER.size)
+                magic, length = (_HEADER.unpack(header)
+                                 if len(header) == _HEADER.size
+                                 else (None, 0))
+                if magic != _MAGIC:
+                    raise ValueError(
+                        'Not a rutter metrics file: %r' % (path,))
+                layout = json.loads(f.read(length).decode('utf-8'))
+                stat = os.fstat(f.fileno())
+            self.labels = layout['labels']
+            self.workers = layout['workers']
+            self.bounds_ns = layout['bounds_ns']
+            self._stride = 3 + len(self.bounds_ns) + 1
+            self._row_size = self._stride * len(self.labels)
+            self._owners = _align(_HEADER.size + length) // 8
+            self._data = self._owners + self.workers
+            if stat.st_size != 8 * (
+                    self._data + self.workers * self._row_size):
+                raise ValueError(
+                    'Truncated rutter metrics file: %r' % (path,))
+        except BaseException:
+            os.close(self._fd)
+            raise
+        self._inode = (stat.st_dev, stat.st_ino)
+        self._mmap = mmap.mmap(self._fd, 0)
+        self._words = memoryview(self._mmap).cast('Q')
+        self._row = None
+        self._lock = threading.Lock()
+        _instances.add(self)
+
+    @classmethod
+    def create(cls, path, labels, workers=64, bounds=DEFAULT_BOUNDS):
+        """ Create (or replace) the file at ``path``, and return it opened.
+
+        ``labels`` names the mounts, one per slot.  The file is written
+        aside, then renamed into place, so that processes which have the
+        old file mapped keep it, intact.
+        """
+        layout = json.dumps({
+            'labels': list(labels),
+            'workers': workers,
+            'bounds_ns': [int(bound * 1e9) for bound in bounds],
+        }).encode('utf-8')
+        header = _HEADER.pack(_MAGIC, len(layout)) + layout
+        words = workers * (1 + len(labels) * (3 + len(bounds) + 1))
+        fd, temp = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)),
+            prefix=os.path.basename(path) + '.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header + b'\0' * (_align(len(header)) - len(header)))
+                f.write(b'\0' * (8 * words))
+            os.replace(temp, path)
+        except BaseException:
+            os.remove(temp)
+            raise
+        return cls(path)
+
+    @classmethod
+    def open(cls, path):
+        return cls(path)
+
+    @classmethod
+    def open_or_create(cls, path, labels, workers=64, bounds=DEFAULT_BOUNDS):
+        """ Open the file at ``path``, if its layout matches the arguments;
+        otherwise (or if it is missing), ``create`` it.
+
+        So, each worker of a server which loads the application in every
+        worker, rather than once before forking, shares the same file
+        (and counts) as the others.
+        """
+        with _locked(path + '.lock'):
+            try:
+                metrics = cls(path)
+            except (OSError, ValueError):
+                return cls.create(path, labels, workers, bounds)
+            if (metrics.labels == list(labels)
+                    and metrics.workers == workers
+                    and metrics.bounds_ns == [int(bound * 1e9)
+                                              for bound in bounds]):
+                return metrics
+            metrics.close()
+            return cls.create(path, labels, workers, bounds)
+
+    def _forked(self):
+        self._lock = threading.Lock()
+        self._row = None
+
+    def _claim(self):
+        """ Claim a worker row for this process;  return its first word.
+        """
+        pid = os.getpid()
+        owners = self._words
+        if fcntl is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            candidates = [index for index in range(self.workers)
+                          if owners[self._owners + index] in (0, pid)]
+            if not candidates and fcntl is not None:
+                # Reclaim the rows of dead processes (on POSIX only:  on
+                # Windows, ``os.kill(pid, 0)`` sends a CTRL_C_EVENT).
+                candidates = [index for index in range(self.workers)
+                              if not _alive(owners[self._owners + index])]
+            # With every row taken, share one:  counts may then be lost.
+            index = candidates[0] if candidates else pid % self.workers
+            owners[self._owners + index] = pid
+        finally:
+            if fcntl is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        return self._data + index * self._row_size
+
+    def record(self, slot, elapsed_ns, error=False):
+        """ Record a request to the mount in ``slot``.
+        """
+        row = self._row
+        if row is None:
+            with self._lock:
+                row = self._row
+                if row is None:
+                    row = self._row = self._claim()
+        words = self._words
+        base = row + slot * self._stride
+        words[base + _REQUESTS] += 1
+        if error:
+            words[base + _ERRORS] += 1
+        words[base + _LATENCY] += elapsed_ns
+        words[base + 3 + bisect_left(self.bounds_ns, elapsed_ns)] += 1
+
+    def snapshot(self):
+        """ Return the metrics summed across workers, by mount label.
+
+        Each mount has ``requests``, ``errors``, ``latency_seconds`` (the
+        total) and ``buckets``:  ``[upper bound in seconds, count]`` pairs
+        with cumulative counts, the last bound being ``None`` (infinity).
+        """
+        words = self._words
+        stride = self._stride
+        totals = [[0] * stride for label in self.labels]
+        for worker in range(self.workers):
+            if not words[self._owners + worker]:
+                continue  # never claimed
+            row = self._data + worker * self._row_size
+            for slot, total in enumerate(totals):
+                base = row + slot * stride
+                for i in range(stride):
+                    total[i] += words[base + i]
+        bounds = [bound / 1e9 for bound in self.bounds_ns] + [None]
+        result = {}
+        for label, total in zip(self.labels, totals):
+            buckets, cumulative = [], 0
+            for bound, count in zip(bounds, total[3:]):
+                cumulative += count
+                buckets.append([bound, cumulative])
+            result[label] = {
+                'requests': total[_REQUESTS],
+                'errors': total[_ERRORS],
+                'latency_seconds': total[_LATENCY] / 1e9,
+                'buckets': buckets,
+            }
+        return result
+
+    def close(self):
+        _instances.discard(self)
+        self._words.release()
+        self._mmap.close()
+        os.close(self._fd)
+
+
+# Open ``SharedMetrics``, to reset after a fork;  one hook serves them all.
+_instances = weakref.WeakSet()
+
+
+def _after_fork():
+    for metrics in list(_instances):
+        metrics._forked()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+@contextlib.contextmanager
+def _locked(path):
+    """ Hold an exclusive lock on the file at ``path``, where supported.
+    """
+    if fcntl is None:  # pragma: NO COVER Windows
+        yield
+        return
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # releases the lock
+
+
+def _alive(pid):
+    """ Return whether process ``pid`` is running (on POSIX only).
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # another user's process
+        pass
+    return True
+
+
+class _Instrumented(object):
+    """ WSGI wrapper recording the requests to one mount.
+    """
+    def __init__(self, app, metrics, slot):
+        self.app = app
+        self.metrics = metrics
+        self.slot = slot
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter_ns()
+        statuses = []
+
+        def _start_response(status, headers, exc_info=None):
+            statuses.append(status)
+            return start_response(status, headers, exc_info)
+
+        try:
+            iterable = self.app(environ, _start_response)
+        except BaseException:
+            self.metrics.record(
+                self.slot, time.perf_counter_ns() - started, True)
+            raise
+        return _Recording(iterable, self, started, statuses)
+
+
+class _Recording(object):
+    """ Response iterable recording its request when closed.
+    """
+    def __init__(self, iterable, instrumented, started, statuses):
+        self._iterable = iterable
+        self._instrumented = instrumented
+        self._started = started
+        self._statuses = statuses
+
+    def __iter__(self):
+        return iter(self._iterable)
+
+    def close(self):
+        instrumented, self._instrumented = self._instrumented, None
+        if instrumented is None:
+            return
+        try:
+            close = getattr(self._iterable, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            error = (not self._statuses
+                     or self._statuses[-1].startswith('5'))
+            instrumented.metrics.record(
+                instrumented.slot,
+                time.perf_counter_ns() - self._started, error)
+
+
+def mount_label(dom_url):
+    """ Return the metrics label for the mount key ``dom_url``.
+    """
+    domain, app_url = dom_url
+    if domain:
+        return 'http://%s%s' % (domain, app_url or '/')
+    return app_url or '/'
+
+
+def instrument(urlmap, path, workers=64, bounds=DEFAULT_BOUNDS):
+    """ Record metrics for each mount of ``urlmap`` in a file at ``path``.
+
+    Opens the file, or creates it if it is missing or has another layout
+    (see ``SharedMetrics.open_or_create``), with a slot for each
+    mount, labelled by ``mount_label``, and one for requests falling
+    through to the not-found application, labelled ``<not found>``;  then
+    wraps each application to record, when its response is closed, the
+    request's latency and whether it failed (by raising an exception, or
+    with a ``5xx`` status).  Return the ``SharedMetrics``.
+
+    Mounts added later are not instrumented;  mounted ``URLMap`` instances
+    are called, rather than resolved by ``urlmap`` itself.
+    """
+    mounts = list(urlmap.applications)
+    labels = [mount_label(dom_url) for dom_url, app in mounts] + [NOT_FOUND]
+    metrics = SharedMetrics.open_or_create(path, labels, workers, bounds)
+    urlmap.update((dom_url, _Instrumented(app, metrics, slot))
+                  for slot, (dom_url, app) in enumerate(mounts))
+    urlmap.not_found_application = _Instrumented(
+        urlmap.not_found_application, metrics, len(mounts))
+    return metrics
+
+
+class MetricsApp(object):
+    """ WSGI application serving a snapshot of the metrics file at ``path``,
+    as JSON.
+
+    The file is opened on the first request, so that it need not exist
+    yet when the application is created, and reopened once it has been
+    replaced (e.g. by ``create``, with another layout).
+    """
+    def __init__(self, path):
+        self.path = path
+        self._metrics = None
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            stat = os.stat(self.path)
+            metrics = self._metrics
+            if (metrics is None
+                    or metrics._inode != (stat.st_dev, stat.st_ino)):
+                if metrics is not None:
+                    metrics.close()
+                metrics = self._metrics = SharedMetrics.open(self.path)
+            snapshot = metrics.snapshot()
+        body = json.dumps(snapshot, sort_keys=True).encode('utf-8')
+        start_response('200 OK', [('Content-Type', 'application/json'),
+                                  ('Content-Length', str(len(body))),
+                                  ('Cache-Control', 'no-store')])
+        return [body]
+
+
+def metrics_factory(global_conf, path):
+    """ ``paste.app_factory`` for ``MetricsApp``.
+    """
+    if not os.path.isabs(path) and 'here' in global_conf:
+        path = os.path.join(global_conf['here'], path)
+    return MetricsApp(path)
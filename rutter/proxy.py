@@ -0,0 +1,289 @@
+""" Proxy a mount to an upstream HTTP server.  See ``ProxyMount``
+"""
+import http.client
+import socket
+import threading
+from urllib.parse import quote
+from urllib.parse import urlsplit
+
+from ._util import _asbool
+from ._util import _error
+
+# Hop-by-hop headers (RFC 7230, section 6.1), not forwarded either way.
+_HOP_BY_HOP = frozenset([
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'proxy-connection', 'te', 'trailer', 'transfer-encoding', 'upgrade',
+])
+# Characters left unquoted in the upstream path.
+_PATH_SAFE = "/:@!$&'()*+,;=~"
+# Methods whose requests may be sent twice (RFC 7231, section 4.2.2).
+_IDEMPOTENT_METHODS = frozenset([
+    'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'TRACE',
+])
+# Errors raised when a pooled connection was closed by the upstream.
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                 ConnectionResetError, BrokenPipeError)
+
+
+def _connection_tokens(value):
+    return [token.strip().lower() for token in (value or '').split(',')]
+
+
+class _ConnectionPool(object):
+    """ Idle persistent connections to one upstream, at most ``size``.
+    """
+    def __init__(self, connection_class, host, port, size, connect_timeout):
+        self.connection_class = connection_class
+        self.host = host
+        self.port = port
+        self.size = size
+        self.connect_timeout = connect_timeout
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        """ Return ``(connection, reused)``.
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self.connect(), False
+
+    def connect(self):
+        """ Return a new (not yet connected) connection.
+        """
+        return self.connection_class(
+            self.host, self.port, timeout=self.connect_timeout)
+
+    def put(self, conn):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class ProxyMount(object):
+    """ WSGI application proxying requests to the ``upstream`` URL.
+
+    Mount it on a ``URLMap``, e.g.::
+
+        urlmap['/svc'] = ProxyMount('http://127.0.0.1:9000')
+
+    The (post-dispatch) ``PATH_INFO`` is appended to the upstream URL's
+    path;  the ``SCRIPT_NAME`` is passed upstream as ``X-Forwarded-Prefix``,
+    along with ``X-Forwarded-For``, ``X-Forwarded-Proto`` and
+    ``X-Forwarded-Host``.  The ``Host`` header names the upstream, unless
+    ``preserve_host`` is true.
+
+    Connections to the upstream use HTTP/1.1, and up to ``pool_size`` idle
+    ones are kept open for reuse;  a request without a body, using an
+    idempotent method, is retried once on a new connection if the pooled
+    one it was sent on turns out to have been closed by the upstream.
+    Connecting must complete within ``connect_timeout`` seconds, and each
+    read from the upstream within ``read_timeout`` seconds;  otherwise, the
+    response is ``504 Gateway Timeout`` (or, for other connection errors,
+    ``502 Bad Gateway``).
+    Request and response bodies are streamed in blocks of up to
+    ``block_size`` bytes, without buffering.
+    """
+    def __init__(self, upstream, pool_size=10, connect_timeout=5.0,
+                 read_timeout=30.0, block_size=64 * 1024,
+                 preserve_host=False):
+        parts = urlsplit(upstream)
+        if parts.scheme == 'http':
+            connection_class = http.client.HTTPConnection
+        elif parts.scheme == 'https':
+            connection_class = http.client.HTTPSConnection
+        else:
+            raise ValueError('Upstream must be an http:// or https:// URL '
+                             '(got %r)' % upstream)
+        self.upstream = upstream
+        self.host = parts.netloc
+        self.path = parts.path.rstrip('/')
+        self.read_timeout = read_timeout
+        self.block_size = block_size
+        self.preserve_host = preserve_host
+        self._pool = _ConnectionPool(
+            connection_class, parts.hostname, parts.port, pool_size,
+            connect_timeout)
+
+    def _url(self, environ):
+        path = environ.get('PATH_INFO', '').encode('latin-1')
+        url = self.path + quote(path, safe=_PATH_SAFE)
+        if not url.startswith('/'):
+            url = '/' + url
+        query = environ.get('QUERY_STRING')
+        if query:
+            url += '?' + query
+        return url
+
+    def _headers(self, environ):
+        """ Return the request headers to send upstream.
+        """
+        connection = _connection_tokens(environ.get('HTTP_CONNECTION'))
+        headers = []
+        for key, value in environ.items():
+            if key.startswith('HTTP_'):
+                name = key[5:].replace('_', '-').title()
+            elif key in ('CONTENT_TYPE', 'CONTENT_LENGTH') and value:
+                name = key.replace('_', '-').title()
+            else:
+                continue
+            lowered = name.lower()
+            if (lowered in _HOP_BY_HOP or lowered in connection
+                    or lowered == 'host' or lowered.startswith('x-forwarded-')):
+                continue
+            headers.append((name, value))
+        host = environ.get('HTTP_HOST') or environ.get('SERVER_NAME', '')
+        headers.append(('Host', host if self.preserve_host else self.host))
+        forwarded_for = environ.get('HTTP_X_FORWARDED_FOR')
+        remote_addr = environ.get('REMOTE_ADDR')
+        if remote_addr:
+            forwarded_for = (forwarded_for + ', ' + remote_addr
+                             if forwarded_for else remote_addr)
+        if forwarded_for:
+            headers.append(('X-Forwarded-For', forwarded_for))
+        headers.append(('X-Forwarded-Proto', environ['wsgi.url_scheme']))
+        headers.append(('X-Forwarded-Host', host))
+        if environ.get('SCRIPT_NAME'):
+            headers.append(('X-Forwarded-Prefix', environ['SCRIPT_NAME']))
+        return headers
+
+    def _body_length(self, environ):
+        """ Return the request body's length, ``None`` if it is chunked, or
+        ``0`` if there is none.
+        """
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length > 0:
+            return length
+        if (environ.get('wsgi.input_terminated')
+                and 'chunked' in _connection_tokens(
+                    environ.get('HTTP_TRANSFER_ENCODING'))):
+            return None
+        return 0
+
+    def _send_body(self, conn, environ, length):
+        source = environ['wsgi.input']
+        if length is None:
+            while True:
+                chunk = source.read(self.block_size)
+                if not chunk:
+                    break
+                conn.send(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            conn.send(b'0\r\n\r\n')
+            return
+        while length > 0:
+            chunk = source.read(min(length, self.block_size))
+            if not chunk:
+                break
+            conn.send(chunk)
+            length -= len(chunk)
+
+    def _request(self, conn, environ, url, headers, length):
+        if conn.sock is None:
+            conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        conn.putrequest(environ['REQUEST_METHOD'], url, skip_host=True,
+                        skip_accept_encoding=True)
+        for name, value in headers:
+            conn.putheader(name, value)
+        if length is None:
+            conn.putheader('Transfer-Encoding', 'chunked')
+        conn.endheaders()
+        if length != 0:
+            self._send_body(conn, environ, length)
+        return conn.getresponse()
+
+    def __call__(self, environ, start_response):
+        url = self._url(environ)
+        headers = self._headers(environ)
+        length = self._body_length(environ)
+        conn, retry = self._pool.get()
+        # A pooled connection may have been closed by the upstream:  retry
+        # once, on a fresh connection, if the request is idempotent and has
+        # no body (which would already be spent).
+        retry = (retry and length == 0
+                 and environ['REQUEST_METHOD'] in _IDEMPOTENT_METHODS)
+        while True:
+            try:
+                response = self._request(conn, environ, url, headers, length)
+            except _STALE_ERRORS:
+                conn.close()
+                if retry:
+                    retry = False
+                    conn = self._pool.connect()
+                    continue
+                return _error(start_response, '502 Bad Gateway')
+            except socket.timeout:
+                conn.close()
+                return _error(start_response, '504 Gateway Timeout')
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                return _error(start_response, '502 Bad Gateway')
+            break
+        connection = _connection_tokens(response.getheader('Connection'))
+        response_headers = [
+            (name, value) for name, value in response.getheaders()
+            if name.lower() not in _HOP_BY_HOP
+            and name.lower() not in connection]
+        start_response('%d %s' % (response.status, response.reason),
+                       response_headers)
+        return _ProxyBody(self._pool, conn, response, self.block_size)
+
+    def close(self):
+        """ Close the idle upstream connections.
+        """
+        self._pool.close()
+
+
+class _ProxyBody(object):
+    """ Stream the upstream ``response``, then return ``conn`` to the pool.
+    """
+    def __init__(self, pool, conn, response, block_size):
+        self._pool = pool
+        self._conn = conn
+        self._response = response
+        self._block_size = block_size
+
+    def __iter__(self):
+        response = self._response
+        while True:
+            chunk = response.read1(self._block_size)
+            if not chunk:
+                break
+            yield chunk
+        response.read()  # marks a fully-read response closed
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        response = self._response
+        if response.isclosed() and not response.will_close:
+            self._pool.put(conn)
+        else:
+            response.close()
+            conn.close()
+
+
+def proxy_factory(global_conf, upstream, pool_size='10', connect_timeout='5',
+                  read_timeout='30', preserve_host='false'):
+    """ ``paste.app_factory`` for ``ProxyMount``.
+    """
+    return ProxyMount(
+        upstream,
+        pool_size=int(pool_size),
+        connect_timeout=float(connect_timeout),
+        read_timeout=float(read_timeout),
+        preserve_host=_asbool(preserve_host),
+    )
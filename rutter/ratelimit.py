@@ -0,0 +1,84 @@
+""" Token-bucket rate limits for a mounted app.  See ``RateLimit``
+"""
+from collections import OrderedDict
+import math
+import threading
+import time
+
+
+class RateLimit(object):
+    """ WSGI wrapper limiting the rate of requests reaching ``app``.
+
+    Mount it in place of the application, e.g.::
+
+        urlmap['/search'] = RateLimit(search_app, rate=10, burst=20,
+                                      key='REMOTE_ADDR')
+
+    Each bucket holds up to ``burst`` tokens (by default, ``rate``, but at
+    least one), refilled at ``rate`` tokens per second;  each request
+    takes a token, or, if there are none, is answered ``429 Too Many
+    Requests`` without calling ``app``.
+
+    Without a ``key``, all requests share one bucket.  Otherwise, each
+    value of the environ ``key`` (e.g. ``REMOTE_ADDR``, or a header such
+    as ``HTTP_X_API_KEY``) gets its own bucket, kept in an LRU of up to
+    ``max_clients`` buckets.
+    """
+    def __init__(self, app, rate, burst=None, key=None, max_clients=10000,
+                 clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError('rate must be positive (got %r)' % (rate,))
+        self.app = app
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.key = key
+        self.max_clients = max_clients
+        self._clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        body = b'Too Many Requests'
+        self._status = '429 Too Many Requests'
+        self._headers = (('Content-Type', 'text/plain'),
+                         ('Content-Length', str(len(body))),
+                         ('Retry-After', str(int(math.ceil(1 / self.rate)))))
+        self._body = (body,)
+
+    def _take(self, client):
+        """ Take a token from ``client``'s bucket;  return whether we could.
+        """
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = [self.burst, now]
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket[0] = min(self.burst,
+                                bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] < 1:
+                return False
+            bucket[0] -= 1
+            return True
+
+    def __call__(self, environ, start_response):
+        client = None if self.key is None else environ.get(self.key, '')
+        if self._take(client):
+            return self.app(environ, start_response)
+        start_response(self._status, list(self._headers))
+        return self._body
+
+
+def ratelimit_factory(app, rate=None, burst=None, key=None,
+                      max_clients='10000'):
+    """ Wrap ``app`` in ``RateLimit``, from string-valued options.
+
+    Used by ``urlmap_factory`` for mounts with a ``ratelimit`` option.
+    """
+    if rate is None:
+        raise ValueError("'ratelimit' needs a 'ratelimit_rate'")
+    return RateLimit(app, rate=float(rate),
+                     burst=None if burst is None else float(burst),
+                     key=key, max_clients=int(max_clients))
@@ -0,0 +1,309 @@
+""" Serve a directory of static files as a mount.  See ``StaticMount``
+"""
+from collections import OrderedDict
+import email.utils
+import mimetypes
+import os
+import stat
+import threading
+import zlib
+
+from ._util import _accepts_gzip
+from ._util import _asbool
+from ._util import _compressible
+from ._util import _error
+
+_METHODS = ('GET', 'HEAD')
+
+
+def _gzip(body):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # gzip container
+    return compressor.compress(body) + compressor.flush()
+
+
+def _parse_http_date(value):
+    try:
+        return email.utils.mktime_tz(email.utils.parsedate_tz(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def _parse_range(value, size):
+    """ Return ``(start, end)`` (inclusive) for a single-range header.
+
+    Return ``None`` if the header is not a single byte range we can parse,
+    and ``False`` if it is unsatisfiable.
+    """
+    units, _, spec = value.partition('=')
+    if units.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, dash, last = spec.strip().partition('-')
+    if (not dash or not (first or last)
+            or (first and not first.isdigit())
+            or (last and not last.isdigit())):
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        return False
+    return start, min(end, size - 1)
+
+
+class _Entry(object):
+    """ Metadata (and, for small files, content) of one static file.
+    """
+    body = gzip_body = None
+
+    def __init__(self, path, st, content_type):
+        self.path = path
+        self.size = st.st_size
+        self.version = (st.st_mtime_ns, st.st_size)
+        self.mtime = int(st.st_mtime)
+        self.etag = '"%x-%x"' % self.version
+        self.last_modified = email.utils.formatdate(self.mtime, usegmt=True)
+        self.content_type = content_type
+
+    @property
+    def cost(self):
+        return len(self.body or b'') + len(self.gzip_body or b'')
+
+
+class _FileIter(object):
+    """ Iterate over ``length`` bytes of ``fileobj`` in ``block_size`` blocks.
+    """
+    def __init__(self, fileobj, block_size, length=None):
+        self.fileobj = fileobj
+        self.block_size = block_size
+        self.remaining = length
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        size = self.block_size
+        if self.remaining is not None:
+            size = min(size, self.remaining)
+        data = self.fileobj.read(size) if size else b''
+        if not data:
+            raise StopIteration
+        if self.remaining is not None:
+            self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.fileobj.close()
+
+
+class StaticMount(object):
+    """ WSGI application serving the files below ``directory``.
+
+    Mount it on a ``URLMap``, e.g.::
+
+        urlmap['/static'] = StaticMount('/srv/assets', max_age=3600)
+
+    The (post-dispatch) ``PATH_INFO`` names a file below ``directory``;
+    paths escaping it, via ``..`` or symlinks, are not found.  Large files
+    are streamed through the server's ``wsgi.file_wrapper`` (so that it can
+    use ``sendfile``), if it provides one.
+
+    Files of up to ``cache_file_size`` bytes are kept in an LRU cache of up
+    to ``cache_entries`` files and ``cache_bytes`` bytes, along with a
+    precompressed gzip variant for compressible types (if ``gzip`` is
+    true).  Cached files are re-validated against the file system on each
+    request.
+
+    Responses carry ``ETag``, ``Last-Modified`` and (if ``max_age`` is
+    given) ``Cache-Control`` headers;  conditional (``If-None-Match``,
+    ``If-Modified-Since``) and single-range (``Range``, ``If-Range``)
+    requests are supported.
+    """
+    def __init__(self, directory, max_age=None, gzip=True,
+                 cache_entries=256, cache_bytes=16 * 1024 * 1024,
+                 cache_file_size=256 * 1024, block_size=64 * 1024):
+        self.directory = os.path.realpath(directory)
+        self.max_age = max_age
+        self.gzip = gzip
+        self.cache_entries = cache_entries
+        self.cache_bytes = cache_bytes
+        self.cache_file_size = cache_file_size
+        self.block_size = block_size
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+    def _resolve(self, path_info):
+        """ Return the real filesystem path for ``path_info``, or ``None``.
+        """
+        parts = [part for part in path_info.split('/') if part]
+        for part in parts:
+            if (part == '..' or '\0' in part or os.sep in part
+                    or (os.altsep and os.altsep in part)):
+                return None
+        path = os.path.realpath(os.path.join(self.directory, *parts))
+        if path != self.directory and not path.startswith(
+                os.path.join(self.directory, '')):
+            return None
+        return path
+
+    def _make_entry(self, path, st):
+        content_type = mimetypes.guess_type(path)[0]
+        entry = _Entry(path, st, content_type or 'application/octet-stream')
+        if st.st_size <= self.cache_file_size:
+            with open(path, 'rb') as f:
+                body = f.read()
+            if len(body) != entry.size:  # changed since 'stat':  don't cache
+                return entry
+            entry.body = body
+            if self.gzip and _compressible(entry.content_type):
+                gzip_body = _gzip(entry.body)
+                if len(gzip_body) < len(entry.body):
+                    entry.gzip_body = gzip_body
+        return entry
+
+    def _entry(self, path, st):
+        """ Return the (possibly cached) ``_Entry`` for ``path``.
+        """
+        version = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._cache.get(path)
+            if entry is not None:
+                if entry.version == version:
+                    self._cache.move_to_end(path)
+                    return entry
+                del self._cache[path]
+                self._cached_bytes -= entry.cost
+        entry = self._make_entry(path, st)
+        if entry.body is None:
+            return entry
+        with self._lock:
+            if path not in self._cache:
+                self._cache[path] = entry
+                self._cached_bytes += entry.cost
+            while self._cache and (
+                    len(self._cache) > self.cache_entries
+                    or self._cached_bytes > self.cache_bytes):
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_bytes -= evicted.cost
+        return entry
+
+    def _headers(self, entry, etag=None):
+        headers = [('ETag', etag or entry.etag),
+                   ('Last-Modified', entry.last_modified),
+                   ('Accept-Ranges', 'bytes')]
+        if self.max_age is not None:
+            headers.append(('Cache-Control', 'public, max-age=%d'
+                            % self.max_age))
+        if entry.gzip_body is not None:
+            headers.append(('Vary', 'Accept-Encoding'))
+        return headers
+
+    def _not_modified(self, environ, entry):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return ('*' in tags or entry.etag in tags
+                    or entry.etag[:-1] + '-gz"' in tags)
+        since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if since is not None:
+            since = _parse_http_date(since)
+            return since is not None and entry.mtime <= since
+        return False
+
+    def _range(self, environ, entry):
+        value = environ.get('HTTP_RANGE')
+        if value is None:
+            return None
+        if_range = environ.get('HTTP_IF_RANGE')
+        if if_range is not None and if_range.strip() not in (
+                entry.etag, entry.last_modified):
+            return None
+        return _parse_range(value, entry.size)
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        if method not in _METHODS:
+            return _error(start_response, '405 Method Not Allowed',
+                          [('Allow', ', '.join(_METHODS))])
+        path = self._resolve(environ.get('PATH_INFO', ''))
+        try:
+            st = os.stat(path) if path is not None else None
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
+            return _error(start_response, '404 Not Found')
+        try:
+            entry = self._entry(path, st)
+        except OSError:
+            return _error(start_response, '404 Not Found')
+
+        if self._not_modified(environ, entry):
+            start_response('304 Not Modified', self._headers(entry))
+            return []
+
+        byte_range = self._range(environ, entry)
+        if byte_range is False:
+            return _error(start_response,
+                          '416 Range Not Satisfiable',
+                          [('Content-Range', 'bytes */%d' % entry.size)])
+        if byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            headers = self._headers(entry) + [
+                ('Content-Type', entry.content_type),
+                ('Content-Length', str(length)),
+                ('Content-Range', 'bytes %d-%d/%d'
+                 % (start, end, entry.size))]
+            start_response('206 Partial Content', headers)
+            if method == 'HEAD':
+                return []
+            if entry.body is not None:
+                return [entry.body[start:end + 1]]
+            f = open(path, 'rb')
+            f.seek(start)
+            return _FileIter(f, self.block_size, length)
+
+        if entry.gzip_body is not None and _accepts_gzip(environ):
+            body = entry.gzip_body
+            headers = self._headers(entry, entry.etag[:-1] + '-gz"') + [
+                ('Content-Encoding', 'gzip')]
+        else:
+            body = entry.body
+            headers = self._headers(entry)
+        headers += [('Content-Type', entry.content_type),
+                    ('Content-Length',
+                     str(entry.size if body is None else len(body)))]
+        start_response('200 OK', headers)
+        if method == 'HEAD':
+            return []
+        if body is not None:
+            return [body]
+        f = open(path, 'rb')
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(f, self.block_size)
+        return _FileIter(f, self.block_size)
+
+
+def static_factory(global_conf, directory, max_age=None, gzip='true',
+                   cache_entries='256', cache_bytes=str(16 * 1024 * 1024),
+                   cache_file_size=str(256 * 1024)):
+    """ ``paste.app_factory`` for ``StaticMount``.
+
+    ``directory`` is relative to the configuration file's directory.
+    """
+    directory = os.path.join(global_conf.get('here', ''), directory)
+    return StaticMount(
+        directory,
+        max_age=None if max_age is None else int(max_age),
+        gzip=_asbool(gzip),
+        cache_entries=int(cache_entries),
+        cache_bytes=int(cache_bytes),
+        cache_file_size=int(cache_file_size),
+    )
@@ -0,0 +1,149 @@
+""" Run a mounted WSGI app in a pool of subinterpreters.  See ``InterpreterMount``
+"""
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+import io
+import sys
+
+try:
+    from concurrent.futures import InterpreterPoolExecutor
+except ImportError:  # pragma: NO COVER Python < 3.14
+    InterpreterPoolExecutor = None
+
+from ._util import _error
+from .manifest import resolve_app_spec
+
+# Environ values which can cross into another interpreter.
+_SHAREABLE_TYPES = (str, bytes, int, float, bool, type(None))
+_CHUNK_SIZE = 64 * 1024
+
+# In each interpreter (or, in the fallback, the process):  spec -> app.
+_apps = {}
+
+
+def _load_app(spec):
+    app = _apps.get(spec)
+    if app is None:
+        app = _apps[spec] = resolve_app_spec(spec)
+    return app
+
+
+def _run_app(spec, environ, body):
+    """ Call the app named by ``spec``;  return ``(status, headers, body)``.
+
+    Runs inside the worker interpreter:  ``environ`` holds only shareable
+    values, and ``body`` is the request body, as bytes.
+    """
+    app = _load_app(spec)
+    environ = dict(environ)
+    environ['wsgi.version'] = (1, 0)
+    environ['wsgi.input'] = io.BytesIO(body)
+    environ['wsgi.errors'] = sys.stderr
+    started = []
+    chunks = []
+
+    def _start_response(status, headers, exc_info=None):
+        started[:] = [status, [(name, value) for name, value in headers]]
+        return chunks.append
+
+    iterable = app(environ, _start_response)
+    try:
+        for chunk in iterable:
+            chunks.append(chunk)
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+    status, headers = started
+    return status, headers, b''.join(chunks)
+
+
+def _read_body(environ):
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length <= 0:
+        return b''
+    source = environ['wsgi.input']
+    chunks = []
+    while length > 0:
+        chunk = source.read(min(length, _CHUNK_SIZE))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        length -= len(chunk)
+    return b''.join(chunks)
+
+
+def default_executor_factory(workers, spec):
+    """ Return a pool of ``workers`` subinterpreters, each importing ``spec``.
+
+    Where subinterpreters are unavailable (before Python 3.14), return a
+    pool of threads instead.
+    """
+    executor_class = InterpreterPoolExecutor or ThreadPoolExecutor
+    return executor_class(workers, initializer=_load_app, initargs=(spec,))
+
+
+class InterpreterMount(object):
+    """ WSGI application running the app named by ``spec`` in subinterpreters.
+
+    Mount it in place of the application, e.g.::
+
+        urlmap['/render'] = InterpreterMount('reports.wsgi:application')
+
+    ``spec`` is an application spec, as for ``rutter.manifest``:  each of
+    the ``workers`` interpreters imports the application itself, so that,
+    with a per-interpreter GIL, a pure-Python, CPU-bound application can
+    use several cores from one process.  Requests and responses cross
+    between interpreters as copies:  the environ's string, bytes and
+    numeric values, and the request and response bodies, which are
+    buffered.  Each request must complete within ``timeout`` seconds, if
+    given, or is answered ``504 Gateway Timeout``;  a request not yet
+    started by then is cancelled, but one already running keeps its
+    worker until it completes.
+
+    Where subinterpreters are unavailable, the workers are threads of the
+    current interpreter, sharing one copy of the application;  ``isolated``
+    tells which.
+    """
+    def __init__(self, spec, workers=4, timeout=None,
+                 executor_factory=default_executor_factory):
+        self.spec = spec
+        self.workers = workers
+        self.timeout = timeout
+        self._executor = executor_factory(workers, spec)
+        self.isolated = (InterpreterPoolExecutor is not None
+                         and isinstance(self._executor,
+                                        InterpreterPoolExecutor))
+
+    def __call__(self, environ, start_response):
+        shared = dict((key, value) for key, value in environ.items()
+                      if isinstance(value, _SHAREABLE_TYPES))
+        future = self._executor.submit(
+            _run_app, self.spec, shared, _read_body(environ))
+        try:
+            status, headers, body = future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            return _error(start_response, '504 Gateway Timeout')
+        start_response(status, headers)
+        return [body]
+
+    def close(self):
+        """ Shut down the worker interpreters.
+        """
+        self._executor.shutdown()
+
+
+def subinterp_factory(global_conf, app, workers='4', timeout=None):
+    """ ``paste.app_factory`` for ``InterpreterMount``.
+
+    ``app`` is an application spec, ``module:attr`` or ``egg:dist#name``.
+    """
+    return InterpreterMount(
+        app,
+        workers=int(workers),
+        timeout=None if timeout is None else float(timeout),
+    )
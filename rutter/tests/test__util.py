@@ -0,0 +1,28 @@
+import unittest
+
+
+class Test__accepts_gzip(unittest.TestCase):
+
+    def _callFUT(self, value=None):
+        from .._util import _accepts_gzip
+        environ = {}
+        if value is not None:
+            environ['HTTP_ACCEPT_ENCODING'] = value
+        return _accepts_gzip(environ)
+
+    def test_it(self):
+        self.assertFalse(self._callFUT())
+        self.assertFalse(self._callFUT('br, deflate'))
+        self.assertTrue(self._callFUT('deflate, GZIP'))
+        self.assertTrue(self._callFUT('gzip;q=0.5'))
+        self.assertFalse(self._callFUT('gzip;q=0'))
+        self.assertFalse(self._callFUT('gzip;q=bogus'))
+
+
+class Test__asbool(unittest.TestCase):
+
+    def test_it(self):
+        from .._util import _asbool
+        self.assertTrue(_asbool('True'))
+        self.assertFalse(_asbool('off'))
+        self.assertTrue(_asbool(1))
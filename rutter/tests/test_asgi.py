@@ -0,0 +1,260 @@
+import asyncio
+import unittest
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+class Test__default_not_found_app(unittest.TestCase):
+
+    def test_it(self):
+        from ..asgi import _default_not_found_app
+        sent = []
+        async def _send(message):
+            sent.append(message)
+        _run(_default_not_found_app({'path': '/foo'}, None, _send))
+        self.assertEqual(sent[0]['status'], 404)
+        self.assertEqual(sent[1]['body'], b'Not Found: /foo')
+
+
+class ASGIURLMapTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from ..asgi import ASGIURLMap
+        return ASGIURLMap
+
+    def _makeOne(self, *args, **kw):
+        return self._getTargetClass()(*args, **kw)
+
+    def _call(self, mapper, scope):
+        async def _receive():  # pragma: NO COVER
+            return {'type': 'http.disconnect'}
+        async def _send(message):  # pragma: NO COVER
+            pass
+        return _run(mapper(scope, _receive, _send))
+
+    def test_ctor_defaults(self):
+        from ..asgi import _default_not_found_app
+        mapper = self._makeOne()
+        self.assertTrue(mapper.not_found_application is _default_not_found_app)
+        self.assertEqual(mapper.startup_timeout, None)
+        self.assertEqual(mapper.shutdown_timeout, None)
+        self.assertEqual(mapper.startup_times, {})
+
+    def test___call___miss(self):
+        not_found = DummyASGIApp()
+        mapper = self._makeOne(not_found)
+        mapper['/foo'] = DummyASGIApp()
+        scope = _makeScope(path='/bar')
+        self._call(mapper, scope)
+        self.assertTrue(not_found.scope is scope)
+
+    def test___call___hit_w_host_header(self):
+        shorter, longer, other = (DummyASGIApp(), DummyASGIApp(),
+                                  DummyASGIApp())
+        mapper = self._makeOne()
+        mapper['/foo'] = shorter
+        mapper['http://example.com/foo/bar'] = longer
+        mapper['http://other.com/foo/bar'] = other
+        scope = _makeScope(path='/foo//bar/baz', root_path='/root')
+        self._call(mapper, scope)
+        self.assertEqual(longer.scope['root_path'], '/root/foo/bar')
+        self.assertEqual(longer.scope['path'], '/baz')
+        self.assertEqual(scope['path'], '/foo//bar/baz')
+        self.assertTrue(shorter.scope is None)
+        self.assertTrue(other.scope is None)
+
+    def test___call___hit_w_server_and_scheme(self):
+        http, https = DummyASGIApp(), DummyASGIApp()
+        mapper = self._makeOne()
+        mapper['http://example.com:80/'] = http
+        mapper['http://example.com:443/'] = https
+        scope = _makeScope(headers=[], scheme='wss',
+                           server=('example.com', 443))
+        self._call(mapper, scope)
+        self.assertEqual(https.scope['root_path'], '')
+        self.assertEqual(https.scope['path'], '/')
+        scope = _makeScope(headers=[(b'host', b'Example.com')],
+                           scheme='ws')
+        self._call(mapper, scope)
+        self.assertTrue(http.scope is not None)
+
+    def test___call___w_server_wo_port(self):
+        root, other = DummyASGIApp(), DummyASGIApp()
+        mapper = self._makeOne()
+        mapper['/'] = root
+        mapper['http://example.com/'] = other
+        scope = _makeScope(headers=[], server=['/tmp/app.sock', None])
+        self._call(mapper, scope)
+        self.assertEqual(root.scope['path'], '/')
+        self.assertTrue(other.scope is None)
+
+    def test___call___w_nested_maps(self):
+        leaf, inner_not_found = DummyASGIApp(), DummyASGIApp()
+        inner = self._makeOne(inner_not_found)
+        inner['http://example.com/items'] = leaf
+        mapper = self._makeOne()
+        mapper['/products'] = inner
+        self._call(mapper, _makeScope(path='/products/items/1',
+                                      root_path='/root'))
+        self.assertEqual(leaf.scope['root_path'], '/root/products/items')
+        self.assertEqual(leaf.scope['path'], '/1')
+        self._call(mapper, _makeScope(path='/products/other'))
+        self.assertEqual(inner_not_found.scope['root_path'], '/products')
+        self.assertEqual(inner_not_found.scope['path'], '/other')
+
+    def test___call___wo_host_or_server(self):
+        root = DummyASGIApp()
+        mapper = self._makeOne()
+        mapper['/'] = root
+        scope = _makeScope(headers=[])
+        del scope['scheme']
+        self._call(mapper, scope)
+        self.assertTrue(root.scope is not None)
+
+    def _lifespan(self, mapper, replies=None):
+        events = [{'type': 'lifespan.startup'},
+                  {'type': 'lifespan.shutdown'}]
+        sent = []
+        async def _receive():
+            return events.pop(0)
+        async def _send(message):
+            sent.append(message)
+        _run(mapper({'type': 'lifespan'}, _receive, _send))
+        return [message['type'] for message in sent], sent
+
+    def test_lifespan_empty(self):
+        mapper = self._makeOne()
+        types, _ = self._lifespan(mapper)
+        self.assertEqual(types, ['lifespan.startup.complete',
+                                 'lifespan.shutdown.complete'])
+
+    def test_lifespan_concurrent(self):
+        log = []
+        foo = LifespanApp('foo', log, delay=0.05)
+        bar = LifespanApp('bar', log, delay=0.05)
+        mapper = self._makeOne()
+        mapper['/foo'] = foo
+        mapper['/foo2'] = foo
+        mapper['/bar'] = bar
+        mapper['/plain'] = DummyASGIApp()
+        types, _ = self._lifespan(mapper)
+        self.assertEqual(types, ['lifespan.startup.complete',
+                                 'lifespan.shutdown.complete'])
+        # Both start before either finishes.
+        self.assertEqual(sorted(log[:2]), ['bar:startup', 'foo:startup'])
+        self.assertEqual(foo.startups, 1)
+        self.assertEqual(sorted(mapper.startup_times),
+                         [(None, '/bar'), (None, '/foo'), (None, '/foo2'),
+                          (None, '/plain')])
+        self.assertTrue(mapper.startup_times[(None, '/foo')] >= 0.05)
+        self.assertEqual(mapper.startup_times[(None, '/foo')],
+                         mapper.startup_times[(None, '/foo2')])
+        self.assertEqual(sorted(log[-2:]), ['bar:shutdown', 'foo:shutdown'])
+
+    def test_lifespan_startup_failed_cancels_others(self):
+        log = []
+        slow = LifespanApp('slow', log, delay=10)
+        started = LifespanApp('started', log)
+        mapper = self._makeOne()
+        mapper['/slow'] = slow
+        mapper['/started'] = started
+        mapper['/bad'] = LifespanApp('bad', log, fail='startup')
+        types, sent = self._lifespan(mapper)
+        self.assertEqual(types, ['lifespan.startup.failed'])
+        self.assertTrue("Mount (None, '/bad')" in sent[0]['message'])
+        self.assertTrue('startup failed: bad' in sent[0]['message'])
+        self.assertTrue(slow.cancelled)
+        self.assertTrue(started.cancelled)
+
+    def test_lifespan_startup_timeout(self):
+        mapper = self._makeOne(startup_timeout=0.01)
+        mapper['/slow'] = LifespanApp('slow', [], delay=10)
+        types, sent = self._lifespan(mapper)
+        self.assertEqual(types, ['lifespan.startup.failed'])
+        self.assertTrue('startup timed out after 0.01s' in sent[0]['message'])
+
+    def test_lifespan_startup_unexpected_message(self):
+        mapper = self._makeOne()
+        mapper['/odd'] = LifespanApp('odd', [], reply='lifespan.bogus')
+        types, sent = self._lifespan(mapper)
+        self.assertEqual(types, ['lifespan.startup.failed'])
+        self.assertTrue("unexpected message 'lifespan.bogus'"
+                        in sent[0]['message'])
+
+    def test_lifespan_shutdown_failed(self):
+        log = []
+        mapper = self._makeOne(shutdown_timeout=1)
+        mapper['/bad'] = LifespanApp('bad', log, fail='shutdown')
+        mapper['/good'] = LifespanApp('good', log)
+        types, sent = self._lifespan(mapper)
+        self.assertEqual(types, ['lifespan.startup.complete',
+                                 'lifespan.shutdown.failed'])
+        self.assertTrue('shutdown failed: bad' in sent[1]['message'])
+        self.assertTrue('good:shutdown' in log)
+
+    def test_lifespan_nested(self):
+        log = []
+        inner = self._makeOne()
+        inner['/foo'] = LifespanApp('inner', log)
+        mapper = self._makeOne()
+        mapper['/inner'] = inner
+        types, _ = self._lifespan(mapper)
+        self.assertEqual(types, ['lifespan.startup.complete',
+                                 'lifespan.shutdown.complete'])
+        self.assertEqual(log, ['inner:startup', 'inner:shutdown'])
+
+
+class DummyASGIApp(object):
+
+    scope = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            raise ValueError('lifespan not supported')
+        self.scope = scope
+
+
+class LifespanApp(object):
+
+    startups = 0
+    cancelled = False
+
+    def __init__(self, name, log, delay=0, fail=None, reply=None):
+        self.name = name
+        self.log = log
+        self.delay = delay
+        self.fail = fail
+        self.reply = reply
+
+    async def __call__(self, scope, receive, send):
+        try:
+            for event in ('startup', 'shutdown'):
+                message = await receive()
+                assert message['type'] == 'lifespan.%s' % event
+                self.log.append('%s:%s' % (self.name, event))
+                if event == 'startup':
+                    self.startups += 1
+                    await asyncio.sleep(self.delay)
+                if self.reply:
+                    await send({'type': self.reply})
+                elif self.fail == event:
+                    await send({'type': 'lifespan.%s.failed' % event,
+                                'message': self.name})
+                else:
+                    await send({'type': 'lifespan.%s.complete' % event})
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+def _makeScope(**kw):
+    scope = {
+        'type': 'http',
+        'scheme': 'http',
+        'path': '/',
+        'headers': [(b'host', b'example.com')],
+    }
+    scope.update(kw)
+    return scope
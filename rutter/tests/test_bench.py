@@ -0,0 +1,327 @@
+import unittest
+
+
+class Test_percentile(unittest.TestCase):
+
+    def _callFUT(self, ordered, fraction):
+        from ..bench import percentile
+        return percentile(ordered, fraction)
+
+    def test_empty(self):
+        self.assertEqual(self._callFUT([], 0.5), None)
+
+    def test_nearest_rank(self):
+        ordered = list(range(1, 1001))
+        self.assertEqual(self._callFUT(ordered, 0.0), 1)
+        self.assertEqual(self._callFUT(ordered, 0.5), 500)
+        self.assertEqual(self._callFUT(ordered, 0.99), 990)
+        self.assertEqual(self._callFUT(ordered, 0.999), 999)
+        self.assertEqual(self._callFUT(ordered, 1.0), 1000)
+        self.assertEqual(self._callFUT([7], 0.999), 7)
+
+
+class Test_summarize(unittest.TestCase):
+
+    def _callFUT(self, latencies, count, elapsed):
+        from ..bench import summarize
+        return summarize(latencies, count, elapsed)
+
+    def test_it(self):
+        report = self._callFUT([3000, 1000, 2000], 3, 0.5)
+        self.assertEqual(report['requests'], 3)
+        self.assertEqual(report['throughput'], 6.0)
+        self.assertEqual(report['p50_us'], 2.0)
+        self.assertEqual(report['p999_us'], 3.0)
+
+    def test_empty(self):
+        report = self._callFUT([], 0, 0.0)
+        self.assertEqual(report['throughput'], 0.0)
+        self.assertEqual(report['p50_us'], None)
+
+    def test_format_report(self):
+        from ..bench import format_report
+        text = format_report(self._callFUT([1000], 1, 1.0))
+        self.assertTrue('throughput   1.0 req/s' in text)
+        self.assertTrue('p99          1.00 us' in text)
+        text = format_report(self._callFUT([], 0, 1.0))
+        self.assertTrue('p99          n/a' in text)
+
+
+class Test_zipf_paths(unittest.TestCase):
+
+    def _callFUT(self, *args, **kw):
+        from ..bench import zipf_paths
+        return zipf_paths(*args, **kw)
+
+    def test_skewed(self):
+        from collections import Counter
+        paths = ['/a', '/b', '/c', '/d']
+        result = self._callFUT(paths, 2000, s=1.5, seed=1)
+        self.assertEqual(len(result), 2000)
+        counts = Counter(path.split('/item/')[0] for path in result)
+        self.assertEqual(set(counts), set(paths))
+        self.assertTrue(counts['/a'] > counts['/b'] > counts['/d'])
+
+    def test_misses(self):
+        result = self._callFUT(['/a'], 1000, miss_ratio=0.5, seed=2)
+        misses = [path for path in result if path.startswith('/nonesuch/')]
+        self.assertTrue(300 < len(misses) < 700)
+
+    def test_no_paths(self):
+        self.assertEqual(self._callFUT([], 2), ['/nonesuch/0', '/nonesuch/1'])
+
+
+class Test_make_urlmap(unittest.TestCase):
+
+    def test_it(self):
+        from ..bench import make_urlmap
+        from ..bench import timed
+        latencies = []
+        urlmap, paths = make_urlmap(3, latencies)
+        self.assertEqual(paths, ['/m0/m0', '/m1/m1', '/m2/m2'])
+        self.assertEqual(len(urlmap), 3)
+        started = []
+        def _start_response(status, headers):
+            started.append(status)
+        environ = {'SCRIPT_NAME': '', 'PATH_INFO': '/m1/m1/x',
+                   'HTTP_HOST': 'localhost', 'wsgi.url_scheme': 'http'}
+        self.assertEqual(timed(urlmap)(environ, _start_response), [b'OK'])
+        self.assertEqual(environ['SCRIPT_NAME'], '/m1/m1')
+        self.assertEqual(len(latencies), 1)
+        # Without the start stamp, nothing is recorded.
+        urlmap({'SCRIPT_NAME': '', 'PATH_INFO': '/x',
+                'HTTP_HOST': 'localhost', 'wsgi.url_scheme': 'http'},
+               _start_response)
+        self.assertEqual(len(latencies), 1)
+        self.assertEqual(started, ['200 OK', '200 OK'])
+
+
+class Test_run_load(unittest.TestCase):
+
+    def _callFUT(self, **kw):
+        from ..bench import run_load
+        return run_load(**kw)
+
+    def test_inprocess(self):
+        report = self._callFUT(mounts=20, clients=3, requests=300,
+                               miss_ratio=0.1, seed=3)
+        self.assertEqual(report['requests'], 300)
+        self.assertTrue(report['throughput'] > 0)
+        self.assertTrue(report['p50_us'] <= report['p99_us']
+                        <= report['p999_us'])
+
+    def test_http(self):
+        report = self._callFUT(mounts=5, clients=2, requests=20,
+                               mode='http', seed=4)
+        self.assertEqual(report['requests'], 20)
+        self.assertTrue(report['p999_us'] is not None)
+
+
+class Test_main(unittest.TestCase):
+
+    def test_it(self):
+        import contextlib
+        import io
+        from ..bench import main
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            report = main(['--mounts', '5', '--clients', '2',
+                           '--requests', '50', '--seed', '5'])
+        self.assertEqual(report['requests'], 50)
+        self.assertTrue(out.getvalue().startswith('requests     50\n'))
+
+
+class Test_run_scaling(unittest.TestCase):
+
+    def test_it(self):
+        from ..bench import format_scaling
+        from ..bench import run_scaling
+        results = run_scaling(mounts=10, threads=(1, 2), requests=200,
+                              seed=6)
+        self.assertEqual([result['threads'] for result in results], [1, 2])
+        self.assertEqual(results[0]['speedup'], 1.0)
+        self.assertTrue(results[1]['throughput'] > 0)
+        lines = format_scaling(results).splitlines()
+        self.assertTrue(lines[0].startswith('GIL enabled: '))
+        self.assertEqual(len(lines), 4)
+
+    def test_main(self):
+        import contextlib
+        import io
+        from ..bench import main
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            results = main(['--mounts', '5', '--requests', '50',
+                            '--scaling', '1,3'])
+        self.assertEqual([result['threads'] for result in results], [1, 3])
+        self.assertTrue('speedup' in out.getvalue())
+
+
+class Test_measure_allocations(unittest.TestCase):
+
+    def _callFUT(self, app, environ, iterations=20):
+        from ..bench import measure_allocations
+        return measure_allocations(app, environ, iterations)
+
+    def test_it(self):
+        import gc
+        kept = []
+        def _app(environ, start_response):
+            kept.append(environ['PATH_INFO'] * 100)
+        result = self._callFUT(_app, {'PATH_INFO': '/foo'})
+        self.assertEqual(sorted(result), ['blocks', 'bytes', 'peak_bytes'])
+        self.assertTrue(result['blocks'] >= 1)
+        self.assertTrue(result['bytes'] >= 400)
+        self.assertTrue(result['peak_bytes'] >= 400)
+        self.assertTrue(gc.isenabled())
+
+    def test_w_tracing_wo_gc(self):
+        import gc
+        import tracemalloc
+        tracemalloc.start()
+        gc.disable()
+        try:
+            result = self._callFUT(lambda environ, start_response: None, {})
+            self.assertTrue(tracemalloc.is_tracing())
+            self.assertFalse(gc.isenabled())
+        finally:
+            gc.enable()
+            tracemalloc.stop()
+        self.assertEqual(sorted(result), ['blocks', 'bytes', 'peak_bytes'])
+
+
+class Test_run_allocations(unittest.TestCase):
+
+    def test_it(self):
+        from ..bench import format_allocations
+        from ..bench import run_allocations
+        results = run_allocations(mounts=10, iterations=20)
+        self.assertEqual(sorted(results), ['domain', 'hit', 'miss'])
+        lines = format_allocations(results).splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].startswith('domain '))
+
+    def test_scenarios(self):
+        from ..bench import allocation_scenarios
+        urlmap, scenarios = allocation_scenarios(3)
+        for name, script_name in (('hit', '/m2/m2'), ('domain', '/d'),
+                                  ('miss', '')):
+            environ = dict(scenarios[name])
+            self.assertEqual(urlmap(environ, None), [b'OK'])
+            self.assertEqual(environ['SCRIPT_NAME'], script_name)
+
+    def test_main(self):
+        import contextlib
+        import io
+        from ..bench import main
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            results = main(['--mounts', '5', '--allocations'])
+        self.assertEqual(sorted(results), ['domain', 'hit', 'miss'])
+        self.assertTrue(out.getvalue().startswith('scenario '))
+
+
+
+def _makeCapture(records):
+    import io
+    import json
+    return io.StringIO(''.join(json.dumps(record) + '\n'
+                               for record in records))
+
+
+def _makeIndex(keys):
+    import io
+    from ..urlmap import URLMap
+    urlmap = URLMap()
+    for key in keys:
+        urlmap[key] = object()
+    fp = io.StringIO()
+    urlmap.dump_index(fp)
+    fp.seek(0)
+    return fp
+
+
+class Test_run_replay(unittest.TestCase):
+
+    _RECORDS = [
+        ['example.com:80', 'http', '/a/1', '/a', 1000],
+        ['other.org:443', 'https', '/d/2', None, 1000],
+        ['example.com:8080', 'http', '/d/3', '/d', 1000],
+        ['example.com:80', 'http', '/nonesuch', None, 1000],
+    ]
+
+    def _callFUT(self, records, keys, clients=2):
+        from ..bench import run_replay
+        return run_replay(_makeCapture(records), _makeIndex(keys), clients)
+
+    def test_it(self):
+        report = self._callFUT(self._RECORDS,
+                               ['/a', 'http://example.com:8080/d'])
+        self.assertEqual(report['requests'], 4)
+        self.assertEqual(report['mismatched'], 0)
+        self.assertTrue(report['p50_us'] is not None)
+
+    def test_mismatched(self):
+        report = self._callFUT(self._RECORDS, ['/a', '/d'])
+        self.assertEqual(report['mismatched'], 1)
+
+    def test_replay_environs(self):
+        from ..bench import replay_environs
+        environ, = replay_environs([('a.com:443', 'https', '/x', None, 1)])
+        self.assertEqual(environ['HTTP_HOST'], 'a.com:443')
+        self.assertEqual(environ['wsgi.url_scheme'], 'https')
+        self.assertEqual(environ['PATH_INFO'], '/x')
+
+    def test_main(self):
+        import contextlib
+        import io
+        import os
+        import tempfile
+        from ..bench import main
+        tmpdir = tempfile.mkdtemp()
+        capture = os.path.join(tmpdir, 'capture.jsonl')
+        index = os.path.join(tmpdir, 'routes.json')
+        try:
+            with open(capture, 'w') as f:
+                f.write(_makeCapture(self._RECORDS).getvalue())
+            with open(index, 'w') as f:
+                f.write(_makeIndex(['/a']).getvalue())
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                report = main(['--replay', capture, '--index', index])
+        finally:
+            os.remove(capture)
+            os.remove(index)
+            os.rmdir(tmpdir)
+        self.assertEqual(report['requests'], 4)
+        self.assertEqual(report['mismatched'], 1)
+        self.assertTrue('mismatched   1' in out.getvalue())
+
+    def test_main_wo_index(self):
+        import contextlib
+        import io
+        from ..bench import main
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                main(['--replay', 'capture.jsonl'])
+
+class Test_gil_enabled(unittest.TestCase):
+
+    def test_wo_sys_hook(self):
+        from .. import bench
+        _saved, bench.sys = bench.sys, object()
+        try:
+            self.assertTrue(bench.gil_enabled())
+        finally:
+            bench.sys = _saved
+
+    def test_w_sys_hook(self):
+        from .. import bench
+        class _Sys(object):
+            def _is_gil_enabled(self):
+                return False
+        _saved, bench.sys = bench.sys, _Sys()
+        try:
+            self.assertFalse(bench.gil_enabled())
+        finally:
+            bench.sys = _saved
@@ -0,0 +1,112 @@
+import unittest
+
+
+class RecorderTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from ..capture import Recorder
+        return Recorder
+
+    def _makeOne(self, fp=None, **kw):
+        import io
+        if fp is None:
+            fp = io.StringIO()
+        return self._getTargetClass()(fp, **kw)
+
+    def test_start_sampled(self):
+        recorder = self._makeOne(rate=1)
+        self.assertTrue(isinstance(recorder.start(), int))
+
+    def test_start_sampling_rate(self):
+        recorder = self._makeOne(rate=0.25, seed=1)
+        sampled = [recorder.start() for _ in range(1000)]
+        count = len([started for started in sampled if started is not None])
+        self.assertTrue(200 < count < 300, count)
+
+    def test_start_never(self):
+        recorder = self._makeOne(rate=0)
+        self.assertEqual([recorder.start() for _ in range(100)], [None] * 100)
+
+    def test_record(self):
+        import json
+        recorder = self._makeOne(rate=1)
+        recorder.record('example.com:80', 'http', '/foo/bar', '/foo',
+                        recorder.start())
+        recorder.record('example.com:80', 'https', '/baz', None,
+                        recorder.start())
+        lines = recorder.fp.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertFalse(' ' in lines[0])  # compact
+        record = json.loads(lines[0])
+        self.assertEqual(record[:4],
+                         ['example.com:80', 'http', '/foo/bar', '/foo'])
+        self.assertTrue(record[4] >= 0)
+        self.assertEqual(json.loads(lines[1])[3], None)
+        self.assertEqual(recorder.recorded, 2)
+
+    def test_record_w_max_records(self):
+        recorder = self._makeOne(rate=1, max_records=1)
+        for _ in range(3):
+            recorder.record('example.com:80', 'http', '/', None,
+                            recorder.start())
+        self.assertEqual(len(recorder.fp.getvalue().splitlines()), 1)
+        self.assertEqual(recorder.recorded, 1)
+
+    def test_close(self):
+        recorder = self._makeOne()
+        recorder.close()
+        self.assertTrue(recorder.fp.closed)
+
+
+class Test_read_capture(unittest.TestCase):
+
+    def _callFUT(self, fp):
+        from ..capture import read_capture
+        return list(read_capture(fp))
+
+    def test_it(self):
+        import io
+        fp = io.StringIO('["a.com:80","http","/x","/x",12]\n\n'
+                         '["a.com:443","https","/y",null,34]\n')
+        self.assertEqual(self._callFUT(fp), [
+            ('a.com:80', 'http', '/x', '/x', 12),
+            ('a.com:443', 'https', '/y', None, 34),
+        ])
+
+    def test_invalid(self):
+        import io
+        for text in ('["a.com:80","http","/x","/x",12]\nnot json\n',
+                     '["a.com:80","http"]\n', '12\n'):
+            with self.assertRaises(ValueError):
+                self._callFUT(io.StringIO(text))
+
+
+class Functests(unittest.TestCase):
+
+    def test_urlmap_recording(self):
+        import io
+        from ..capture import Recorder
+        from ..capture import read_capture
+        from ..urlmap import URLMap
+
+        def _app(environ, start_response):
+            return environ['SCRIPT_NAME'], environ['PATH_INFO']
+        inner = URLMap(_app)
+        inner['/b'] = _app
+        urlmap = URLMap(_app)
+        urlmap['/a'] = inner
+        fp = io.StringIO()
+        urlmap.recorder = Recorder(fp, rate=1)
+        for host, scheme, path in (('Example.com', 'http', '/a/b/c'),
+                                   ('example.com:8080', 'https', '//a//b'),
+                                   ('example.com', 'https', '/nonesuch')):
+            environ = {'HTTP_HOST': host, 'wsgi.url_scheme': scheme,
+                       'SCRIPT_NAME': '', 'PATH_INFO': path}
+            urlmap(environ, None)
+        fp.seek(0)
+        records = [record[:4] for record in read_capture(fp)]
+        self.assertEqual(records, [
+            ('example.com:80', 'http', '/a/b/c', '/a/b'),
+            ('example.com:8080', 'https', '//a//b', '/a/b'),
+            ('example.com:443', 'https', '/nonesuch', None),
+        ])
@@ -0,0 +1,250 @@
+import unittest
+
+
+class CascadeTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from ..cascade import Cascade
+        return Cascade
+
+    def _makeOne(self, apps=(), **kw):
+        return self._getTargetClass()(apps, **kw)
+
+    def _call(self, cascade, **kw):
+        environ = _makeEnviron(**kw)
+        started = []
+        def _start_response(status, headers, exc_info=None):
+            started.append(status)
+            return None
+        iterable = cascade(environ, _start_response)
+        body = b''.join(iterable)
+        if hasattr(iterable, 'close'):
+            iterable.close()
+        return started, body
+
+    def test_ctor_defaults(self):
+        cascade = self._makeOne()
+        self.assertEqual(cascade.apps, ())
+        self.assertEqual(cascade.catch, frozenset([404]))
+        self.assertEqual(cascade.cache_size, 1024)
+
+    def test_single_app(self):
+        app = StatusApp('200 OK', b'only')
+        cascade = self._makeOne([app])
+        self.assertEqual(self._call(cascade), (['200 OK'], b'only'))
+        self.assertEqual(_cached(cascade), {})
+
+    def test_first_answers(self):
+        first, second = StatusApp('200 OK', b'first'), StatusApp('200 OK')
+        cascade = self._makeOne([first, second])
+        self.assertEqual(self._call(cascade), (['200 OK'], b'first'))
+        self.assertEqual(second.calls, 0)
+        self.assertEqual(_cached(cascade), {})
+
+    def test_learns_answering_member(self):
+        first = StatusApp('404 Not Found', b'missing')
+        second = StatusApp('200 OK', b'second')
+        third = StatusApp('200 OK', b'third')
+        cascade = self._makeOne([first, second, third])
+        self.assertEqual(self._call(cascade), (['200 OK'], b'second'))
+        self.assertEqual((first.calls, second.calls), (1, 1))
+        self.assertTrue(first.closed)
+        self.assertEqual(list(_cached(cascade).values()), [1])
+        # Second time, straight to the answering member.
+        self.assertEqual(self._call(cascade), (['200 OK'], b'second'))
+        self.assertEqual((first.calls, second.calls), (1, 2))
+        # Other paths aren't affected.
+        self._call(cascade, PATH_INFO='/other')
+        self.assertEqual(first.calls, 2)
+
+    def test_learns_last_member(self):
+        first = StatusApp('404 Not Found')
+        last = StatusApp('200 OK', b'last')
+        cascade = self._makeOne([first, last])
+        self.assertEqual(self._call(cascade), (['200 OK'], b'last'))
+        self.assertEqual(self._call(cascade), (['200 OK'], b'last'))
+        self.assertEqual(first.calls, 1)
+
+    def test_all_fail(self):
+        first = StatusApp('404 Not Found')
+        last = StatusApp('404 Not Found', b'last')
+        cascade = self._makeOne([first, last])
+        self.assertEqual(self._call(cascade), (['404 Not Found'], b'last'))
+        self.assertEqual(_cached(cascade), {})
+
+    def test_cached_member_stops_answering(self):
+        first = StatusApp('404 Not Found')
+        second = StatusApp('200 OK', b'second')
+        third = StatusApp('200 OK', b'third')
+        cascade = self._makeOne([first, second, third])
+        self._call(cascade)
+        second.status = '404 Not Found'
+        first.status = '200 OK'
+        first.body = b'first'
+        self.assertEqual(self._call(cascade), (['200 OK'], b'first'))
+        self.assertEqual(second.calls, 2)
+        self.assertEqual(_cached(cascade), {})
+        # ... and falls back to the last member
+        first.status = '404 Not Found'
+        second.status = '200 OK'
+        self._call(cascade)
+        second.status = '404 Not Found'
+        self.assertEqual(self._call(cascade), (['200 OK'], b'third'))
+
+    def test_caught_member_writes(self):
+        first = StatusApp('404 Not Found', write=b'ignored')
+        second = StatusApp('200 OK', b'second')
+        cascade = self._makeOne([first, second])
+        self.assertEqual(self._call(cascade), (['200 OK'], b'second'))
+
+    def test_catch_statuses(self):
+        first = StatusApp('403 Forbidden')
+        second = StatusApp('200 OK', b'second')
+        cascade = self._makeOne([first, second], catch=['403', 404])
+        self.assertEqual(self._call(cascade), (['200 OK'], b'second'))
+
+    def test_cache_bounded(self):
+        first = StatusApp('404 Not Found')
+        second = StatusApp('200 OK')
+        cascade = self._makeOne([first, second, StatusApp('200 OK')],
+                                cache_size=2)
+        for path in ('/a', '/b', '/c'):
+            self._call(cascade, PATH_INFO=path)
+        self.assertEqual([key[2] for key in _cached(cascade)], ['/b', '/c'])
+        # A hit spares '/b' from the next eviction.
+        self._call(cascade, PATH_INFO='/b')
+        self.assertEqual([key[2] for key in _cached(cascade)], ['/b', '/c'])
+        self._call(cascade, PATH_INFO='/d')
+        self.assertEqual([key[2] for key in _cached(cascade)], ['/b', '/d'])
+        self._call(cascade, PATH_INFO='/e')
+        self.assertEqual([key[2] for key in _cached(cascade)], ['/d', '/e'])
+
+    def test_cache_disabled(self):
+        cascade = self._makeOne([StatusApp('404 Not Found'),
+                                 StatusApp('200 OK')], cache_size=0)
+        self._call(cascade)
+        self.assertEqual(_cached(cascade), {})
+
+    def test_mutations_invalidate(self):
+        first = StatusApp('404 Not Found')
+        second = StatusApp('200 OK', b'second')
+        third = StatusApp('200 OK', b'third')
+        cascade = self._makeOne([first, second])
+        self._call(cascade)
+        cascade.append(third)
+        self.assertEqual(_cached(cascade), {})
+        self.assertEqual(cascade.apps, (first, second, third))
+        self._call(cascade)
+        cascade.remove(second)
+        self.assertEqual(_cached(cascade), {})
+        self.assertEqual(self._call(cascade), (['200 OK'], b'third'))
+        cascade.apps = [second]
+        self.assertEqual(_cached(cascade), {})
+
+    def test_stale_generation_not_remembered(self):
+        cascade = self._makeOne([StatusApp('200 OK')])
+        cascade._remember(0, 'key', 1)
+        self.assertEqual(_cached(cascade), {})
+        cascade._remember(1, 'key', 1)
+        cascade._forget(0, 'key')
+        self.assertEqual(_cached(cascade), {'key': 1})
+
+    def test_request_body_replayed(self):
+        from io import BytesIO
+        first = StatusApp('404 Not Found')
+        second = StatusApp('200 OK')
+        cascade = self._makeOne([first, second], spool_size=4)
+        self._call(cascade, REQUEST_METHOD='POST', CONTENT_LENGTH='10',
+                   **{'wsgi.input': BytesIO(b'0123456789trailing')})
+        self.assertEqual(first.bodies, [b'0123456789'])
+        self.assertEqual(second.bodies, [b'0123456789'])
+
+    def test_request_body_short_or_invalid_length(self):
+        from io import BytesIO
+        first = StatusApp('404 Not Found')
+        second = StatusApp('200 OK')
+        cascade = self._makeOne([first, second])
+        self._call(cascade, REQUEST_METHOD='POST', CONTENT_LENGTH='10',
+                   **{'wsgi.input': BytesIO(b'012')})
+        self.assertEqual(second.bodies, [b'012'])
+        self._call(cascade, REQUEST_METHOD='POST', CONTENT_LENGTH='bogus',
+                   **{'wsgi.input': BytesIO(b'012')})
+        self.assertEqual(second.bodies[-1], b'')
+
+
+def _cached(cascade):
+    """ Return the cascade's cache, as an ordered ``{key: index}`` dict.
+    """
+    from collections import OrderedDict
+    return OrderedDict((key, entry[0])
+                       for key, entry in cascade._state[2].items())
+
+
+class Test_cascade_factory(unittest.TestCase):
+
+    def _callFUT(self, loader, global_conf, **local_conf):
+        from ..cascade import cascade_factory
+        return cascade_factory(loader, global_conf, **local_conf)
+
+    def test_it(self):
+        _APP1, _APP2 = object(), object()
+        loader = DummyLoader(xxx=_APP1, yyy=_APP2)
+        cascade = self._callFUT(loader, {}, app2='xxx', app1='yyy',
+                                catch='404 403', cache_size='10')
+        self.assertEqual(cascade.apps, (_APP2, _APP1))
+        self.assertEqual(cascade.catch, frozenset([403, 404]))
+        self.assertEqual(cascade.cache_size, 10)
+
+    def test_wo_apps(self):
+        self.assertRaises(ValueError, self._callFUT, DummyLoader(), {})
+
+
+class StatusApp(object):
+
+    closed = False
+
+    def __init__(self, status, body=b'', write=None):
+        self.status = status
+        self.body = body
+        self.write = write
+        self.calls = 0
+        self.bodies = []
+
+    def __call__(self, environ, start_response):
+        self.calls += 1
+        length = environ.get('CONTENT_LENGTH', '')
+        if 'wsgi.input' in environ:
+            self.bodies.append(environ['wsgi.input'].read(
+                int(length) if length.isdigit() else 0))
+        write = start_response(self.status, [('Content-Type', 'text/plain')])
+        if self.write is not None:
+            write(self.write)
+        return _Body(self, self.body)
+
+
+class _Body(list):
+
+    def __init__(self, app, body):
+        super(_Body, self).__init__([body])
+        self.app = app
+
+    def close(self):
+        self.app.closed = True
+
+
+class DummyLoader(dict):
+
+    def get_app(self, spec, global_conf):
+        return self[spec]
+
+
+def _makeEnviron(**kw):
+    environ = {
+        'HTTP_HOST': 'example.com',
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': '/foo',
+        'wsgi.url_scheme': 'http',
+    }
+    environ.update(kw)
+    return environ
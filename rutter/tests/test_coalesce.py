@@ -0,0 +1,260 @@
+import threading
+import time
+import unittest
+
+
+class CoalesceTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from ..coalesce import Coalesce
+        return Coalesce
+
+    def _makeOne(self, app, **kw):
+        return self._getTargetClass()(app, **kw)
+
+    def _call(self, coalesce, environ):
+        started = []
+        written = []
+        def _start_response(status, headers, exc_info=None):
+            started.append((status, headers))
+            return written.append
+        iterable = coalesce(environ, _start_response)
+        try:
+            body = b''.join(written + list(iterable))
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+        return started, body
+
+    def _concurrently(self, coalesce, app, environs):
+        """ Run ``environs`` through ``coalesce`` at once.
+
+        ``app`` blocks its first call until all of the others are waiting.
+        """
+        results = [None] * len(environs)
+        def _request(i):
+            results[i] = self._call(coalesce, environs[i])
+        threads = [threading.Thread(target=_request, args=(i,))
+                   for i in range(len(environs))]
+        for thread in threads:
+            thread.start()
+        def _all_waiting():
+            flights = list(coalesce._flights.values())
+            return app.calls and (not flights or sum(
+                flight.followers for flight in flights)
+                >= len(environs) - len(flights))
+        _waitFor(_all_waiting)
+        app.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_coalesces_identical_requests(self):
+        app = BlockingApp()
+        coalesce = self._makeOne(app)
+        results = self._concurrently(
+            coalesce, app, [_makeEnviron() for _ in range(5)])
+        self.assertEqual(app.calls, 1)
+        for started, body in results:
+            self.assertEqual(started, [('200 OK',
+                                        [('Content-Type', 'text/plain')])])
+            self.assertEqual(body, b'hello, world')
+        self.assertEqual(coalesce._flights, {})
+        self.assertTrue(app.closed)
+
+    def test_distinct_requests_not_coalesced(self):
+        app = BlockingApp()
+        app.release.set()
+        coalesce = self._makeOne(app, vary=['HTTP_ACCEPT'])
+        environs = [_makeEnviron(),
+                    _makeEnviron(PATH_INFO='/other'),
+                    _makeEnviron(QUERY_STRING='q=1'),
+                    _makeEnviron(HTTP_ACCEPT='text/html'),
+                    _makeEnviron(REQUEST_METHOD='HEAD'),
+                    _makeEnviron(**{'wsgi.url_scheme': 'https'}),
+                   ]
+        for environ in environs:
+            self._call(coalesce, environ)
+        self.assertEqual(app.calls, 6)
+        key = coalesce._key(_makeEnviron(HTTP_ACCEPT='text/html',
+                                         HTTP_HOST='Example.COM'))
+        self.assertEqual(key, ('GET', 'http', 'example.com', '', '/foo', '',
+                               'text/html'))
+        del environs[0]['HTTP_HOST']
+        environs[0]['SERVER_NAME'] = 'Example.com'
+        self.assertEqual(coalesce._key(environs[0])[2], 'example.com')
+
+    def test_unsafe_method_passes_through(self):
+        app = BlockingApp()
+        app.release.set()
+        coalesce = self._makeOne(app)
+        started, body = self._call(coalesce,
+                                   _makeEnviron(REQUEST_METHOD='POST'))
+        self.assertEqual(body, b'hello, world')
+        self.assertEqual(coalesce._flights, {})
+
+    def test_private_requests_pass_through_unless_varied(self):
+        app = BlockingApp()
+        app.release.set()
+        coalesce = self._makeOne(app)
+        self.assertEqual(coalesce._key(_makeEnviron(HTTP_COOKIE='a=b')), None)
+        self._call(coalesce, _makeEnviron(HTTP_AUTHORIZATION='Basic xxx'))
+        self.assertEqual(app.calls, 1)
+        coalesce = self._makeOne(app, vary=['HTTP_COOKIE'])
+        self.assertEqual(coalesce._key(_makeEnviron(HTTP_COOKIE='a=b'))[-1],
+                         'a=b')
+
+    def test_large_response_not_shared(self):
+        app = BlockingApp(chunks=[b'x' * 10, b'y' * 10, b'z'])
+        coalesce = self._makeOne(app, max_size=15)
+        results = self._concurrently(
+            coalesce, app, [_makeEnviron() for _ in range(3)])
+        self.assertEqual(app.calls, 3)
+        for started, body in results:
+            self.assertEqual(body, b'x' * 10 + b'y' * 10 + b'z')
+
+    def test_set_cookie_not_shared(self):
+        app = BlockingApp(headers=[('Set-Cookie', 'session=abc')])
+        coalesce = self._makeOne(app)
+        results = self._concurrently(
+            coalesce, app, [_makeEnviron() for _ in range(3)])
+        self.assertEqual(app.calls, 3)
+
+    def test_unlisted_vary_not_shared(self):
+        app = BlockingApp(headers=[('Vary', 'Accept, Accept-Encoding')])
+        coalesce = self._makeOne(app, vary=['HTTP_ACCEPT'])
+        results = self._concurrently(
+            coalesce, app, [_makeEnviron() for _ in range(3)])
+        self.assertEqual(app.calls, 3)
+
+    def test_listed_vary_shared(self):
+        app = BlockingApp(headers=[('Vary', 'accept-encoding, ,Content-Type')])
+        coalesce = self._makeOne(
+            app, vary=['HTTP_ACCEPT_ENCODING', 'CONTENT_TYPE'])
+        results = self._concurrently(
+            coalesce, app, [_makeEnviron() for _ in range(3)])
+        self.assertEqual(app.calls, 1)
+
+    def test_exc_info_not_shared(self):
+        app = BlockingApp(exc_info=True)
+        coalesce = self._makeOne(app)
+        results = self._concurrently(
+            coalesce, app, [_makeEnviron() for _ in range(2)])
+        self.assertEqual(app.calls, 2)
+
+    def test_write_callable_captured(self):
+        app = BlockingApp(write=b'written;')
+        coalesce = self._makeOne(app)
+        results = self._concurrently(
+            coalesce, app, [_makeEnviron() for _ in range(3)])
+        self.assertEqual(app.calls, 1)
+        for started, body in results:
+            self.assertEqual(body, b'written;hello, world')
+
+    def test_leader_error(self):
+        app = BlockingApp(error=True)
+        coalesce = self._makeOne(app)
+        errors = []
+        def _request():
+            try:
+                self._call(coalesce, _makeEnviron())
+            except ValueError as e:
+                errors.append(e)
+        threads = [threading.Thread(target=_request) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        app.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(coalesce._flights, {})
+        self.assertTrue(app.closed)
+
+    def test_follower_timeout(self):
+        app = BlockingApp()
+        coalesce = self._makeOne(app, timeout=0.01)
+        leader = threading.Thread(target=self._call,
+                                  args=(coalesce, _makeEnviron()))
+        leader.start()
+        _waitFor(lambda: app.calls)
+        started = []
+        def _start_response(status, headers, exc_info=None):
+            started.append(status)
+        # The follower gives up waiting, and calls the (released) app.
+        app.release_after_first = True
+        result = coalesce(_makeEnviron(), _start_response)
+        self.assertEqual(b''.join(result), b'hello, world')
+        self.assertEqual(app.calls, 2)
+        app.release.set()
+        leader.join()
+
+
+def _waitFor(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while True:
+        time.sleep(0.001)
+        if predicate() or time.time() > deadline:
+            return
+
+
+class BlockingApp(object):
+
+    closed = False
+    release_after_first = False
+
+    def __init__(self, chunks=(b'hello, ', b'world'), headers=(),
+                 exc_info=False, write=None, error=False):
+        self.release = threading.Event()
+        self.calls = 0
+        self.chunks = chunks
+        self.headers = [('Content-Type', 'text/plain')] + list(headers)
+        self.exc_info = exc_info
+        self.write = write
+        self.error = error
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.calls += 1
+            first = self.calls == 1
+        if first or not self.release_after_first:
+            self.release.wait(5)
+        exc_info = None
+        if self.exc_info:
+            try:
+                raise ValueError('testing')
+            except ValueError:
+                import sys
+                exc_info = sys.exc_info()
+        write = start_response('200 OK', self.headers, exc_info)
+        if self.write:
+            write(self.write)
+        return _Body(self)
+
+
+class _Body(object):
+
+    def __init__(self, app):
+        self.app = app
+
+    def __iter__(self):
+        if self.app.error:
+            raise ValueError('testing')
+        return iter(self.app.chunks)
+
+    def close(self):
+        self.app.closed = True
+
+
+def _makeEnviron(**kw):
+    environ = {
+        'HTTP_HOST': 'example.com',
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': '/foo',
+        'wsgi.url_scheme': 'http',
+    }
+    environ.update(kw)
+    return environ
@@ -0,0 +1,296 @@
+import unittest
+
+_BODY = b'{"items": [%s]}' % b', '.join(b'%d' % i for i in range(200))
+
+
+def _gunzip(data):
+    import zlib
+    return zlib.decompress(data, 31)
+
+
+class Test__gzip_etag(unittest.TestCase):
+
+    def _callFUT(self, etag):
+        from ..compress import _gzip_etag
+        return _gzip_etag(etag)
+
+    def test_it(self):
+        self.assertEqual(self._callFUT('"abc"'), '"abc-gz"')
+        self.assertEqual(self._callFUT('W/"abc"'), 'W/"abc"')
+        self.assertEqual(self._callFUT(None), None)
+
+
+class Test__add_vary(unittest.TestCase):
+
+    def _callFUT(self, headers):
+        from ..compress import _add_vary
+        return _add_vary(headers)
+
+    def test_it(self):
+        self.assertEqual(self._callFUT([]), [('Vary', 'Accept-Encoding')])
+        self.assertEqual(self._callFUT([('Vary', 'Cookie')]),
+                         [('Vary', 'Cookie, Accept-Encoding')])
+        self.assertEqual(self._callFUT([('vary', 'accept-encoding')]),
+                         [('vary', 'accept-encoding')])
+        self.assertEqual(self._callFUT([('Vary', '*')]), [('Vary', '*')])
+
+
+class CompressTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from ..compress import Compress
+        return Compress
+
+    def _makeOne(self, app, **kw):
+        return self._getTargetClass()(app, **kw)
+
+    def _call(self, compress, **kw):
+        environ = {'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '/api',
+                   'PATH_INFO': '/items', 'HTTP_ACCEPT_ENCODING': 'gzip'}
+        environ.update(kw)
+        started = []
+        written = []
+        def _start_response(status, headers, exc_info=None):
+            started.append((status, dict(headers)))
+            return written.append
+        iterable = compress(environ, _start_response)
+        body = b''.join(iterable)
+        iterable.close()
+        self.assertEqual(len(started), 1)
+        return started[0][0], started[0][1], b''.join(written) + body
+
+    def test_compresses_incrementally(self):
+        app = DummyApp(chunks=[_BODY[:100], b'', _BODY[100:]])
+        status, headers, body = self._call(self._makeOne(app))
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertFalse('Content-Length' in headers)
+        self.assertEqual(_gunzip(body), _BODY)
+        self.assertTrue(app.closed)
+
+    def test_not_accepted(self):
+        app = DummyApp()
+        compress = self._makeOne(app)
+        status, headers, body = self._call(compress, HTTP_ACCEPT_ENCODING='')
+        self.assertEqual(body, _BODY)
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(headers['Content-Length'], str(len(_BODY)))
+        # Not compressible:  no Vary
+        app.headers = [('Content-Type', 'image/png')]
+        status, headers, body = self._call(compress, HTTP_ACCEPT_ENCODING='')
+        self.assertFalse('Vary' in headers)
+
+    def test_head(self):
+        app = DummyApp()
+        status, headers, body = self._call(self._makeOne(app),
+                                           REQUEST_METHOD='HEAD')
+        self.assertFalse('Content-Encoding' in headers)
+
+    def test_not_compressible(self):
+        compress = self._makeOne(DummyApp())
+        for headers in ([('Content-Type', 'image/png')],
+                        [],
+                        [('Content-Type', 'text/plain'),
+                         ('Content-Encoding', 'br')],
+                        [('Content-Type', 'text/plain'),
+                         ('Cache-Control', 'public, no-transform')],
+                        [('Content-Type', 'text/plain'),
+                         ('Content-Length', '10')]):
+            compress.app.headers = headers
+            status, got, body = self._call(compress)
+            self.assertFalse(got.get('Content-Encoding') == 'gzip', headers)
+            self.assertEqual(body, _BODY)
+        compress.app.status = '204 No Content'
+        compress.app.headers = [('Content-Type', 'text/plain')]
+        status, got, body = self._call(compress)
+        self.assertFalse('Content-Encoding' in got)
+
+    def test_w_charset_and_bogus_length(self):
+        app = DummyApp(headers=[('Content-Type', 'Text/HTML; charset=utf-8'),
+                                ('Content-Length', 'bogus')])
+        status, headers, body = self._call(self._makeOne(app))
+        self.assertEqual(_gunzip(body), _BODY)
+
+    def test_w_write(self):
+        app = DummyApp(write=_BODY[:50], chunks=[_BODY[50:]])
+        status, headers, body = self._call(self._makeOne(app, level=1))
+        self.assertEqual(_gunzip(body), _BODY)
+
+    def test_lazy_start_response(self):
+        app = DummyApp(lazy=True, chunks=[_BODY[:10], _BODY[10:]])
+        status, headers, body = self._call(self._makeOne(app))
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(_gunzip(body), _BODY)
+
+    def test_lazy_start_response_not_compressible(self):
+        app = DummyApp(lazy=True, headers=[('Content-Type', 'image/png')],
+                       chunks=[_BODY[:10], _BODY[10:]])
+        status, headers, body = self._call(self._makeOne(app))
+        self.assertEqual(body, _BODY)
+
+    def test_cache_by_etag(self):
+        app = DummyApp(headers=[('Content-Type', 'application/json'),
+                                ('ETag', '"v1"')])
+        compress = self._makeOne(app)
+        status, headers, first = self._call(compress)
+        self.assertEqual(headers['ETag'], '"v1-gz"')
+        self.assertEqual(list(compress._cache), [('/api/items', '"v1"')])
+        app.chunks = [b'ignored']
+        status, headers, second = self._call(compress)
+        self.assertEqual(second, first)
+        self.assertEqual(headers['Content-Length'], str(len(first)))
+        self.assertTrue(app.closed)
+        # Other paths are cached separately.
+        status, headers, other = self._call(compress, PATH_INFO='/other')
+        self.assertEqual(_gunzip(other), b'ignored')
+
+    def test_cache_keyed_by_query_and_host(self):
+        app = DummyApp(headers=[('Content-Type', 'application/json'),
+                                ('ETag', '"v42"')])
+        compress = self._makeOne(app)
+        self._call(compress, QUERY_STRING='page=1')
+        app.chunks = [b'page 2']
+        status, headers, body = self._call(compress, QUERY_STRING='page=2')
+        self.assertEqual(_gunzip(body), b'page 2')
+        app.chunks = [b'other host']
+        status, headers, body = self._call(compress, QUERY_STRING='page=2',
+                                           HTTP_HOST='other.example.com')
+        self.assertEqual(_gunzip(body), b'other host')
+        self.assertEqual(sorted(key[0] for key in compress._cache), [
+            '/api/items?page=1', '/api/items?page=2',
+            'other.example.com/api/items?page=2'])
+
+    def test_cache_hit_w_lazy_start_response(self):
+        app = DummyApp(headers=[('Content-Type', 'application/json'),
+                                ('ETag', '"v1"')])
+        compress = self._makeOne(app)
+        status, headers, first = self._call(compress)
+        app.lazy = True
+        app.chunks = [b'ignored']
+        status, headers, second = self._call(compress)
+        self.assertEqual(second, first)
+
+    def test_cache_w_write(self):
+        app = DummyApp(headers=[('Content-Type', 'application/json'),
+                                ('ETag', '"v1"')], write=b'written')
+        compress = self._makeOne(app)
+        status, headers, first = self._call(compress)
+        self.assertEqual(_gunzip(first), b'written' + _BODY)
+        status, headers, second = self._call(compress)
+        self.assertEqual(_gunzip(second), b'written' + _BODY)
+
+    def test_not_cached_weak_etag(self):
+        app = DummyApp(headers=[('Content-Type', 'application/json'),
+                                ('ETag', 'W/"v1"')])
+        compress = self._makeOne(app)
+        status, headers, body = self._call(compress)
+        self.assertEqual(headers['ETag'], 'W/"v1"')
+        self.assertEqual(compress._cache, {})
+
+    def test_not_cached_too_large(self):
+        import os
+        app = DummyApp(headers=[('Content-Type', 'application/json'),
+                                ('ETag', '"v1"')],
+                       chunks=[os.urandom(1000), os.urandom(1000)])
+        compress = self._makeOne(app, cache_body_size=1500)
+        self._call(compress)
+        self.assertEqual(compress._cache, {})
+
+    def test_cache_bounded(self):
+        app = DummyApp(headers=[('Content-Type', 'application/json'),
+                                ('ETag', '"v1"')])
+        compress = self._makeOne(app, cache_entries=2)
+        for path in ('/a', '/b', '/a', '/c'):
+            self._call(compress, PATH_INFO=path)
+        self.assertEqual([key[0] for key in compress._cache],
+                         ['/api/a', '/api/c'])
+        compress._cache_put(('/api/c', '"v1"'), b'xx')
+        self.assertEqual(compress._cached_bytes,
+                         sum(len(body) for body in compress._cache.values()))
+        compress.cache_bytes = 0
+        compress._cache_put(('/api/d', '"v1"'), b'xx')
+        self.assertEqual(compress._cache, {})
+        self.assertEqual(compress._cached_bytes, 0)
+
+    def test_conditional(self):
+        app = DummyApp(headers=[('Content-Type', 'application/json'),
+                                ('ETag', '"v1"')])
+        status, headers, body = self._call(
+            self._makeOne(app), HTTP_IF_NONE_MATCH='"v1-gz"')
+        self.assertEqual(app.environ['HTTP_IF_NONE_MATCH'], '"v1"')
+        self.assertEqual(status, '304 Not Modified')
+        self.assertEqual(headers['ETag'], '"v1-gz"')
+        self.assertEqual(body, b'')
+
+    def test_not_modified_wo_etag(self):
+        app = DummyApp(status='304 Not Modified', chunks=[])
+        status, headers, body = self._call(
+            self._makeOne(app), HTTP_IF_MODIFIED_SINCE='yesterday')
+        self.assertFalse('ETag' in headers)
+
+
+class Test_compress_factory(unittest.TestCase):
+
+    def test_it(self):
+        from ..compress import compress_factory
+        app = object()
+        compress = compress_factory(app, level='9', min_size='10',
+                                    cache_entries='3', cache_bytes='100',
+                                    cache_body_size='50')
+        self.assertTrue(compress.app is app)
+        self.assertEqual((compress.level, compress.min_size,
+                          compress.cache_entries, compress.cache_bytes,
+                          compress.cache_body_size),
+                         (9, 10, 3, 100, 50))
+
+
+class DummyApp(object):
+
+    closed = False
+    environ = None
+
+    def __init__(self, status='200 OK', headers=None, chunks=None,
+                 write=None, lazy=False):
+        self.status = status
+        if headers is None:
+            headers = [('Content-Type', 'application/json'),
+                       ('Content-Length', str(len(_BODY)))]
+        self.headers = headers
+        self.chunks = [_BODY] if chunks is None else chunks
+        self.write = write
+        self.lazy = lazy
+
+    def __call__(self, environ, start_response):
+        self.environ = environ
+        if environ.get('HTTP_IF_NONE_MATCH') == '"v1"':
+            self.status = '304 Not Modified'
+            self.chunks = []
+        if self.lazy:
+            return _LazyBody(self, start_response)
+        write = start_response(self.status, list(self.headers))
+        if self.write is not None:
+            write(self.write)
+        return _Body(self, self.chunks)
+
+
+class _Body(list):
+
+    def __init__(self, app, chunks):
+        super(_Body, self).__init__(chunks)
+        self.app = app
+
+    def close(self):
+        self.app.closed = True
+
+
+class _LazyBody(object):
+
+    def __init__(self, app, start_response):
+        self.app = app
+        self.start_response = start_response
+
+    def __iter__(self):
+        self.start_response(self.app.status, list(self.app.headers))
+        for chunk in self.app.chunks:
+            yield chunk
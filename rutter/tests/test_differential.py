@@ -0,0 +1,224 @@
+""" Differential tests:  compiled dispatch vs. the reference linear scan.
+
+Random mount sets and requests (hosts, ports, schemes, odd paths) are
+dispatched through both ``URLMap._match`` and ``URLMap._match_linear``,
+which must agree on the target application, ``SCRIPT_NAME`` and
+``PATH_INFO``.
+"""
+import random
+import timeit
+import unittest
+
+_SEEDS = range(100)
+_SEGMENTS = ('a', 'b', 'ab', 'a.b', 'b-', '%20', 'A')
+_DOMAINS = (None, None, None, '', 'example.com', 'example.com:80',
+            'example.com:8080', 'example.com:443', 'other.org')
+_HOSTS = ('example.com', 'Example.COM', 'example.com:80', 'example.com:8080',
+          'example.com:443', 'other.org', 'other.org:80', 'nonesuch.net',
+          None)
+_SCHEMES = ('http', 'https')
+
+
+def _random_path(rnd, max_depth=4):
+    segments = [rnd.choice(_SEGMENTS)
+                for _ in range(rnd.randint(0, max_depth))]
+    path = '/' + '/'.join(segments)
+    if rnd.random() < 0.2:
+        path += '/'
+    if rnd.random() < 0.1:
+        path = path.replace('/', '//', 1)
+    if path == '/' and rnd.random() < 0.3:
+        path = ''
+    return path
+
+
+def _random_mounts(rnd, count):
+    mounts = []
+    for _ in range(count):
+        domain = rnd.choice(_DOMAINS)
+        path = _random_path(rnd, 3)
+        if domain is None:
+            key = path
+        elif rnd.random() < 0.5:
+            key = (domain, path)
+        else:
+            key = 'http://%s%s' % (domain, path or '/')
+        mounts.append(key)
+    return mounts
+
+
+def _random_environ(rnd):
+    environ = {
+        'SCRIPT_NAME': rnd.choice(('', '', '/base')),
+        'PATH_INFO': _random_path(rnd),
+        'SERVER_NAME': rnd.choice(('example.com', 'other.org')),
+        'wsgi.url_scheme': rnd.choice(_SCHEMES),
+    }
+    host = rnd.choice(_HOSTS)
+    if host is not None:
+        environ['HTTP_HOST'] = host
+    return environ
+
+
+def _target(name):
+    def app(environ, start_response):
+        return name, environ['SCRIPT_NAME'], environ['PATH_INFO']
+    return app
+
+
+def _makeMaps(mounts):
+    from ..urlmap import URLMap
+
+    class ReferenceURLMap(URLMap):
+        _match = URLMap._match_linear
+
+    not_found = _target('<not found>')
+    fast, reference = URLMap(not_found), ReferenceURLMap(not_found)
+    for i, key in enumerate(mounts):
+        app = _target('app-%d' % i)
+        fast[key] = reference[key] = app
+    return fast, reference
+
+
+def _makeNestedMaps(rnd, depth=0):
+    """ Return ``(fast, reference)``:  random maps, some mounting others.
+
+    The reference maps are opaque to their parents, which call them just
+    like any other application.
+    """
+    from ..urlmap import URLMap
+
+    class OpaqueURLMap(URLMap):
+        pass
+
+    name = '<not found %d-%d>' % (depth, rnd.randint(0, 1 << 30))
+    fast, reference = URLMap(_target(name)), OpaqueURLMap(_target(name))
+    for i, key in enumerate(_random_mounts(rnd, rnd.randint(0, 12))):
+        if depth < 2 and rnd.random() < 0.3:
+            fast[key], reference[key] = _makeNestedMaps(rnd, depth + 1)
+        else:
+            fast[key] = reference[key] = _target('app-%d-%d' % (depth, i))
+    return fast, reference
+
+
+class DifferentialTests(unittest.TestCase):
+
+    def _assertSame(self, fast, reference, environ):
+        self.assertEqual(fast(environ.copy(), None),
+                         reference(environ.copy(), None),
+                         'mounts: %r\nenviron: %r' % (fast.keys(), environ))
+
+    def test_random_mounts_and_requests(self):
+        for seed in _SEEDS:
+            rnd = random.Random(seed)
+            fast, reference = _makeMaps(
+                _random_mounts(rnd, rnd.randint(0, 30)))
+            for _ in range(50):
+                self._assertSame(fast, reference, _random_environ(rnd))
+
+    def test_random_mutations(self):
+        for seed in _SEEDS:
+            rnd = random.Random(seed)
+            mounts = _random_mounts(rnd, 20)
+            fast, reference = _makeMaps(mounts)
+            for _ in range(10):
+                key = rnd.choice(mounts)
+                if key in fast and rnd.random() < 0.5:
+                    del fast[key]
+                    del reference[key]
+                else:
+                    fast[key] = reference[key] = _target(repr(key))
+                for _ in range(10):
+                    self._assertSame(fast, reference, _random_environ(rnd))
+
+    def test_random_nested_maps(self):
+        for seed in _SEEDS:
+            rnd = random.Random(seed)
+            fast, reference = _makeNestedMaps(rnd)
+            for _ in range(50):
+                self._assertSame(fast, reference, _random_environ(rnd))
+
+    def test_random_resolve_many(self):
+        for seed in _SEEDS:
+            rnd = random.Random(seed)
+            fast, _ = _makeNestedMaps(rnd)
+            pairs = [(rnd.choice(_HOSTS) or 'example.com', _random_path(rnd))
+                     for _ in range(50)]
+            pairs.extend(rnd.sample(pairs, 10))
+            for scheme in _SCHEMES:
+                self.assertEqual(
+                    fast.resolve_many(pairs, scheme),
+                    [fast.resolve(host, path, scheme)
+                     for host, path in pairs],
+                    'mounts: %r' % (fast.keys(),))
+
+    def test_non_latin1_domains(self):
+        # Domain-less mounts sort as if their domain were '\xff'.
+        from ..urlmap import _RouteTable
+        mounts = [('ā.example.com', '/foo'), '/bar', ('\xfe', '/foo')]
+        mounts.extend('/filler/%d' % i for i in range(_RouteTable.SCAN_LIMIT))
+        fast, reference = _makeMaps(mounts)
+        for host in ('ā.example.com', '\xfe', 'example.com'):
+            for path in ('/foo', '/bar', '/baz'):
+                environ = {'HTTP_HOST': host, 'SCRIPT_NAME': '',
+                           'PATH_INFO': path, 'wsgi.url_scheme': 'http'}
+                self._assertSame(fast, reference, environ)
+
+
+class PerformanceGateTests(unittest.TestCase):
+
+    def _timeMatches(self, match, requests, number=5):
+        def _run():
+            for host, hostport, path_info in requests:
+                match(host, hostport, path_info)
+        return min(timeit.repeat(_run, number=number, repeat=5))
+
+    def test_compiled_not_slower_than_reference(self):
+        from ..urlmap import _normalize_url
+        rnd = random.Random(42)
+        fast, _ = _makeMaps(_random_mounts(rnd, 100))
+        requests = []
+        for _ in range(500):
+            environ = _random_environ(rnd)
+            requests.append(
+                (environ.get('HTTP_HOST', 'example.com').lower(),
+                 'example.com:80',
+                 _normalize_url(environ['PATH_INFO'], False)[1]))
+        compiled = self._timeMatches(fast._match, requests)
+        reference = self._timeMatches(fast._match_linear, requests)
+        self.assertTrue(compiled <= reference,
+                        'compiled: %.6fs, reference: %.6fs'
+                        % (compiled, reference))
+
+    def test_resolve_many_not_slower_than_resolve(self):
+        rnd = random.Random(42)
+        fast, _ = _makeMaps(_random_mounts(rnd, 100))
+        distinct = [(rnd.choice(_HOSTS) or 'example.com', _random_path(rnd))
+                    for _ in range(200)]
+        pairs = [rnd.choice(distinct) for _ in range(2000)]
+
+        def _loop():
+            for host, path in pairs:
+                fast.resolve(host, path)
+        batched = min(timeit.repeat(lambda: fast.resolve_many(pairs),
+                                    number=5, repeat=5))
+        looped = min(timeit.repeat(_loop, number=5, repeat=5))
+        self.assertTrue(batched <= looped,
+                        'batched: %.6fs, looped: %.6fs' % (batched, looped))
+
+    def test_resolve_many_distinct_not_slower_than_resolve(self):
+        rnd = random.Random(42)
+        fast, _ = _makeMaps(_random_mounts(rnd, 100))
+        # E.g., an access log:  hardly any pair repeats.
+        pairs = [(rnd.choice(_HOSTS) or 'example.com',
+                  '%s/items/%d' % (_random_path(rnd, 2), i))
+                 for i in range(2000)]
+
+        def _loop():
+            for host, path in pairs:
+                fast.resolve(host, path)
+        batched = min(timeit.repeat(lambda: fast.resolve_many(pairs),
+                                    number=5, repeat=5))
+        looped = min(timeit.repeat(_loop, number=5, repeat=5))
+        self.assertTrue(batched <= looped,
+                        'batched: %.6fs, looped: %.6fs' % (batched, looped))
@@ -0,0 +1,288 @@
+import unittest
+
+
+class MountPoolTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from ..lazy import MountPool
+        return MountPool
+
+    def _makeOne(self, **kw):
+        return self._getTargetClass()(**kw)
+
+    def test_touch_wo_limits(self):
+        pool = self._makeOne()
+        mounts = [DummyMount() for _ in range(3)]
+        for mount in mounts:
+            pool.touch(mount)
+        self.assertEqual(len(pool), 3)
+        self.assertEqual([mount.evicted for mount in mounts], [0, 0, 0])
+
+    def test_touch_w_max_loaded(self):
+        pool = self._makeOne(max_loaded=2)
+        first, second, third = DummyMount(), DummyMount(), DummyMount()
+        pool.touch(first)
+        pool.touch(second)
+        pool.touch(first)  # now 'second' is least recently used
+        pool.touch(third)
+        self.assertEqual(len(pool), 2)
+        self.assertEqual([first.evicted, second.evicted, third.evicted],
+                         [0, 1, 0])
+
+    def test_touch_w_idle_ttl(self):
+        clock = DummyClock()
+        pool = self._makeOne(idle_ttl=10, clock=clock)
+        first, second, third = DummyMount(), DummyMount(), DummyMount()
+        pool.touch(first)
+        clock.now = 5
+        pool.touch(second)
+        clock.now = 12
+        pool.touch(third)
+        self.assertEqual([first.evicted, second.evicted, third.evicted],
+                         [1, 0, 0])
+        self.assertEqual(len(pool), 2)
+
+    def test_sweep(self):
+        clock = DummyClock()
+        pool = self._makeOne(idle_ttl=10, clock=clock)
+        first, second = DummyMount(), DummyMount()
+        pool.touch(first)
+        pool.touch(second)
+        pool.sweep()
+        self.assertEqual([first.evicted, second.evicted], [0, 0])
+        clock.now = 11
+        pool.sweep()
+        self.assertEqual([first.evicted, second.evicted], [1, 1])
+        self.assertEqual(len(pool), 0)
+
+    def test_sweeper(self):
+        import time
+        clock = DummyClock()
+        pool = self._makeOne(idle_ttl=10, clock=clock, sweep_interval=0.01)
+        self.addCleanup(pool.close)
+        mount = DummyMount()
+        pool.touch(mount)
+        clock.now = 11
+        deadline = time.monotonic() + 5
+        while not mount.evicted and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(mount.evicted, 1)
+        self.assertEqual(len(pool), 0)
+
+    def test_sweeper_started_once_per_process(self):
+        import os
+        pool = self._makeOne(sweep_interval=60)
+        started = []
+
+        def _start_sweeper():
+            started.append(os.getpid())
+            pool._sweeper_pid = os.getpid()
+
+        pool._start_sweeper = _start_sweeper
+        pool.touch(DummyMount())
+        pool.touch(DummyMount())
+        self.assertEqual(started, [os.getpid()])
+        pool._sweeper_pid = -1  # as if inherited across a fork
+        pool.touch(DummyMount())
+        self.assertEqual(started, [os.getpid()] * 2)
+
+    def test_close_stops_sweeper(self):
+        import threading
+        pool = self._makeOne(sweep_interval=60)
+        before = set(threading.enumerate())
+        pool.touch(DummyMount())
+        sweeper, = set(threading.enumerate()) - before
+        self.assertTrue(sweeper.daemon)
+        pool.close()
+        sweeper.join(5)
+        self.assertFalse(sweeper.is_alive())
+
+    def test_discard(self):
+        pool = self._makeOne()
+        mount = DummyMount()
+        pool.touch(mount)
+        pool.discard(mount)
+        pool.discard(mount)
+        self.assertEqual(len(pool), 0)
+
+
+class LazyMountTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from ..lazy import LazyMount
+        return LazyMount
+
+    def _makeOne(self, factory=None, pool=None):
+        if factory is None:
+            factory = AppFactory()
+        return self._getTargetClass()(factory, pool)
+
+    def _call(self, mount, path='/'):
+        started = []
+        iterable = mount({'PATH_INFO': path},
+                         lambda status, headers: started.append(status))
+        return iterable, started
+
+    def test_loads_on_first_request(self):
+        factory = AppFactory()
+        mount = self._makeOne(factory)
+        self.assertFalse(mount.loaded)
+        self.assertEqual(factory.made, [])
+        iterable, started = self._call(mount)
+        self.assertEqual(list(iterable), [b'OK'])
+        self.assertEqual(started, ['200 OK'])
+        iterable.close()
+        iterable.close()  # idempotent
+        self.assertTrue(mount.loaded)
+        self._call(mount)[0].close()
+        self.assertEqual(len(factory.made), 1)
+        self.assertTrue(factory.made[0].iterables[0].closed)
+
+    def test_evict_idle(self):
+        factory = AppFactory()
+        mount = self._makeOne(factory)
+        self._call(mount)[0].close()
+        mount.evict()
+        self.assertFalse(mount.loaded)
+        self.assertTrue(factory.made[0].closed)
+        self._call(mount)[0].close()
+        self.assertEqual(len(factory.made), 2)
+        mount.evict()
+        mount.evict()  # already unloaded
+
+    def test_evict_w_app_wo_close(self):
+        def _factory():
+            return lambda environ, start_response: []
+        mount = self._makeOne(_factory)
+        self._call(mount)[0].close()
+        mount.evict()
+        self.assertFalse(mount.loaded)
+
+    def test_evict_in_flight(self):
+        factory = AppFactory()
+        mount = self._makeOne(factory)
+        first, _ = self._call(mount)
+        second, _ = self._call(mount)
+        mount.evict()
+        self.assertTrue(mount.loaded)  # requests in flight
+        first.close()
+        self.assertTrue(mount.loaded)
+        self.assertFalse(factory.made[0].closed)
+        second.close()
+        self.assertFalse(mount.loaded)
+        self.assertTrue(factory.made[0].closed)
+
+    def test_request_cancels_pending_eviction(self):
+        factory = AppFactory()
+        mount = self._makeOne(factory)
+        first, _ = self._call(mount)
+        mount.evict()
+        second, _ = self._call(mount)
+        first.close()
+        second.close()
+        self.assertTrue(mount.loaded)
+        self.assertEqual(len(factory.made), 1)
+
+    def test_w_pool(self):
+        from ..lazy import MountPool
+        pool = MountPool(max_loaded=1)
+        first, second = self._makeOne(pool=pool), self._makeOne(pool=pool)
+        self._call(first)[0].close()
+        self.assertEqual(len(pool), 1)
+        self._call(second)[0].close()
+        self.assertFalse(first.loaded)
+        self.assertTrue(second.loaded)
+        self.assertEqual(len(pool), 1)
+
+    def test_w_pool_evicting_in_flight(self):
+        from ..lazy import MountPool
+        pool = MountPool(max_loaded=1)
+        first, second = self._makeOne(pool=pool), self._makeOne(pool=pool)
+        pending, _ = self._call(first)
+        self._call(second)[0].close()
+        self.assertTrue(first.loaded)
+        pending.close()
+        self.assertFalse(first.loaded)
+        self.assertEqual(len(pool), 1)
+
+    def test_app_raises(self):
+        def _factory():
+            def _app(environ, start_response):
+                raise RuntimeError('boom')
+            return _app
+        mount = self._makeOne(_factory)
+        with self.assertRaises(RuntimeError):
+            self._call(mount)
+        mount.evict()
+        self.assertFalse(mount.loaded)  # the failed request was released
+
+    def test_factory_called_once_under_contention(self):
+        import threading
+        factory = AppFactory()
+        mount = self._makeOne(factory)
+        barrier = threading.Barrier(8)
+
+        def _request():
+            barrier.wait()
+            self._call(mount)[0].close()
+        threads = [threading.Thread(target=_request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(factory.made), 1)
+
+
+class DummyClock(object):
+
+    now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class DummyMount(object):
+
+    evicted = 0
+
+    def evict(self):
+        self.evicted += 1
+
+
+class DummyIterable(object):
+
+    closed = False
+
+    def __iter__(self):
+        return iter([b'OK'])
+
+    def close(self):
+        self.closed = True
+
+
+class DummyApp(object):
+
+    closed = False
+
+    def __init__(self):
+        self.iterables = []
+
+    def __call__(self, environ, start_response):
+        start_response('200 OK', [])
+        iterable = DummyIterable()
+        self.iterables.append(iterable)
+        return iterable
+
+    def close(self):
+        self.closed = True
+
+
+class AppFactory(object):
+
+    def __init__(self):
+        self.made = []
+
+    def __call__(self):
+        app = DummyApp()
+        self.made.append(app)
+        return app
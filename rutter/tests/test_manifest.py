@@ -0,0 +1,216 @@
+import unittest
+
+
+class Test_resolve_app_spec(unittest.TestCase):
+
+    def _callFUT(self, spec):
+        from ..manifest import resolve_app_spec
+        return resolve_app_spec(spec)
+
+    def test_w_module_attr(self):
+        self.assertTrue(self._callFUT('rutter.tests.test_manifest:_APP')
+                        is _APP)
+
+    def test_w_module_dotted_attr(self):
+        self.assertTrue(
+            self._callFUT('rutter.tests.test_manifest:_Holder.app') is _APP)
+
+    def test_w_invalid(self):
+        self.assertRaises(ValueError, self._callFUT, 'rutter.tests')
+        self.assertRaises(ValueError, self._callFUT, ':app')
+
+    def test_w_egg_hit(self):
+        import os
+        import shutil
+        import sys
+        import tempfile
+        tmpdir = tempfile.mkdtemp()
+        try:
+            distinfo = os.path.join(tmpdir, 'fakeapp-1.0.dist-info')
+            os.mkdir(distinfo)
+            with open(os.path.join(distinfo, 'METADATA'), 'w') as f:
+                f.write('Metadata-Version: 2.1\nName: fakeapp\nVersion: 1.0\n')
+            with open(os.path.join(distinfo, 'entry_points.txt'), 'w') as f:
+                f.write('[paste.app_factory]\n'
+                        'main = rutter.tests.test_manifest:_app_factory\n'
+                        'other = rutter.tests.test_manifest:_app_factory\n')
+            sys.path.insert(0, tmpdir)
+            try:
+                self.assertTrue(self._callFUT('egg:fakeapp') is _APP)
+                self.assertTrue(self._callFUT('egg:fakeapp#other') is _APP)
+                self.assertRaises(LookupError,
+                                  self._callFUT, 'egg:fakeapp#nonesuch')
+            finally:
+                sys.path.remove(tmpdir)
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class Test_iter_manifest(unittest.TestCase):
+
+    def _callFUT(self, text, format='jsonl'):
+        from io import StringIO
+        from ..manifest import iter_manifest
+        return list(iter_manifest(StringIO(text), format, 'test.manifest'))
+
+    def test_jsonl(self):
+        text = '\n'.join([
+            '# comment',
+            '{"path": "/foo", "app": "foo"}',
+            '',
+            '{"path": "/bar/", "domain": "example.com", "app": "bar"}',
+            '{"path": "/baz", "domain": "example.com", "port": 8080,'
+            ' "app": "baz"}',
+            '{"domain": "example.com", "app": "root"}',
+        ])
+        self.assertEqual(self._callFUT(text),
+                         [((None, '/foo'), 'foo'),
+                          (('example.com', '/bar'), 'bar'),
+                          (('example.com:8080', '/baz'), 'baz'),
+                          (('example.com', ''), 'root'),
+                         ])
+
+    def test_csv(self):
+        text = ('path,domain,port,app\n'
+                '/foo,,,foo\n'
+                '/bar,example.com,8080,bar\n')
+        self.assertEqual(self._callFUT(text, 'csv'),
+                         [((None, '/foo'), 'foo'),
+                          (('example.com:8080', '/bar'), 'bar'),
+                         ])
+
+    def test_csv_wo_header(self):
+        self.assertRaises(ValueError, self._callFUT, '', 'csv')
+        self.assertRaises(ValueError, self._callFUT, '/foo,foo\n', 'csv')
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, self._callFUT, '', 'xml')
+
+    def _assertError(self, text, message, format='jsonl'):
+        try:
+            self._callFUT(text, format)
+        except ValueError as e:
+            self.assertTrue(str(e).startswith(message), str(e))
+        else:  # pragma: NO COVER
+            self.fail('ValueError not raised')
+
+    def test_errors_name_line(self):
+        good = '{"path": "/foo", "app": "foo"}\n'
+        self._assertError(good + '{"path": ', 'test.manifest:2: invalid JSON')
+        self._assertError(good + '[]', 'test.manifest:2: entry must be')
+        self._assertError(good + '{"path": "/x"}',
+                          "test.manifest:2: missing 'app'")
+        self._assertError(good + '{"app": "x", "weight": 1}',
+                          'test.manifest:2: unknown fields: weight')
+        self._assertError(good + '{"path": 5, "app": "x"}',
+                          "test.manifest:2: 'path' must be a string")
+        self._assertError(good + '{"path": ["/a"], "app": "x"}',
+                          "test.manifest:2: 'path' must be a string")
+        self._assertError(good + '{"app": 7}',
+                          "test.manifest:2: 'app' must be a string")
+        self._assertError(good + '{"app": " "}',
+                          "test.manifest:2: missing 'app'")
+        self._assertError(good + '{"domain": "x.com", "port": true, '
+                          '"app": "x"}',
+                          "test.manifest:2: 'port' must be a string or an "
+                          "integer")
+        self._assertError(good + '{"path": "/a domain b.com", "app": "x"}',
+                          "test.manifest:2: 'path' must not contain "
+                          "whitespace")
+        self._assertError('path,domain,app\n/a,x.com port 80,x\n',
+                          "test.manifest:2: 'domain' must not contain "
+                          "whitespace", 'csv')
+        self._assertError(good + '{"port": 80, "app": "x"}',
+                          'test.manifest:2: If you give a port')
+        self._assertError(good + '{"path": "x", "app": "x"}',
+                          'test.manifest:2: URL fragments must start')
+        self._assertError('path,app\n/foo,foo\nfoo,foo\n',
+                          'test.manifest:3: URL fragments', 'csv')
+        self._assertError('path,app\n/foo,foo\n/bar,bar,extra\n',
+                          'test.manifest:3: too many columns', 'csv')
+
+    def test_streams(self):
+        from io import StringIO
+        from ..manifest import iter_manifest
+        fp = StringIO('{"path": "/foo", "app": "foo"}\n'
+                      '{"path": "/bar", "app": "bar"}\n')
+        entries = iter_manifest(fp)
+        self.assertEqual(next(entries), ((None, '/foo'), 'foo'))
+        self.assertEqual(fp.tell(), len('{"path": "/foo", "app": "foo"}\n'))
+
+
+class Test_load_manifest(unittest.TestCase):
+
+    def _callFUT(self, urlmap, source, *args, **kw):
+        from ..manifest import load_manifest
+        return load_manifest(urlmap, source, *args, **kw)
+
+    def _makeMap(self):
+        from ..urlmap import URLMap
+        return URLMap()
+
+    def _writeFile(self, name, text):
+        import os
+        import shutil
+        import tempfile
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        filename = os.path.join(tmpdir, name)
+        with open(filename, 'w') as f:
+            f.write(text)
+        return filename
+
+    def test_w_file_object_default_resolver(self):
+        from io import StringIO
+        urlmap = self._makeMap()
+        fp = StringIO(
+            '{"path": "/foo", "app": "rutter.tests.test_manifest:_APP"}\n')
+        self._callFUT(urlmap, fp)
+        self.assertTrue(urlmap['/foo'] is _APP)
+
+    def test_w_file_object_explicit_format(self):
+        from io import StringIO
+        urlmap = self._makeMap()
+        apps = {'foo': object(), 'bar': object()}
+        fp = StringIO('path,app\n/foo,foo\n/bar,bar\n')
+        self._callFUT(urlmap, fp, apps.__getitem__, format='csv')
+        self.assertEqual(urlmap.keys(), [(None, '/foo'), (None, '/bar')])
+
+    def test_w_jsonl_filename(self):
+        urlmap = self._makeMap()
+        apps = {'foo': object(), 'bar': object()}
+        filename = self._writeFile(
+            'mounts.jsonl',
+            '{"path": "/foo", "app": "foo"}\n'
+            '{"path": "/foo/bar", "app": "bar"}\n')
+        self._callFUT(urlmap, filename, apps.__getitem__)
+        self.assertTrue(urlmap['/foo'] is apps['foo'])
+        self.assertTrue(urlmap['/foo/bar'] is apps['bar'])
+
+    def test_w_csv_filename(self):
+        urlmap = self._makeMap()
+        apps = {'foo': object()}
+        filename = self._writeFile('mounts.CSV', 'path,app\n/foo,foo\n')
+        self._callFUT(urlmap, filename, apps.__getitem__)
+        self.assertTrue(urlmap['/foo'] is apps['foo'])
+
+    def test_w_invalid_entry_leaves_map_unchanged(self):
+        urlmap = self._makeMap()
+        existing = object()
+        urlmap['/existing'] = existing
+        filename = self._writeFile(
+            'mounts.jsonl',
+            '{"path": "/foo", "app": "foo"}\n'
+            '{"path": "/bar"}\n')
+        self.assertRaises(ValueError, self._callFUT,
+                          urlmap, filename, lambda spec: object())
+        self.assertEqual(urlmap.keys(), [(None, '/existing')])
+
+
+_APP = object()
+
+class _Holder(object):
+    app = _APP
+
+def _app_factory(global_conf, **local_conf):
+    return _APP
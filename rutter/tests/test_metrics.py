@@ -0,0 +1,415 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class _TempDir(object):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'metrics.bin')
+        self._opened = []
+
+    def tearDown(self):
+        for metrics in self._opened:
+            metrics.close()
+        shutil.rmtree(self.tmpdir)
+
+    def _create(self, labels=('/a', '/b'), **kw):
+        from ..metrics import SharedMetrics
+        metrics = SharedMetrics.create(self.path, labels, **kw)
+        self._opened.append(metrics)
+        return metrics
+
+    def _open(self):
+        from ..metrics import SharedMetrics
+        metrics = SharedMetrics.open(self.path)
+        self._opened.append(metrics)
+        return metrics
+
+
+_POSIX = os.name == 'posix'
+
+
+def _deadPid():
+    import subprocess
+    import sys
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+class SharedMetricsTests(_TempDir, unittest.TestCase):
+
+    def test_create_and_open(self):
+        self._create(workers=4, bounds=(0.5, 1.0))
+        metrics = self._open()
+        self.assertEqual(metrics.labels, ['/a', '/b'])
+        self.assertEqual(metrics.workers, 4)
+        self.assertEqual(metrics.bounds_ns, [500000000, 1000000000])
+
+    def test_open_invalid(self):
+        from ..metrics import SharedMetrics
+        with open(self.path, 'wb') as f:
+            f.write(b'NOTMETRICS' + b'\0' * 32)
+        with self.assertRaises(ValueError):
+            SharedMetrics.open(self.path)
+
+    def test_open_truncated(self):
+        from ..metrics import SharedMetrics
+        self._create().close()
+        self._opened.pop()
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 8)
+        with self.assertRaises(ValueError):
+            SharedMetrics.open(self.path)
+        with open(self.path, 'wb') as f:
+            f.write(b'RUT')
+        with self.assertRaises(ValueError):
+            SharedMetrics.open(self.path)
+
+    def test_create_replaces_atomically(self):
+        first = self._create()
+        first.record(0, 1)
+        second = self._create(labels=('/c',))
+        # The old mapping is intact, not truncated under its readers.
+        self.assertEqual(first.snapshot()['/a']['requests'], 1)
+        self.assertEqual(second.labels, ['/c'])
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['metrics.bin'])
+
+    def test_create_failure_leaves_no_temp_file(self):
+        from ..metrics import SharedMetrics
+        os.mkdir(self.path)
+        with self.assertRaises(OSError):
+            SharedMetrics.create(self.path, ['/a'])
+        self.assertEqual(os.listdir(self.tmpdir), ['metrics.bin'])
+
+    def test_open_or_create_missing(self):
+        from ..metrics import SharedMetrics
+        metrics = SharedMetrics.open_or_create(self.path, ['/a'], workers=2)
+        self._opened.append(metrics)
+        self.assertEqual(metrics.labels, ['/a'])
+
+    def test_open_or_create_matching(self):
+        from ..metrics import SharedMetrics
+        first = self._create(workers=2, bounds=(1.0,))
+        first.record(0, 1)
+        second = SharedMetrics.open_or_create(self.path, ('/a', '/b'),
+                                              workers=2, bounds=(1.0,))
+        self._opened.append(second)
+        second._forked()  # as if another worker
+        second.record(0, 1)
+        self.assertEqual(first.snapshot()['/a']['requests'], 2)
+
+    def test_open_or_create_incompatible(self):
+        from ..metrics import SharedMetrics
+        first = self._create(workers=2)
+        first.record(0, 1)
+        for kw in ({'labels': ['/a']}, {'labels': ['/a', '/b']},
+                   {'labels': ['/a', '/b'], 'workers': 4}):
+            second = SharedMetrics.open_or_create(self.path, **kw)
+            self._opened.append(second)
+            self.assertEqual(second.snapshot()['/a']['requests'], 0)
+
+    def test_open_or_create_invalid(self):
+        from ..metrics import SharedMetrics
+        with open(self.path, 'wb') as f:
+            f.write(b'garbage')
+        metrics = SharedMetrics.open_or_create(self.path, ['/a'])
+        self._opened.append(metrics)
+        self.assertEqual(metrics.labels, ['/a'])
+
+    def test_snapshot_empty(self):
+        metrics = self._create(bounds=(1.0,))
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['/a'], {
+            'requests': 0,
+            'errors': 0,
+            'latency_seconds': 0.0,
+            'buckets': [[1.0, 0], [None, 0]],
+        })
+
+    def test_record_and_snapshot(self):
+        metrics = self._create(bounds=(0.001, 0.01))
+        metrics.record(0, 500000)
+        metrics.record(0, 1000000)  # bounds are inclusive
+        metrics.record(0, 20000000, error=True)
+        metrics.record(1, 5000000)
+        snapshot = self._open().snapshot()  # as seen by another reader
+        self.assertEqual(snapshot['/a']['requests'], 3)
+        self.assertEqual(snapshot['/a']['errors'], 1)
+        self.assertAlmostEqual(snapshot['/a']['latency_seconds'], 0.0215)
+        self.assertEqual(snapshot['/a']['buckets'],
+                         [[0.001, 2], [0.01, 2], [None, 3]])
+        self.assertEqual(snapshot['/b']['buckets'],
+                         [[0.001, 0], [0.01, 1], [None, 1]])
+
+    def test_rows_per_process(self):
+        first = self._create(workers=4)
+        second = self._open()
+        first.record(0, 1)
+        second._forked()  # as if another process
+        second._row = None
+        words = second._words
+        words[second._owners] = _deadPid() + 1000000  # not ours
+        second.record(0, 1)
+        self.assertNotEqual(first._row, second._row)
+        self.assertEqual(first.snapshot()['/a']['requests'], 2)
+
+    def test_claim_reuses_own_row(self):
+        metrics = self._create(workers=2)
+        metrics.record(0, 1)
+        row = metrics._row
+        metrics._forked()
+        metrics.record(0, 1)
+        self.assertEqual(metrics._row, row)
+
+    @unittest.skipUnless(_POSIX, 'needs POSIX process probing')
+    def test_claim_reclaims_dead_workers_row(self):
+        metrics = self._create(workers=2)
+        dead, alive = _deadPid(), os.getppid()
+        metrics._words[metrics._owners] = dead
+        metrics._words[metrics._owners + 1] = alive
+        metrics._words[metrics._data] = 5  # the dead worker's requests
+        metrics.record(0, 1)
+        self.assertEqual(metrics._row, metrics._data)
+        self.assertEqual(metrics._words[metrics._owners], os.getpid())
+        self.assertEqual(metrics.snapshot()['/a']['requests'], 6)
+
+    def test_claim_wo_fcntl_does_not_probe_processes(self):
+        from .. import metrics as MUT
+        metrics = self._create(workers=2)
+        dead = _deadPid()
+        metrics._words[metrics._owners] = dead
+        metrics._words[metrics._owners + 1] = dead
+        probed = []
+        _saved = MUT.fcntl, MUT._alive
+        MUT.fcntl, MUT._alive = None, probed.append
+        try:
+            metrics.record(0, 1)
+        finally:
+            MUT.fcntl, MUT._alive = _saved
+        self.assertEqual(probed, [])
+        self.assertEqual(metrics._row, metrics._data + (
+            os.getpid() % 2) * metrics._row_size)
+
+    def test_claim_shares_a_row_when_full(self):
+        metrics = self._create(workers=2)
+        metrics._words[metrics._owners] = os.getppid()
+        metrics._words[metrics._owners + 1] = os.getppid()
+        metrics.record(0, 1)
+        self.assertEqual(metrics._row, metrics._data + (
+            os.getpid() % 2) * metrics._row_size)
+
+    def test_after_fork_resets_open_instances(self):
+        from .. import metrics as MUT
+        metrics = self._create()
+        metrics.record(0, 1)
+        closed = self._create()
+        closed.close()
+        self._opened.remove(closed)
+        MUT._after_fork()
+        self.assertEqual(metrics._row, None)
+        self.assertFalse(closed in MUT._instances)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs os.fork')
+    def test_across_forked_workers(self):
+        metrics = self._create(workers=4)
+        metrics.record(1, 1)
+        pids = []
+        for i in range(3):
+            pid = os.fork()
+            if pid == 0:  # pragma: NO COVER child process
+                try:
+                    metrics.record(0, 1000)
+                    metrics.record(1, 1000, error=True)
+                finally:
+                    os._exit(0)
+            pids.append(pid)
+        for pid in pids:
+            os.waitpid(pid, 0)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['/a']['requests'], 3)
+        self.assertEqual(snapshot['/b']['requests'], 4)
+        self.assertEqual(snapshot['/b']['errors'], 3)
+
+
+@unittest.skipUnless(_POSIX, 'needs POSIX process probing')
+class Test__alive(unittest.TestCase):
+
+    def _callFUT(self, pid):
+        from ..metrics import _alive
+        return _alive(pid)
+
+    def test_it(self):
+        self.assertTrue(self._callFUT(os.getpid()))
+        self.assertFalse(self._callFUT(_deadPid()))
+
+    def test_other_users_process(self):
+        from .. import metrics as MUT
+
+        def _kill(pid, signal):
+            raise PermissionError(pid)
+        _saved, MUT.os.kill = MUT.os.kill, _kill
+        try:
+            self.assertTrue(self._callFUT(1))
+        finally:
+            MUT.os.kill = _saved
+
+
+class Test_mount_label(unittest.TestCase):
+
+    def _callFUT(self, dom_url):
+        from ..metrics import mount_label
+        return mount_label(dom_url)
+
+    def test_it(self):
+        self.assertEqual(self._callFUT((None, '/foo')), '/foo')
+        self.assertEqual(self._callFUT((None, '')), '/')
+        self.assertEqual(self._callFUT(('example.com', '')),
+                         'http://example.com/')
+        self.assertEqual(self._callFUT(('example.com:8080', '/foo')),
+                         'http://example.com:8080/foo')
+
+
+class Test_instrument(_TempDir, unittest.TestCase):
+
+    def _callFUT(self, urlmap, **kw):
+        from ..metrics import instrument
+        metrics = instrument(urlmap, self.path, **kw)
+        self._opened.append(metrics)
+        return metrics
+
+    def _makeMap(self):
+        from ..urlmap import URLMap
+        urlmap = URLMap(StatusApp('404 Not Found'))
+        urlmap['/ok'] = StatusApp('200 OK')
+        urlmap['http://example.com/fail'] = StatusApp('503 Unavailable')
+        return urlmap
+
+    def _request(self, urlmap, path, host='example.com'):
+        environ = {'HTTP_HOST': host, 'SCRIPT_NAME': '', 'PATH_INFO': path,
+                   'wsgi.url_scheme': 'http'}
+        iterable = urlmap(environ, lambda status, headers, exc_info=None:
+                          None)
+        body = b''.join(iterable)
+        iterable.close()
+        iterable.close()  # recorded only once
+        return body
+
+    def test_it(self):
+        urlmap = self._makeMap()
+        metrics = self._callFUT(urlmap, workers=2)
+        self.assertEqual(metrics.labels,
+                         ['http://example.com/fail', '/ok', '<not found>'])
+        self.assertEqual(self._request(urlmap, '/ok/x'), b'200 OK')
+        self._request(urlmap, '/ok')
+        self._request(urlmap, '/fail')
+        self._request(urlmap, '/nonesuch')
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['/ok']['requests'], 2)
+        self.assertEqual(snapshot['/ok']['errors'], 0)
+        self.assertEqual(snapshot['http://example.com/fail']['errors'], 1)
+        self.assertEqual(snapshot['<not found>']['requests'], 1)
+        self.assertEqual(snapshot['<not found>']['errors'], 0)
+        self.assertEqual(snapshot['/ok']['buckets'][-1][1], 2)
+
+    def test_reuses_existing_file(self):
+        # E.g., each worker loads the application, rather than the master.
+        first = self._makeMap()
+        metrics = self._callFUT(first)
+        self._request(first, '/ok')
+        self._request(first, '/ok')
+        second = self._makeMap()
+        self._callFUT(second)
+        self._request(second, '/ok')
+        self.assertEqual(metrics.snapshot()['/ok']['requests'], 3)
+
+    def test_app_raises(self):
+        from ..urlmap import URLMap
+
+        def _raising(environ, start_response):
+            raise RuntimeError('boom')
+        urlmap = URLMap()
+        urlmap['/boom'] = _raising
+        metrics = self._callFUT(urlmap)
+        with self.assertRaises(RuntimeError):
+            self._request(urlmap, '/boom')
+        self.assertEqual(metrics.snapshot()['/boom']['errors'], 1)
+
+    def test_app_never_starts_response(self):
+        from ..urlmap import URLMap
+        urlmap = URLMap()
+        urlmap['/silent'] = lambda environ, start_response: []
+        metrics = self._callFUT(urlmap)
+        self._request(urlmap, '/silent')
+        self.assertEqual(metrics.snapshot()['/silent']['errors'], 1)
+
+    def test_closes_app_iterable(self):
+        from ..urlmap import URLMap
+        closed = []
+
+        class _Body(list):
+            def close(self):
+                closed.append(True)
+
+        def _app(environ, start_response):
+            start_response('200 OK', [])
+            return _Body([b'x'])
+        urlmap = URLMap()
+        urlmap['/x'] = _app
+        self._callFUT(urlmap)
+        self._request(urlmap, '/x')
+        self.assertEqual(closed, [True])
+
+
+class MetricsAppTests(_TempDir, unittest.TestCase):
+
+    def test_it(self):
+        import json
+        from ..metrics import MetricsApp
+        app = MetricsApp(self.path)  # file need not exist yet
+        metrics = self._create()
+        metrics.record(0, 1000)
+        started = []
+        body = b''.join(app({}, lambda status, headers:
+                            started.append((status, headers))))
+        self.assertEqual(started[0][0], '200 OK')
+        self.assertEqual(dict(started[0][1])['Content-Type'],
+                         'application/json')
+        self.assertEqual(json.loads(body.decode('utf-8'))['/a']['requests'],
+                         1)
+        mapped = app._metrics
+        app({}, lambda status, headers: None)  # reuses the mapping
+        self.assertTrue(app._metrics is mapped)
+        app._metrics.close()
+
+    def test_reopens_replaced_file(self):
+        import json
+        from ..metrics import MetricsApp
+        app = MetricsApp(self.path)
+        self._create(labels=('/a',))
+        app({}, lambda status, headers: None)
+        self._create(labels=('/a', '/b'))  # e.g., after a deploy
+        body = b''.join(app({}, lambda status, headers: None))
+        self.assertEqual(sorted(json.loads(body.decode('utf-8'))),
+                         ['/a', '/b'])
+        app._metrics.close()
+
+    def test_factory(self):
+        from ..metrics import metrics_factory
+        app = metrics_factory({'here': self.tmpdir}, 'metrics.bin')
+        self.assertEqual(app.path, self.path)
+        app = metrics_factory({}, self.path)
+        self.assertEqual(app.path, self.path)
+
+
+class StatusApp(object):
+
+    def __init__(self, status):
+        self.status = status
+
+    def __call__(self, environ, start_response):
+        start_response(self.status, [])
+        return [self.status.encode('ascii')]
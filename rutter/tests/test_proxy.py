@@ -0,0 +1,329 @@
+import unittest
+
+
+class _StandIn(object):
+    """ Local HTTP/1.1 server standing in for an upstream service.
+    """
+    def __init__(self):
+        import json
+        import threading
+        import time
+        from http.server import BaseHTTPRequestHandler
+        from http.server import ThreadingHTTPServer
+        requests = self.requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _read_body(self):
+                if self.headers.get('Transfer-Encoding') == 'chunked':
+                    chunks = []
+                    while True:
+                        size = int(self.rfile.readline().strip(), 16)
+                        chunk = self.rfile.read(size + 2)[:size]
+                        if not size:
+                            return b''.join(chunks)
+                        chunks.append(chunk)
+                return self.rfile.read(
+                    int(self.headers.get('Content-Length') or 0))
+
+            def _respond(self):
+                body = self._read_body()
+                requests.append((self.client_address, self.command,
+                                 self.path, dict(self.headers), body))
+                if self.path.startswith('/slow'):
+                    time.sleep(0.5)
+                if self.path.startswith('/chunked'):
+                    self.send_response(200)
+                    self.send_header('Transfer-Encoding', 'chunked')
+                    self.send_header('Connection', 'x-hop')
+                    self.send_header('X-Hop', 'dropped')
+                    self.end_headers()
+                    for chunk in (b'one', b'two', b''):
+                        self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                    return
+                payload = json.dumps({'method': self.command,
+                                      'path': self.path,
+                                      'body': body.decode('latin-1')})
+                payload = payload.encode('utf-8')
+                self.send_response(201)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                if self.path.startswith('/close'):
+                    self.send_header('Connection', 'close')
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(payload)
+                if self.path.startswith('/drop'):
+                    # Close without telling the client.
+                    self.close_connection = True
+
+            do_GET = do_POST = do_PUT = do_HEAD = _respond
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       kwargs={'poll_interval': 0.05})
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+class ProxyMountTests(unittest.TestCase):
+
+    def setUp(self):
+        self.upstream = _StandIn()
+
+    def tearDown(self):
+        self.upstream.stop()
+
+    def _getTargetClass(self):
+        from ..proxy import ProxyMount
+        return ProxyMount
+
+    def _makeOne(self, path='', **kw):
+        mount = self._getTargetClass()(
+            'http://127.0.0.1:%d%s' % (self.upstream.port, path), **kw)
+        self.addCleanup(mount.close)
+        return mount
+
+    def _call(self, mount, body=None, **kw):
+        import io
+        import json
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'SCRIPT_NAME': '/svc',
+            'PATH_INFO': '/items',
+            'HTTP_HOST': 'example.com',
+            'REMOTE_ADDR': '10.0.0.1',
+            'wsgi.url_scheme': 'https',
+            'wsgi.input': io.BytesIO(body or b''),
+        }
+        if body is not None:
+            environ['CONTENT_LENGTH'] = str(len(body))
+        environ.update(kw)
+        started = []
+        def _start_response(status, headers):
+            started.append((status, headers))
+        iterable = mount(environ, _start_response)
+        chunks = list(iterable)
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+        status, headers = started[0]
+        payload = b''.join(chunks)
+        if payload and dict(headers).get('Content-Type') == (
+                'application/json'):
+            payload = json.loads(payload.decode('utf-8'))
+        return status, headers, payload
+
+    def test_ctor_w_invalid_upstream(self):
+        self.assertRaises(ValueError, self._getTargetClass(),
+                          'ftp://example.com/')
+
+    def test_ctor_w_https(self):
+        import http.client
+        mount = self._getTargetClass()('https://example.com/base/')
+        self.assertTrue(mount._pool.connection_class
+                        is http.client.HTTPSConnection)
+        self.assertEqual(mount.path, '/base')
+        self.assertEqual(mount.host, 'example.com')
+
+    def test_get(self):
+        mount = self._makeOne('/base/', pool_size=2)
+        status, headers, payload = self._call(
+            mount, QUERY_STRING='a=1&b=2', PATH_INFO='/it ems/ä',
+            HTTP_X_FORWARDED_FOR='192.0.2.1', HTTP_CONNECTION='X-Secret',
+            HTTP_X_SECRET='s', HTTP_KEEP_ALIVE='300', HTTP_ACCEPT='*/*')
+        self.assertEqual(status, '201 Created')
+        self.assertEqual(payload['path'],
+                         '/base/it%20ems/%C3%A4?a=1&b=2'.replace(
+                             '%C3%A4', '%E4'))
+        (_, method, _, sent, _), = self.upstream.requests
+        self.assertEqual(method, 'GET')
+        self.assertEqual(sent['Host'], '127.0.0.1:%d' % self.upstream.port)
+        self.assertEqual(sent['X-Forwarded-For'], '192.0.2.1, 10.0.0.1')
+        self.assertEqual(sent['X-Forwarded-Proto'], 'https')
+        self.assertEqual(sent['X-Forwarded-Host'], 'example.com')
+        self.assertEqual(sent['X-Forwarded-Prefix'], '/svc')
+        self.assertEqual(sent['Accept'], '*/*')
+        self.assertFalse('X-Secret' in sent)
+        self.assertFalse('Keep-Alive' in sent)
+        self.assertFalse('Accept-Encoding' in sent)
+
+    def test_reuses_connections(self):
+        mount = self._makeOne(pool_size=1)
+        for _ in range(3):
+            self.assertEqual(self._call(mount)[0], '201 Created')
+        clients = set(request[0] for request in self.upstream.requests)
+        self.assertEqual(len(clients), 1)
+
+    def test_pool_bounded(self):
+        mount = self._makeOne(pool_size=1)
+        first = mount({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/a',
+                       'wsgi.url_scheme': 'http'}, lambda *args: None)
+        second = mount({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/b',
+                        'wsgi.url_scheme': 'http'}, lambda *args: None)
+        for iterable in (first, second):
+            list(iterable)
+            iterable.close()
+            iterable.close()  # idempotent
+        self.assertEqual(len(mount._pool._idle), 1)
+
+    def test_connection_close(self):
+        mount = self._makeOne()
+        self.assertEqual(self._call(mount, PATH_INFO='/close')[0],
+                         '201 Created')
+        self.assertEqual(mount._pool._idle, [])
+
+    def test_unread_body_not_reused(self):
+        mount = self._makeOne()
+        iterable = mount({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/a',
+                          'wsgi.url_scheme': 'http'}, lambda *args: None)
+        iterable.close()
+        self.assertEqual(mount._pool._idle, [])
+
+    def test_stale_pooled_connection_retried(self):
+        import time
+        mount = self._makeOne()
+        self.assertEqual(self._call(mount, PATH_INFO='/drop')[0],
+                         '201 Created')
+        self.assertEqual(len(mount._pool._idle), 1)
+        time.sleep(0.1)
+        status, headers, payload = self._call(mount, PATH_INFO='/again')
+        self.assertEqual(status, '201 Created')
+        self.assertEqual(payload['path'], '/again')
+
+    def test_stale_pooled_connection_w_body(self):
+        import time
+        mount = self._makeOne()
+        self._call(mount, PATH_INFO='/drop')
+        time.sleep(0.1)
+        status, headers, payload = self._call(
+            mount, body=b'x', REQUEST_METHOD='POST', PATH_INFO='/again')
+        self.assertEqual(status, '502 Bad Gateway')
+
+    def test_stale_pooled_connection_wo_body_not_idempotent(self):
+        import time
+        mount = self._makeOne()
+        self._call(mount, PATH_INFO='/drop')
+        time.sleep(0.1)
+        status, headers, payload = self._call(
+            mount, REQUEST_METHOD='POST', PATH_INFO='/again')
+        self.assertEqual(status, '502 Bad Gateway')
+        self.assertEqual(len(self.upstream.requests), 1)
+
+    def test_stale_pooled_connections_retried_once(self):
+        import time
+        mount = self._makeOne()
+        stale = []
+        for path in ('/drop1', '/drop2'):
+            conn = mount._pool.connect()
+            conn.request('GET', path)
+            conn.getresponse().read()
+            stale.append(conn)
+        for conn in stale:
+            mount._pool.put(conn)
+        time.sleep(0.1)
+        status, headers, payload = self._call(mount, PATH_INFO='/again')
+        self.assertEqual(status, '201 Created')
+        # Retried on a fresh connection, rather than the other stale one.
+        self.assertEqual(len(mount._pool._idle), 2)
+        self.assertTrue(mount._pool._idle[0] is stale[0])
+
+    def test_post_streams_body(self):
+        mount = self._makeOne(block_size=3)
+        status, headers, payload = self._call(
+            mount, body=b'hello world', REQUEST_METHOD='POST',
+            CONTENT_TYPE='text/plain')
+        self.assertEqual(payload['body'], 'hello world')
+        sent = self.upstream.requests[0][3]
+        self.assertEqual(sent['Content-Length'], '11')
+        self.assertEqual(sent['Content-Type'], 'text/plain')
+
+    def test_post_short_body(self):
+        import io
+        mount = self._makeOne(read_timeout=0.2)
+        status, headers, payload = self._call(
+            mount, REQUEST_METHOD='POST', CONTENT_LENGTH='5',
+            **{'wsgi.input': io.BytesIO(b'abc')})
+        # The upstream waits for the rest of the body.
+        self.assertEqual(status, '504 Gateway Timeout')
+
+    def test_empty_path(self):
+        mount = self._makeOne()
+        status, headers, payload = self._call(mount, PATH_INFO='')
+        self.assertEqual(payload['path'], '/')
+
+    def test_chunked_request_body(self):
+        import io
+        mount = self._makeOne(block_size=4)
+        status, headers, payload = self._call(
+            mount, REQUEST_METHOD='PUT', HTTP_TRANSFER_ENCODING='chunked',
+            CONTENT_LENGTH='bogus',
+            **{'wsgi.input': io.BytesIO(b'streamed body'),
+               'wsgi.input_terminated': True})
+        self.assertEqual(payload['body'], 'streamed body')
+        sent = self.upstream.requests[0][3]
+        self.assertEqual(sent['Transfer-Encoding'], 'chunked')
+
+    def test_chunked_response(self):
+        mount = self._makeOne()
+        status, headers, payload = self._call(mount, PATH_INFO='/chunked')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(payload, b'onetwo')
+        names = [name.lower() for name, value in headers]
+        self.assertFalse('transfer-encoding' in names)
+        self.assertFalse('x-hop' in names)
+        self.assertEqual(len(mount._pool._idle), 1)
+
+    def test_head(self):
+        mount = self._makeOne()
+        status, headers, payload = self._call(mount, REQUEST_METHOD='HEAD')
+        self.assertEqual(status, '201 Created')
+        self.assertEqual(len(mount._pool._idle), 1)
+
+    def test_preserve_host(self):
+        mount = self._makeOne(preserve_host=True)
+        self._call(mount, SCRIPT_NAME='', REMOTE_ADDR='')
+        sent = self.upstream.requests[0][3]
+        self.assertEqual(sent['Host'], 'example.com')
+        self.assertFalse('X-Forwarded-Prefix' in sent)
+        self.assertFalse('X-Forwarded-For' in sent)
+
+    def test_read_timeout(self):
+        mount = self._makeOne(read_timeout=0.1)
+        self.assertEqual(self._call(mount, PATH_INFO='/slow')[0],
+                         '504 Gateway Timeout')
+
+    def test_refused(self):
+        mount = self._makeOne()
+        self.upstream.stop()
+        self.upstream = _Stopped()
+        self.assertEqual(self._call(mount)[0], '502 Bad Gateway')
+
+
+class Test_proxy_factory(unittest.TestCase):
+
+    def test_it(self):
+        from ..proxy import proxy_factory
+        mount = proxy_factory({}, 'http://127.0.0.1:9/', pool_size='3',
+                              connect_timeout='1', read_timeout='2',
+                              preserve_host='true')
+        self.assertEqual(mount._pool.size, 3)
+        self.assertEqual(mount._pool.connect_timeout, 1.0)
+        self.assertEqual(mount.read_timeout, 2.0)
+        self.assertTrue(mount.preserve_host)
+
+
+class _Stopped(object):
+
+    def stop(self):
+        pass
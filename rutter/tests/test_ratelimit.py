@@ -0,0 +1,100 @@
+import unittest
+
+
+class RateLimitTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from ..ratelimit import RateLimit
+        return RateLimit
+
+    def _makeOne(self, rate=2, **kw):
+        self.clock = DummyClock()
+        self.app = DummyApp()
+        return self._getTargetClass()(self.app, rate, clock=self.clock, **kw)
+
+    def _call(self, limiter, **environ):
+        started = []
+        def _start_response(status, headers):
+            started.append((status, headers))
+        body = limiter(environ, _start_response)
+        return started[0][0], dict(started[0][1]), b''.join(body)
+
+    def test_ctor_defaults(self):
+        limiter = self._makeOne(rate=0.5)
+        self.assertEqual(limiter.burst, 1.0)
+        self.assertEqual(limiter.key, None)
+        self.assertEqual(limiter.max_clients, 10000)
+        self.assertEqual(dict(limiter._headers)['Retry-After'], '2')
+
+    def test_ctor_w_invalid_rate(self):
+        self.assertRaises(ValueError, self._makeOne, rate=0)
+
+    def test_shared_bucket(self):
+        limiter = self._makeOne(rate=2, burst=3)
+        for _ in range(3):
+            self.assertEqual(self._call(limiter)[0], '200 OK')
+        status, headers, body = self._call(limiter)
+        self.assertEqual(status, '429 Too Many Requests')
+        self.assertEqual(headers['Retry-After'], '1')
+        self.assertEqual(headers['Content-Length'], str(len(body)))
+        self.assertEqual(self.app.calls, 3)
+        self.clock.now += 0.5  # refills one token
+        self.assertEqual(self._call(limiter)[0], '200 OK')
+        self.assertEqual(self._call(limiter)[0], '429 Too Many Requests')
+        self.clock.now += 100  # refills, up to the burst
+        for _ in range(3):
+            self.assertEqual(self._call(limiter)[0], '200 OK')
+        self.assertEqual(self._call(limiter)[0], '429 Too Many Requests')
+
+    def test_per_client(self):
+        limiter = self._makeOne(rate=1, key='REMOTE_ADDR')
+        self.assertEqual(self._call(limiter, REMOTE_ADDR='a')[0], '200 OK')
+        self.assertEqual(self._call(limiter, REMOTE_ADDR='a')[0],
+                         '429 Too Many Requests')
+        self.assertEqual(self._call(limiter, REMOTE_ADDR='b')[0], '200 OK')
+        self.assertEqual(self._call(limiter)[0], '200 OK')  # no key
+        self.assertEqual(list(limiter._buckets), ['a', 'b', ''])
+
+    def test_clients_bounded(self):
+        limiter = self._makeOne(rate=1, key='HTTP_X_API_KEY', max_clients=2)
+        for client in ('a', 'b', 'a', 'c'):
+            self._call(limiter, HTTP_X_API_KEY=client)
+        self.assertEqual(list(limiter._buckets), ['a', 'c'])
+
+
+class Test_ratelimit_factory(unittest.TestCase):
+
+    def _callFUT(self, app, **kw):
+        from ..ratelimit import ratelimit_factory
+        return ratelimit_factory(app, **kw)
+
+    def test_it(self):
+        app = object()
+        limiter = self._callFUT(app, rate='5', burst='10', key='REMOTE_ADDR',
+                                max_clients='100')
+        self.assertTrue(limiter.app is app)
+        self.assertEqual((limiter.rate, limiter.burst, limiter.key,
+                          limiter.max_clients),
+                         (5.0, 10.0, 'REMOTE_ADDR', 100))
+        self.assertEqual(self._callFUT(app, rate='5').burst, 5.0)
+
+    def test_wo_rate(self):
+        self.assertRaises(ValueError, self._callFUT, object())
+
+
+class DummyClock(object):
+
+    now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class DummyApp(object):
+
+    calls = 0
+
+    def __call__(self, environ, start_response):
+        self.calls += 1
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'OK']
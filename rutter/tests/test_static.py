@@ -0,0 +1,295 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class Test__parse_range(unittest.TestCase):
+
+    def _callFUT(self, value, size=100):
+        from ..static import _parse_range
+        return _parse_range(value, size)
+
+    def test_valid(self):
+        self.assertEqual(self._callFUT('bytes=0-9'), (0, 9))
+        self.assertEqual(self._callFUT('bytes=90-'), (90, 99))
+        self.assertEqual(self._callFUT('bytes=90-200'), (90, 99))
+        self.assertEqual(self._callFUT('bytes=-10'), (90, 99))
+        self.assertEqual(self._callFUT('bytes=-200'), (0, 99))
+
+    def test_unsatisfiable(self):
+        self.assertEqual(self._callFUT('bytes=100-'), False)
+        self.assertEqual(self._callFUT('bytes=-0'), False)
+
+    def test_unparseable(self):
+        for value in ('items=0-9', 'bytes=0-1,5-6', 'bytes=5', 'bytes=a-b',
+                      'bytes=9-5', 'bytes=--5'):
+            self.assertEqual(self._callFUT(value), None, value)
+
+
+class StaticMountTests(unittest.TestCase):
+
+    _TEXT = b'hello, world\n' * 100
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.docs = os.path.join(self.root, 'docs')
+        os.makedirs(os.path.join(self.docs, 'sub'))
+        self._write('docs/hello.txt', self._TEXT)
+        self._write('docs/sub/data.bin', bytes(range(256)) * 4)
+        self._write('docs/tiny.css', b'a{}')
+        self._write('secret.txt', b'secret')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _write(self, name, data):
+        with open(os.path.join(self.root, name), 'wb') as f:
+            f.write(data)
+
+    def _makeOne(self, **kw):
+        from ..static import StaticMount
+        return StaticMount(self.docs, **kw)
+
+    def _get(self, app, path, **kw):
+        environ = {'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '/static',
+                   'PATH_INFO': path}
+        environ.update(kw)
+        started = []
+        def _start_response(status, headers):
+            started.append((status, dict(headers)))
+        iterable = app(environ, _start_response)
+        try:
+            body = b''.join(iterable)
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+        status, headers = started[0]
+        return status, headers, body
+
+    def test_get_cached(self):
+        app = self._makeOne(max_age=60)
+        status, headers, body = self._get(app, '/hello.txt')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(body, self._TEXT)
+        self.assertEqual(headers['Content-Type'], 'text/plain')
+        self.assertEqual(headers['Content-Length'], str(len(self._TEXT)))
+        self.assertEqual(headers['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(headers['Accept-Ranges'], 'bytes')
+        self.assertTrue('Last-Modified' in headers)
+        self.assertEqual(list(app._cache), [os.path.join(app.directory,
+                                                         'hello.txt')])
+        # Served again from the cache.
+        entry = app._cache[os.path.join(app.directory, 'hello.txt')]
+        self.assertEqual(self._get(app, '/hello.txt')[2], self._TEXT)
+        self.assertTrue(app._cache[entry.path] is entry)
+
+    def test_get_gzip(self):
+        import gzip
+        app = self._makeOne()
+        status, headers, body = self._get(
+            app, '/hello.txt', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), self._TEXT)
+        self.assertEqual(headers['Content-Length'], str(len(body)))
+        self.assertTrue(headers['ETag'].endswith('-gz"'))
+        # Not compressed if it doesn't get smaller, or not compressible.
+        for path in ('/tiny.css', '/sub/data.bin'):
+            status, headers, body = self._get(
+                app, path, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertFalse('Content-Encoding' in headers)
+            self.assertFalse('Vary' in headers)
+        app = self._makeOne(gzip=False)
+        status, headers, body = self._get(
+            app, '/hello.txt', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse('Content-Encoding' in headers)
+
+    def test_get_head(self):
+        app = self._makeOne()
+        status, headers, body = self._get(app, '/hello.txt',
+                                          REQUEST_METHOD='HEAD')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(body, b'')
+        self.assertEqual(headers['Content-Length'], str(len(self._TEXT)))
+        app = self._makeOne(cache_file_size=10)
+        status, headers, body = self._get(app, '/hello.txt',
+                                          REQUEST_METHOD='HEAD')
+        self.assertEqual(body, b'')
+        self.assertEqual(headers['Content-Length'], str(len(self._TEXT)))
+
+    def test_post(self):
+        status, headers, body = self._get(self._makeOne(), '/hello.txt',
+                                          REQUEST_METHOD='POST')
+        self.assertEqual(status, '405 Method Not Allowed')
+        self.assertEqual(headers['Allow'], 'GET, HEAD')
+
+    def test_not_found(self):
+        app = self._makeOne()
+        for path in ('/nonesuch.txt', '/sub', '', '/../secret.txt',
+                     '/sub/../../secret.txt', '/a\0b'):
+            self.assertEqual(self._get(app, path)[0], '404 Not Found', path)
+
+    def test_symlink_escape(self):
+        os.symlink(os.path.join(self.root, 'secret.txt'),
+                   os.path.join(self.docs, 'link.txt'))
+        os.symlink(os.path.join(self.docs, 'hello.txt'),
+                   os.path.join(self.docs, 'inside.txt'))
+        app = self._makeOne()
+        self.assertEqual(self._get(app, '/link.txt')[0], '404 Not Found')
+        self.assertEqual(self._get(app, '/inside.txt')[2], self._TEXT)
+
+    def test_unreadable(self):
+        app = self._makeOne()
+        def _raise(path, st):
+            raise OSError('gone')
+        app._make_entry = _raise
+        self.assertEqual(self._get(app, '/hello.txt')[0], '404 Not Found')
+
+    def test_get_uncached_w_file_wrapper(self):
+        app = self._makeOne(cache_file_size=10, block_size=100)
+        wrapped = []
+        def _file_wrapper(f, block_size):
+            wrapped.append(block_size)
+            from ..static import _FileIter
+            return _FileIter(f, block_size)
+        status, headers, body = self._get(app, '/hello.txt',
+                                          **{'wsgi.file_wrapper':
+                                             _file_wrapper})
+        self.assertEqual(body, self._TEXT)
+        self.assertEqual(wrapped, [100])
+        self.assertEqual(app._cache, {})
+
+    def test_get_uncached_wo_file_wrapper(self):
+        app = self._makeOne(cache_file_size=10, block_size=100)
+        status, headers, body = self._get(app, '/sub/data.bin')
+        self.assertEqual(body, bytes(range(256)) * 4)
+        self.assertEqual(headers['Content-Type'], 'application/octet-stream')
+
+    def test_changed_while_reading_not_cached(self):
+        app = self._makeOne()
+        path = os.path.join(app.directory, 'hello.txt')
+        st = os.stat(path)
+        self._write('docs/hello.txt', b'changed')
+        entry = app._entry(path, st)
+        self.assertEqual(entry.body, None)
+        self.assertEqual(app._cache, {})
+
+    def test_cache_revalidates(self):
+        app = self._makeOne()
+        self._get(app, '/hello.txt')
+        self._write('docs/hello.txt', b'changed!')
+        path = os.path.join(app.directory, 'hello.txt')
+        os.utime(path, ns=(1, 1))
+        self.assertEqual(self._get(app, '/hello.txt')[2], b'changed!')
+        self.assertEqual(app._cached_bytes, len(b'changed!'))
+
+    def test_cache_bounds(self):
+        app = self._makeOne(cache_entries=1)
+        self._get(app, '/hello.txt')
+        self._get(app, '/tiny.css')
+        self.assertEqual([os.path.basename(path) for path in app._cache],
+                         ['tiny.css'])
+        self.assertEqual(app._cached_bytes, 3)
+        app = self._makeOne(cache_bytes=1024)
+        self._get(app, '/tiny.css')
+        self._get(app, '/sub/data.bin')
+        self.assertEqual([os.path.basename(path) for path in app._cache],
+                         ['data.bin'])
+        self._get(app, '/hello.txt')  # too large even alone
+        self.assertEqual(app._cache, {})
+        self.assertEqual(app._cached_bytes, 0)
+
+    def test_if_none_match(self):
+        app = self._makeOne()
+        etag = self._get(app, '/hello.txt')[1]['ETag']
+        gz_etag = etag[:-1] + '-gz"'
+        for value in (etag, '"other", ' + gz_etag, '*'):
+            status, headers, body = self._get(app, '/hello.txt',
+                                              HTTP_IF_NONE_MATCH=value)
+            self.assertEqual(status, '304 Not Modified')
+            self.assertEqual(body, b'')
+            self.assertEqual(headers['ETag'], etag)
+        status, _, _ = self._get(app, '/hello.txt',
+                                 HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(status, '200 OK')
+
+    def test_if_modified_since(self):
+        app = self._makeOne()
+        last_modified = self._get(app, '/hello.txt')[1]['Last-Modified']
+        status, _, _ = self._get(app, '/hello.txt',
+                                 HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(status, '304 Not Modified')
+        for value in ('Thu, 01 Jan 1970 00:00:00 GMT', 'bogus'):
+            status, _, _ = self._get(app, '/hello.txt',
+                                     HTTP_IF_MODIFIED_SINCE=value)
+            self.assertEqual(status, '200 OK')
+
+    def test_range(self):
+        for kw in ({}, {'cache_file_size': 10, 'block_size': 7}):
+            app = self._makeOne(**kw)
+            status, headers, body = self._get(
+                app, '/hello.txt', HTTP_RANGE='bytes=7-11',
+                HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(status, '206 Partial Content')
+            self.assertEqual(body, b'world')
+            self.assertEqual(headers['Content-Length'], '5')
+            self.assertEqual(headers['Content-Range'],
+                             'bytes 7-11/%d' % len(self._TEXT))
+            self.assertFalse('Content-Encoding' in headers)
+            status, headers, body = self._get(
+                app, '/hello.txt', HTTP_RANGE='bytes=-14')
+            self.assertEqual(body, self._TEXT[-14:])
+            status, headers, body = self._get(
+                app, '/hello.txt', HTTP_RANGE='bytes=0-4',
+                REQUEST_METHOD='HEAD')
+            self.assertEqual((status, body), ('206 Partial Content', b''))
+
+    def test_range_unsatisfiable(self):
+        app = self._makeOne()
+        status, headers, body = self._get(app, '/hello.txt',
+                                          HTTP_RANGE='bytes=5000-')
+        self.assertEqual(status, '416 Range Not Satisfiable')
+        self.assertEqual(headers['Content-Range'],
+                         'bytes */%d' % len(self._TEXT))
+
+    def test_if_range(self):
+        app = self._makeOne()
+        headers = self._get(app, '/hello.txt')[1]
+        for value in (headers['ETag'], headers['Last-Modified']):
+            status, _, _ = self._get(app, '/hello.txt', HTTP_RANGE='bytes=0-4',
+                                     HTTP_IF_RANGE=value)
+            self.assertEqual(status, '206 Partial Content')
+        status, _, body = self._get(app, '/hello.txt', HTTP_RANGE='bytes=0-4',
+                                    HTTP_IF_RANGE='"stale"')
+        self.assertEqual((status, body), ('200 OK', self._TEXT))
+
+    def test_mounted(self):
+        from webtest import TestApp
+        from ..urlmap import URLMap
+        urlmap = URLMap()
+        urlmap['/static'] = self._makeOne()
+        res = TestApp(urlmap).get('/static/sub/data.bin')
+        self.assertEqual(res.body, bytes(range(256)) * 4)
+
+
+class Test_static_factory(unittest.TestCase):
+
+    def test_defaults(self):
+        from ..static import static_factory
+        app = static_factory({'here': '/srv'}, 'assets')
+        self.assertEqual(app.directory, os.path.realpath('/srv/assets'))
+        self.assertEqual(app.max_age, None)
+        self.assertTrue(app.gzip)
+
+    def test_w_options(self):
+        from ..static import static_factory
+        app = static_factory({}, '/srv/assets', max_age='60', gzip='false',
+                             cache_entries='10', cache_bytes='1000',
+                             cache_file_size='100')
+        self.assertEqual(app.directory, os.path.realpath('/srv/assets'))
+        self.assertEqual(app.max_age, 60)
+        self.assertFalse(app.gzip)
+        self.assertEqual((app.cache_entries, app.cache_bytes,
+                          app.cache_file_size), (10, 1000, 100))
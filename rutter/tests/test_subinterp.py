@@ -0,0 +1,188 @@
+import unittest
+
+
+def echo_app(environ, start_response):
+    """ Module-level, so that worker interpreters can import it.
+    """
+    body = environ['wsgi.input'].read()
+    write = start_response('200 OK', [('Content-Type', 'text/plain')])
+    write(b'%s %s:' % (environ['REQUEST_METHOD'].encode('ascii'),
+                       environ['PATH_INFO'].encode('ascii')))
+    return _Closing([body, b'|%s' % repr(
+        sorted(environ)).encode('ascii')])
+
+
+class _Closing(list):
+
+    closed = False
+
+    def close(self):
+        _Closing.closed = True
+
+
+class Test__run_app(unittest.TestCase):
+
+    def _callFUT(self, spec, environ, body):
+        from ..subinterp import _run_app
+        return _run_app(spec, environ, body)
+
+    def test_it(self):
+        status, headers, body = self._callFUT(
+            'rutter.tests.test_subinterp:echo_app',
+            {'REQUEST_METHOD': 'POST', 'PATH_INFO': '/x'}, b'hello')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers, [('Content-Type', 'text/plain')])
+        self.assertTrue(body.startswith(b'POST /x:hello|'))
+        self.assertTrue(b"'wsgi.errors'" in body)
+        self.assertTrue(_Closing.closed)
+
+    def test_wo_close(self):
+        from .. import subinterp
+        def _app(environ, start_response):
+            start_response('204 No Content', [])
+            return iter([])
+        subinterp._apps['dummy:spec'] = _app
+        try:
+            self.assertEqual(self._callFUT('dummy:spec', {}, b''),
+                             ('204 No Content', [], b''))
+        finally:
+            del subinterp._apps['dummy:spec']
+
+
+class Test__read_body(unittest.TestCase):
+
+    def _callFUT(self, environ):
+        from ..subinterp import _read_body
+        return _read_body(environ)
+
+    def test_wo_length(self):
+        self.assertEqual(self._callFUT({}), b'')
+        self.assertEqual(self._callFUT({'CONTENT_LENGTH': 'bogus'}), b'')
+
+    def test_w_length(self):
+        from io import BytesIO
+        from .. import subinterp
+        _saved, subinterp._CHUNK_SIZE = subinterp._CHUNK_SIZE, 2
+        try:
+            self.assertEqual(self._callFUT(
+                {'CONTENT_LENGTH': '5',
+                 'wsgi.input': BytesIO(b'helloworld')}), b'hello')
+            self.assertEqual(self._callFUT(
+                {'CONTENT_LENGTH': '5', 'wsgi.input': BytesIO(b'hi')}),
+                b'hi')
+        finally:
+            subinterp._CHUNK_SIZE = _saved
+
+
+class InterpreterMountTests(unittest.TestCase):
+
+    _SPEC = 'rutter.tests.test_subinterp:echo_app'
+
+    def _getTargetClass(self):
+        from ..subinterp import InterpreterMount
+        return InterpreterMount
+
+    def _makeOne(self, *args, **kw):
+        mount = self._getTargetClass()(*args, **kw)
+        self.addCleanup(mount.close)
+        return mount
+
+    def test_default_executor(self):
+        from io import BytesIO
+        from ..subinterp import InterpreterPoolExecutor
+        mount = self._makeOne(self._SPEC, workers=2, timeout=5)
+        self.assertEqual(mount.isolated, InterpreterPoolExecutor is not None)
+        started = []
+        def _start_response(status, headers):
+            started.append((status, headers))
+        environ = {'REQUEST_METHOD': 'PUT', 'PATH_INFO': '/y',
+                   'CONTENT_LENGTH': '3', 'wsgi.input': BytesIO(b'abc'),
+                   'wsgi.multithread': True, 'not.shared': object()}
+        body, = mount(environ, _start_response)
+        self.assertEqual(started, [('200 OK',
+                                    [('Content-Type', 'text/plain')])])
+        self.assertTrue(body.startswith(b'PUT /y:abc|'))
+        self.assertTrue(b"'wsgi.multithread'" in body)
+        self.assertFalse(b"'not.shared'" in body)
+
+    def test_w_executor_factory(self):
+        from .. import subinterp
+        created = []
+        class DummyInterpreterPoolExecutor(object):
+            def __init__(self, workers, spec):
+                created.append((workers, spec))
+            def submit(self, fn, *args):
+                return DummyFuture(('200 OK', [], b'fn=%s' % (
+                    fn.__name__.encode('ascii'))))
+            def shutdown(self):
+                self.shut_down = True
+        _saved = subinterp.InterpreterPoolExecutor
+        subinterp.InterpreterPoolExecutor = DummyInterpreterPoolExecutor
+        try:
+            mount = self._makeOne(self._SPEC, workers=3,
+                                  executor_factory=DummyInterpreterPoolExecutor)
+        finally:
+            subinterp.InterpreterPoolExecutor = _saved
+        self.assertTrue(mount.isolated)
+        self.assertEqual(created, [(3, self._SPEC)])
+        self.assertEqual(mount({}, lambda status, headers: None),
+                         [b'fn=_run_app'])
+
+    def test_timeout(self):
+        from concurrent.futures import Future
+        future = Future()
+        class DummyExecutor(object):
+            def __init__(self, workers, spec):
+                pass
+            def submit(self, fn, *args):
+                return future
+            def shutdown(self):
+                pass
+        mount = self._makeOne(self._SPEC, timeout=0.01,
+                              executor_factory=DummyExecutor)
+        started = []
+        body = mount({}, lambda status, headers: started.append(status))
+        self.assertEqual(started, ['504 Gateway Timeout'])
+        self.assertEqual(body, [b'504 Gateway Timeout'])
+        self.assertTrue(future.cancelled())
+
+
+class Test_default_executor_factory(unittest.TestCase):
+
+    def test_it(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from .. import subinterp
+        executor = subinterp.default_executor_factory(1, 'dummy:spec')
+        try:
+            self.assertTrue(isinstance(executor, ThreadPoolExecutor))
+        finally:
+            executor.shutdown()
+
+
+class Test_subinterp_factory(unittest.TestCase):
+
+    def _callFUT(self, global_conf, app, **kw):
+        from ..subinterp import subinterp_factory
+        return subinterp_factory(global_conf, app, **kw)
+
+    def test_defaults(self):
+        mount = self._callFUT({}, InterpreterMountTests._SPEC)
+        self.addCleanup(mount.close)
+        self.assertEqual(mount.workers, 4)
+        self.assertEqual(mount.timeout, None)
+
+    def test_w_options(self):
+        mount = self._callFUT({}, InterpreterMountTests._SPEC, workers='2',
+                              timeout='1.5')
+        self.addCleanup(mount.close)
+        self.assertEqual(mount.workers, 2)
+        self.assertEqual(mount.timeout, 1.5)
+
+
+class DummyFuture(object):
+
+    def __init__(self, result):
+        self._result = result
+
+    def result(self, timeout=None):
+        return self._result
@@ -112,6 +112,38 @@ class Test__normalize_url(unittest.TestCase):
         self.assertEqual(path, '/foo/')
 
 
+class Test__normalize_path_info(unittest.TestCase):
+
+    def _callFUT(self, path_info):
+        from ..urlmap import _normalize_path_info
+        return _normalize_path_info(path_info)
+
+    def test_already_normal(self):
+        path_info = '/foo/bar/'
+        self.assertTrue(self._callFUT(path_info) is path_info)
+
+    def test_w_doubled_slashes(self):
+        self.assertEqual(self._callFUT('//foo///bar/'), '/foo/bar/')
+
+    def test_w_empty(self):
+        self.assertEqual(self._callFUT(''), '')
+
+
+class Test__split_host(unittest.TestCase):
+
+    def _callFUT(self, host, default_port='80'):
+        from ..urlmap import _split_host
+        return _split_host(host, default_port)
+
+    def test_wo_port(self):
+        self.assertEqual(self._callFUT('Example.COM'),
+                         ('example.com', 'example.com:80'))
+
+    def test_w_port(self):
+        self.assertEqual(self._callFUT('Example.COM:8080'),
+                         ('example.com', 'example.com:8080'))
+
+
 class Test__default_not_found_app(unittest.TestCase):
 
     def _callFUT(self, environ, start_response):
@@ -253,6 +285,22 @@ class URLMapTests(unittest.TestCase):
         mapper['/foo'] = _APP2
         self.assertEqual(mapper.applications, [((None, '/foo'), _APP2)])
 
+    def test___setitem___w_existing_publishes_once(self):
+        from .. import urlmap as MUT
+        _APP1, _APP2 = object(), object()
+        mapper = self._makeOne()
+        mapper['/foo'] = _APP1
+        built = []
+        def _table(applications):
+            built.append(list(applications))
+            return object()
+        _saved, MUT._RouteTable = MUT._RouteTable, _table
+        try:
+            mapper['/foo'] = _APP2
+        finally:
+            MUT._RouteTable = _saved
+        self.assertEqual(built, [[((None, '/foo'), _APP2)]])
+
     def test___setitem___sorts(self):
         _APP1, _APP2, _APP3, _APP4 = object(), object(), object(), object()
         mapper = self._makeOne()
@@ -283,6 +331,53 @@ class URLMapTests(unittest.TestCase):
                          [((None, '/foo/bar'), _APP2),
                          ])
 
+    def test_update_w_mapping(self):
+        _APP1, _APP2, _APP3 = object(), object(), object()
+        mapper = self._makeOne()
+        mapper['/foo'] = _APP1
+        mapper['/bar'] = _APP1
+        mapper.update({'/foo/': _APP2, '/bar': None,
+                       'http://example.com/': _APP3})
+        self.assertEqual(mapper.applications,
+                         [(('example.com', ''), _APP3),
+                          ((None, '/foo'), _APP2),
+                         ])
+
+    def test_update_w_pairs(self):
+        _APP1, _APP2 = object(), object()
+        mapper = self._makeOne()
+        mapper.update(iter([('/foo', _APP1), ('/foo/bar', _APP1),
+                            ('/foo/bar', _APP2)]))
+        self.assertEqual(mapper.applications,
+                         [((None, '/foo/bar'), _APP2),
+                          ((None, '/foo'), _APP1),
+                         ])
+
+    def test_update_w_invalid_url(self):
+        _APP1 = object()
+        mapper = self._makeOne()
+        mapper['/foo'] = _APP1
+        self.assertRaises(ValueError, mapper.update, {'bar': _APP1})
+        self.assertEqual(mapper.applications, [((None, '/foo'), _APP1)])
+
+    def test_mutations_publish_new_routing_data(self):
+        _APP1, _APP2 = object(), object()
+        mapper = self._makeOne()
+        mapper['/foo'] = _APP1
+        applications, table = mapper.applications, mapper._table
+        mapper['/bar'] = _APP2
+        self.assertEqual(applications, [((None, '/foo'), _APP1)])
+        self.assertEqual(table.match('example.com', 'example.com:80', '/bar'),
+                         (None, None))
+        applications, table = mapper.applications, mapper._table
+        del mapper['/bar']
+        self.assertEqual(len(applications), 2)
+        self.assertEqual(table.match('example.com', 'example.com:80', '/bar'),
+                         ('/bar', _APP2))
+        self.assertEqual(
+            mapper._table.match('example.com', 'example.com:80', '/bar'),
+            (None, None))
+
     def test_keys_empty(self):
         mapper = self._makeOne()
         self.assertEqual(mapper.keys(), [])
@@ -332,6 +427,86 @@ class URLMapTests(unittest.TestCase):
         mapper['http://example.com/foo'] = _APP4
         self.assertEqual(len(mapper), 4)
 
+    def test_dump_index(self):
+        import json
+        from io import StringIO
+        _APP1, _APP2 = object(), object()
+        mapper = self._makeOne()
+        mapper['/foo'] = _APP1
+        mapper['http://example.com/foo/'] = _APP2
+        fp = StringIO()
+        mapper.dump_index(fp)
+        data = json.loads(fp.getvalue())
+        self.assertEqual(data['format'], 'rutter.urlmap.index')
+        self.assertEqual(data['version'], 1)
+        self.assertEqual(data['routes'],
+                         [['example.com', '/foo'], [None, '/foo']])
+
+    def test_load_index_roundtrip(self):
+        from io import StringIO
+        _APP1, _APP2, _APP3 = object(), object(), object()
+        _NOT_FOUND = object()
+        apps = {(None, '/foo'): _APP1,
+                (None, '/foo/bar'): _APP2,
+                ('example.com', ''): _APP3,
+               }
+        mapper = self._makeOne()
+        for dom_url, app in apps.items():
+            mapper[dom_url] = app
+        fp = StringIO()
+        mapper.dump_index(fp)
+        fp.seek(0)
+        loaded = self._getTargetClass().load_index(
+            fp, apps.__getitem__, _NOT_FOUND)
+        self.assertEqual(loaded.applications, mapper.applications)
+        self.assertTrue(loaded.not_found_application is _NOT_FOUND)
+
+    def test_load_index_unsorted(self):
+        from io import StringIO
+        _APP = object()
+        fp = StringIO('{"format":"rutter.urlmap.index","version":1,'
+                      '"routes":[[null,"/foo"],[null,"/foo/bar"]]}')
+        loaded = self._getTargetClass().load_index(fp, lambda key: _APP)
+        self.assertEqual(loaded.keys(), [(None, '/foo/bar'), (None, '/foo')])
+
+    def test_load_index_w_bad_format(self):
+        from io import StringIO
+        klass = self._getTargetClass()
+        for text in ('[]',
+                     '{"format":"other","version":1,"routes":[]}',
+                     '{"format":"rutter.urlmap.index","version":2,'
+                     '"routes":[]}',
+                    ):
+            self.assertRaises(ValueError,
+                              klass.load_index, StringIO(text), None)
+
+    def test_prepare_for_fork(self):
+        from .. import urlmap
+        _APP1, _APP2 = object(), object()
+        mapper = self._makeOne()
+        mapper.applications.append(((None, '/foo'), _APP1))
+        mapper.applications.append(((None, '/foo/bar'), _APP2))
+        gc = DummyGC()
+        _saved, urlmap.gc = urlmap.gc, gc
+        try:
+            mapper.prepare_for_fork()
+        finally:
+            urlmap.gc = _saved
+        self.assertEqual(mapper.keys(), [(None, '/foo/bar'), (None, '/foo')])
+        self.assertEqual(gc._called, ['collect', 'freeze'])
+
+    def test_prepare_for_fork_wo_gc_freeze(self):
+        from .. import urlmap
+        mapper = self._makeOne()
+        gc = DummyGC()
+        gc.freeze = None
+        _saved, urlmap.gc = urlmap.gc, gc
+        try:
+            mapper.prepare_for_fork()
+        finally:
+            urlmap.gc = _saved
+        self.assertEqual(gc._called, ['collect'])
+
     def test___call___w_empty(self):
         not_found = DummyApp()
         environ = _makeEnviron()
@@ -433,6 +608,172 @@ class URLMapTests(unittest.TestCase):
         self.assertEqual(environ['SCRIPT_NAME'], '/foobar')
         self.assertEqual(environ['PATH_INFO'], '/baz')
 
+    def test___call___w_nested_maps(self):
+        from .. import urlmap as MUT
+        not_found = DummyApp()
+        leaf = DummyApp()
+        environ = _makeEnviron(SCRIPT_NAME='/root',
+                               PATH_INFO='/products/widgets/items/1')
+        def _start_response(status, headers): pass
+        inner = self._makeOne(DummyApp())
+        inner['/items'] = leaf
+        middle = self._makeOne(DummyApp())
+        middle['http://example.com/widgets'] = inner
+        mapper = self._makeOne(not_found)
+        mapper['/products'] = middle
+        calls = []
+        _saved = MUT._split_host
+        def _split_host(host, default_port):
+            calls.append(host)
+            return _saved(host, default_port)
+        MUT._split_host = _split_host
+        try:
+            result = mapper(environ, _start_response)
+        finally:
+            MUT._split_host = _saved
+        self.assertTrue(result is leaf)
+        self.assertEqual(calls, ['example.com'])  # host parsed only once
+        self.assertEqual(environ['SCRIPT_NAME'],
+                         '/root/products/widgets/items')
+        self.assertEqual(environ['PATH_INFO'], '/1')
+
+    def test___call___w_nested_map_changed(self):
+        first, second = DummyApp(), DummyApp()
+        inner = self._makeOne(DummyApp())
+        inner['/a'] = first
+        mapper = self._makeOne(DummyApp())
+        mapper['/inner'] = inner
+        environ = _makeEnviron(PATH_INFO='/inner/a/b')
+        self.assertTrue(mapper(environ.copy(), None) is first)
+        inner['/a/b'] = second
+        self.assertTrue(mapper(environ.copy(), None) is second)
+
+    def test___call___w_nested_map_miss(self):
+        not_found, inner_not_found = DummyApp(), DummyApp()
+        inner = self._makeOne(inner_not_found)
+        inner['/a'] = DummyApp()
+        mapper = self._makeOne(not_found)
+        mapper['/inner'] = inner
+        environ = _makeEnviron(PATH_INFO='/inner/b')
+        result = mapper(environ, None)
+        self.assertTrue(result is inner_not_found)
+        self.assertTrue(environ['paste.urlmap_object'] is inner)
+        self.assertEqual(environ['SCRIPT_NAME'], '/inner')
+        self.assertEqual(environ['PATH_INFO'], '/b')
+        self.assertTrue(not_found.environ is None)
+
+    def test___call___w_nested_subclass_called(self):
+        leaf = DummyApp()
+        class Derived(self._getTargetClass()):
+            def __call__(self, environ, start_response):
+                environ['derived'] = True
+                return super(Derived, self).__call__(environ, start_response)
+        inner = Derived(DummyApp())
+        inner['/a'] = leaf
+        mapper = self._makeOne(DummyApp())
+        mapper['/inner'] = inner
+        environ = _makeEnviron(PATH_INFO='/inner/a')
+        self.assertTrue(mapper(environ, None) is leaf)
+        self.assertTrue(environ['derived'])
+        self.assertEqual(environ['SCRIPT_NAME'], '/inner/a')
+
+
+    def test_resolve_hit(self):
+        app = DummyApp()
+        mapper = self._makeOne()
+        mapper['http://example.com/foo'] = app
+        self.assertEqual(mapper.resolve('Example.com', '/foo/bar'),
+                         (app, '/foo', '/bar'))
+        self.assertEqual(mapper.resolve('example.com:80', '/foo'),
+                         (app, '/foo', ''))
+        self.assertTrue(app.environ is None)  # not called
+
+    def test_resolve_w_https_scheme(self):
+        app = DummyApp()
+        mapper = self._makeOne()
+        mapper['http://example.com:443/foo'] = app
+        self.assertEqual(mapper.resolve('example.com', '/foo'), None)
+        self.assertEqual(mapper.resolve('example.com', '/foo', 'https'),
+                         (app, '/foo', ''))
+
+    def test_resolve_normalizes_path(self):
+        app = DummyApp()
+        mapper = self._makeOne()
+        mapper['/foo'] = app
+        self.assertEqual(mapper.resolve('example.com', '//foo//bar'),
+                         (app, '/foo', '/bar'))
+
+    def test_resolve_miss(self):
+        mapper = self._makeOne()
+        mapper['/foo'] = DummyApp()
+        self.assertEqual(mapper.resolve('example.com', '/bar'), None)
+
+    def test_resolve_w_nested_maps(self):
+        leaf = DummyApp()
+        inner = self._makeOne()
+        inner['/items'] = leaf
+        mapper = self._makeOne()
+        mapper['/products'] = inner
+        self.assertEqual(mapper.resolve('example.com', '/products/items/1'),
+                         (leaf, '/products/items', '/1'))
+        self.assertEqual(mapper.resolve('example.com', '/products/other'),
+                         None)
+
+    def test_resolve_many(self):
+        foo, bar = DummyApp(), DummyApp()
+        mapper = self._makeOne()
+        mapper['/foo'] = foo
+        mapper['http://example.com/bar'] = bar
+        pairs = [('example.com', '/foo/1'), ('other.org', '/bar'),
+                 ('example.com', '/bar'), ('example.com', '/foo/1')]
+        results = mapper.resolve_many(iter(pairs))
+        self.assertEqual(results, [(foo, '/foo', '/1'), None,
+                                   (bar, '/bar', ''), (foo, '/foo', '/1')])
+
+    def test_resolve_many_matches_once_per_prefix(self):
+        from .. import urlmap as MUT
+        foo, foobar = DummyApp(), DummyApp()
+        mapper = self._makeOne()
+        mapper['/foo'] = foo
+        mapper['/foo/bar'] = foobar
+        matched = []
+        match = mapper._table.match
+        class _Table(object):
+            def match(self, host, hostport, path_info):
+                matched.append(path_info)
+                return match(host, hostport, path_info)
+        mapper._table = _Table()
+        pairs = [('example.com', '/foo/1'), ('example.com', '/foo/2'),
+                 ('example.com', '/foo/bar/3'), ('example.com', '/foo/bar'),
+                 ('example.com', '/fo'), ('example.com', '/foo/bar/4')]
+        self.assertEqual(mapper.resolve_many(pairs),
+                         [(foo, '/foo', '/1'), (foo, '/foo', '/2'),
+                          (foobar, '/foo/bar', '/3'),
+                          (foobar, '/foo/bar', ''), None,
+                          (foobar, '/foo/bar', '/4')])
+        self.assertEqual(matched, ['/foo/1', '/foo/bar/3', '/foo/bar', '/fo'])
+        # The memos are bounded.
+        del matched[:]
+        _saved, MUT._RESOLVE_MEMO_SIZE = MUT._RESOLVE_MEMO_SIZE, 1
+        try:
+            mapper.resolve_many([('a.com', '/foo/1'), ('b.com', '/foo/1'),
+                                 ('a.com', '/foo/1')])
+        finally:
+            MUT._RESOLVE_MEMO_SIZE = _saved
+        self.assertEqual(matched, ['/foo/1'] * 3)
+
+    def test_resolve_many_w_https_scheme(self):
+        app = DummyApp()
+        mapper = self._makeOne()
+        mapper['http://example.com:443/foo'] = app
+        self.assertEqual(
+            mapper.resolve_many([('example.com', '/foo')], 'https'),
+            [(app, '/foo', '')])
+
+    def test_resolve_many_empty(self):
+        mapper = self._makeOne()
+        self.assertEqual(mapper.resolve_many([]), [])
+
 
 class Test_urlmap_factory(unittest.TestCase):
 
@@ -479,6 +820,293 @@ class Test_urlmap_factory(unittest.TestCase):
         self.assertTrue(mapper['/foo/bar'] is _APP3)
 
 
+    def test_w_warmup(self):
+        from .test_warmup import WarmApp
+        _APP1, _APP2 = WarmApp(), WarmApp()
+        loader = DummyLoader(xxx=_APP1, yyy=_APP2)
+        mapper = self._callFUT(loader, {}, warmup='true', warmup_workers='2',
+                               **{'/foo': 'xxx', '/bar': 'yyy warmup=/a,/b'})
+        self.assertEqual([environ['PATH_INFO'] for environ in _APP1.environs],
+                         [''])
+        self.assertEqual([environ['PATH_INFO'] for environ in _APP2.environs],
+                         ['/a', '/b'])
+        self.assertEqual(sorted(mapper.warmup_results),
+                         [(None, '/bar'), (None, '/foo')])
+        self.assertTrue(mapper['/bar'] is _APP2)
+
+    def test_w_warmup_per_mount_only(self):
+        from .test_warmup import WarmApp
+        _APP1, _APP2 = WarmApp(), WarmApp()
+        loader = DummyLoader(xxx=_APP1, yyy=_APP2)
+        mapper = self._callFUT(loader, {},
+                               **{'/foo': 'xxx', '/bar': 'yyy warmup'})
+        self.assertEqual(_APP1.environs, [])
+        self.assertEqual(len(_APP2.environs), 1)
+        self.assertEqual(list(mapper.warmup_results), [(None, '/bar')])
+
+    def test_w_warmup_per_mount_w_shared_app(self):
+        from .test_warmup import WarmApp
+        _APP1 = WarmApp()
+        loader = DummyLoader(api=_APP1)
+        mapper = self._callFUT(loader, {}, **{'/a': 'api warmup=/x',
+                                              '/b': 'api warmup=/y',
+                                              '/c': 'api'})
+        self.assertEqual(sorted((environ['SCRIPT_NAME'], environ['PATH_INFO'])
+                                for environ in _APP1.environs),
+                         [('/a', '/x'), ('/b', '/y')])
+        self.assertEqual(sorted(mapper.warmup_results),
+                         [(None, '/a'), (None, '/b')])
+
+    def test_w_warmup_per_mount_w_manifest(self):
+        import os
+        import shutil
+        import tempfile
+        from .test_warmup import WarmApp
+        _APP1 = WarmApp()
+        loader = DummyLoader(api=_APP1)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(tmpdir, 'mounts.csv'), 'w') as f:
+                f.write('path,domain,app\n'
+                        '/b/,,api warmup=/y\n'
+                        '/c,,api\n')
+            mapper = self._callFUT(loader, {'here': tmpdir},
+                                   manifest='mounts.csv',
+                                   **{'/a': 'api warmup=/x'})
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual(sorted((environ['SCRIPT_NAME'], environ['PATH_INFO'])
+                                for environ in _APP1.environs),
+                         [('/a', '/x'), ('/b', '/y')])
+
+    def test_w_warmup_skips_lazy_mounts(self):
+        from .test_warmup import WarmApp
+        loader = MakingLoader(factory=WarmApp)
+        mapper = self._callFUT(loader, {}, warmup='true',
+                               **{'/a': 'a lazy', '/b': 'b lazy warmup=/x',
+                                  '/c': 'c'})
+        self.assertEqual(sorted(loader.made), ['b', 'c'])
+        self.assertFalse(mapper['/a'].loaded)
+        self.assertTrue(mapper['/b'].loaded)
+        self.assertEqual(sorted(mapper.warmup_results),
+                         [(None, '/b'), (None, '/c')])
+
+    def test_w_warmup_and_wrapper(self):
+        from .test_warmup import WarmApp
+        _APP1 = WarmApp()
+        loader = DummyLoader(xxx=_APP1)
+        mapper = self._callFUT(
+            loader, {}, **{'/foo': 'xxx warmup=/a ratelimit_rate=5'})
+        self.assertEqual(len(_APP1.environs), 1)
+        self.assertEqual(mapper['/foo'].app, _APP1)
+        self.assertEqual(list(mapper.warmup_results), [(None, '/foo')])
+
+    def test_w_warmup_fail(self):
+        from ..warmup import WarmupError
+        from .test_warmup import WarmApp
+        loader = DummyLoader(xxx=WarmApp('500 Internal Server Error'))
+        with self.assertRaises(WarmupError):
+            self._callFUT(loader, {}, warmup='true', warmup_fail='true',
+                          **{'/foo': 'xxx'})
+
+    def test_wo_warmup(self):
+        loader = DummyLoader(xxx=DummyApp())
+        mapper = self._callFUT(loader, {}, **{'/foo': 'xxx'})
+        self.assertEqual(mapper.warmup_results, {})
+
+    def test_w_lazy(self):
+        from ..lazy import LazyMount
+        loader = MakingLoader()
+        mapper = self._callFUT(loader, {}, lazy_max_loaded='1',
+                               lazy_idle_ttl='60',
+                               **{'/foo': 'xxx lazy', '/bar': 'xxx lazy',
+                                  '/baz': 'yyy lazy=true'})
+        self.assertEqual(loader.made, [])
+        foo = mapper['/foo']
+        self.assertTrue(isinstance(foo, LazyMount))
+        self.assertTrue(mapper['/bar'] is foo)
+        self.assertEqual(mapper.lazy_pool.max_loaded, 1)
+        self.assertEqual(mapper.lazy_pool.idle_ttl, 60.0)
+        self.assertEqual(mapper.lazy_pool.sweep_interval, 60.0)
+        self.addCleanup(mapper.lazy_pool.close)
+        self.assertEqual(sorted(mapper.shared_apps['xxx']),
+                         [(None, '/bar'), (None, '/foo')])
+        mapper(_makeEnviron(PATH_INFO='/foo/x'), None).close()
+        self.assertEqual(loader.made, ['xxx'])
+        mapper(_makeEnviron(PATH_INFO='/baz'), None).close()
+        self.assertEqual(loader.made, ['xxx', 'yyy'])
+        self.assertFalse(foo.loaded)  # evicted by max_loaded
+
+    def test_w_lazy_wo_limits_wo_share_apps(self):
+        loader = MakingLoader()
+        mapper = self._callFUT(loader, {}, share_apps='false',
+                               **{'/foo': 'xxx lazy', '/bar': 'xxx lazy'})
+        self.assertFalse(mapper['/foo'] is mapper['/bar'])
+        self.assertEqual(mapper.lazy_pool.max_loaded, None)
+        self.assertEqual(mapper.lazy_pool.idle_ttl, None)
+        self.assertEqual(mapper.lazy_pool.sweep_interval, None)
+
+    def test_wo_lazy(self):
+        loader = DummyLoader(xxx=DummyApp())
+        mapper = self._callFUT(loader, {}, **{'/foo': 'xxx'})
+        self.assertEqual(mapper.lazy_pool, None)
+
+    def test_w_metrics(self):
+        import shutil
+        import tempfile
+        from ..metrics import SharedMetrics
+        _APP1 = DummyApp()
+        loader = DummyLoader(xxx=_APP1)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            mapper = self._callFUT(loader, {'here': tmpdir},
+                                   metrics='metrics.bin', metrics_workers='4',
+                                   **{'/foo': 'xxx'})
+            metrics = mapper.metrics
+            self.assertTrue(isinstance(metrics, SharedMetrics))
+            self.assertEqual(metrics.path, tmpdir + '/metrics.bin')
+            self.assertEqual(metrics.workers, 4)
+            self.assertEqual(metrics.labels, ['/foo', '<not found>'])
+            self.assertTrue(mapper['/foo'].app is _APP1)
+            metrics.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_wo_metrics(self):
+        loader = DummyLoader(xxx=DummyApp())
+        mapper = self._callFUT(loader, {}, **{'/foo': 'xxx'})
+        self.assertEqual(mapper.metrics, None)
+
+    def test_w_manifest(self):
+        import os
+        import shutil
+        import tempfile
+        _APP1, _APP2 = DummyApp(), DummyApp()
+        loader = DummyLoader(xxx=_APP1, yyy=_APP2)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(tmpdir, 'mounts.csv'), 'w') as f:
+                f.write('path,domain,app\n'
+                        '/foo,,yyy\n'
+                        '/bar,example.com,xxx\n')
+            mapper = self._callFUT(loader, {'here': tmpdir},
+                                   manifest='mounts.csv', **{'/foo': 'xxx'})
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual(len(mapper), 2)
+        self.assertTrue(mapper['/foo'] is _APP2)
+        self.assertTrue(mapper['http://example.com/bar'] is _APP1)
+
+    def test_w_manifest_absolute(self):
+        import os
+        import shutil
+        import tempfile
+        _APP1 = DummyApp()
+        loader = DummyLoader(xxx=_APP1)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'mounts.jsonl')
+            with open(filename, 'w') as f:
+                f.write('{"path": "/foo", "app": "xxx"}\n')
+            mapper = self._callFUT(loader, {'here': '/nonesuch'},
+                                   manifest=filename)
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertTrue(mapper['/foo'] is _APP1)
+
+    def test_w_shared_apps(self):
+        loader = MakingLoader()
+        umap = {'/api': 'api', '/v1': 'api', 'domain x.com /': 'api',
+                '/other': 'other'}
+        mapper = self._callFUT(loader, {}, **umap)
+        self.assertEqual(loader.made, ['api', 'other'])
+        api = mapper['/api']
+        self.assertTrue(mapper['/v1'] is api)
+        self.assertTrue(mapper[('x.com', '')] is api)
+        self.assertEqual(
+            mapper.shared_apps,
+            {'api': [('x.com', ''), (None, '/api'),
+                     (None, '/v1')]})
+
+    def test_w_shared_apps_opt_out(self):
+        loader = MakingLoader()
+        umap = {'/api': 'api', '/v1': 'api'}
+        mapper = self._callFUT(loader, {}, share_apps='false', **umap)
+        self.assertEqual(loader.made, ['api', 'api'])
+        self.assertFalse(mapper['/v1'] is mapper['/api'])
+        self.assertEqual(mapper.shared_apps, {})
+
+    def test_w_shared_apps_w_manifest(self):
+        import os
+        import shutil
+        import tempfile
+        loader = MakingLoader()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(tmpdir, 'mounts.csv'), 'w') as f:
+                f.write('path,domain,app\n'
+                        '/bar,,api\n')
+            mapper = self._callFUT(loader, {'here': tmpdir},
+                                   manifest='mounts.csv', **{'/foo': 'api'})
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual(loader.made, ['api'])
+        self.assertTrue(mapper['/bar'] is mapper['/foo'])
+        self.assertEqual(mapper.shared_apps,
+                         {'api': [(None, '/foo'), (None, '/bar')]})
+
+    def test_w_mount_options(self):
+        from ..compress import Compress
+        loader = MakingLoader()
+        umap = {'/api': 'api compress compress_level=9', '/v1': 'api',
+                '/v2': 'api compress_min_size=10', '/v3': 'api compress=no'}
+        mapper = self._callFUT(loader, {}, **umap)
+        self.assertEqual(loader.made, ['api'])
+        api = mapper['/v1']
+        self.assertTrue(isinstance(mapper['/api'], Compress))
+        self.assertTrue(mapper['/api'].app is api)
+        self.assertEqual(mapper['/api'].level, 9)
+        self.assertEqual(mapper['/v2'].min_size, 10)
+        self.assertTrue(mapper['/v3'] is api)
+        self.assertEqual(sorted(mapper.shared_apps['api']),
+                         [(None, '/api'), (None, '/v1'), (None, '/v2'),
+                          (None, '/v3')])
+
+    def test_w_stacked_mount_options(self):
+        from ..compress import Compress
+        from ..ratelimit import RateLimit
+        loader = MakingLoader()
+        mapper = self._callFUT(loader, {}, **{
+            '/api': 'api ratelimit_rate=5 ratelimit_key=REMOTE_ADDR compress'})
+        limiter = mapper['/api']
+        self.assertTrue(isinstance(limiter, RateLimit))
+        self.assertEqual(limiter.key, 'REMOTE_ADDR')
+        self.assertTrue(isinstance(limiter.app, Compress))
+
+    def test_w_unknown_mount_option(self):
+        loader = MakingLoader()
+        self.assertRaises(ValueError, self._callFUT, loader, {},
+                          **{'/api': 'api bogus=1'})
+
+    def test_w_unknown_wrapper_option(self):
+        loader = MakingLoader()
+        with self.assertRaises(ValueError) as raised:
+            self._callFUT(loader, {}, **{
+                '/api': 'api compress_bogus=1 compress_app=x'})
+        self.assertEqual(str(raised.exception),
+                         'Unknown mount options: compress_app, compress_bogus')
+
+    def test_w_compress_cache_body_size(self):
+        loader = MakingLoader()
+        mapper = self._callFUT(loader, {}, **{
+            '/api': 'api compress_cache_body_size=10'})
+        self.assertEqual(mapper['/api'].cache_body_size, 10)
+
+    def test_w_empty_app_expression(self):
+        self.assertRaises(ValueError, self._callFUT, MakingLoader(), {},
+                          **{'/api': ' '})
+
+
 class DummyApp(object):
 
     environ = start_response = None
@@ -488,11 +1116,32 @@ class DummyApp(object):
         self.start_response = start_response
         return self
 
+class DummyGC(object):
+
+    def __init__(self):
+        self._called = []
+
+    def collect(self):
+        self._called.append('collect')
+
+    def freeze(self):
+        self._called.append('freeze')
+
 class DummyLoader(dict):
 
     def get_app(self, spec, global_conf):
         return self[spec]
 
+class MakingLoader(object):
+
+    def __init__(self, factory=None):
+        self.made = []
+        self.factory = factory or DummyApp
+
+    def get_app(self, spec, global_conf):
+        self.made.append(spec)
+        return self.factory()
+
 def _makeEnviron(**kw):
     environ = {
         'HTTP_HOST': 'example.com',
@@ -0,0 +1,119 @@
+import unittest
+
+
+class Test_warm_up(unittest.TestCase):
+
+    def _callFUT(self, urlmap, *args, **kw):
+        from ..warmup import warm_up
+        return warm_up(urlmap, *args, **kw)
+
+    def _makeMap(self, **mounts):
+        from ..urlmap import URLMap
+        urlmap = URLMap()
+        for key, app in mounts.items():
+            urlmap[key] = app
+        return urlmap
+
+    def test_empty(self):
+        self.assertEqual(self._callFUT(self._makeMap()), {})
+
+    def test_default_paths(self):
+        from ..urlmap import URLMap
+        foo, bar = WarmApp(), WarmApp()
+        urlmap = URLMap()
+        urlmap['/foo'] = foo
+        urlmap['http://example.com:8080/bar'] = bar
+        results = self._callFUT(urlmap)
+        self.assertEqual(sorted(results, key=repr),
+                         [('example.com:8080', '/bar'), (None, '/foo')])
+        result = results[(None, '/foo')]
+        self.assertEqual(result['statuses'], ['200 OK'])
+        self.assertEqual(result['errors'], [])
+        self.assertTrue(result['seconds'] >= 0)
+        environ, = foo.environs
+        self.assertEqual(environ['REQUEST_METHOD'], 'GET')
+        self.assertEqual(environ['SCRIPT_NAME'], '/foo')
+        self.assertEqual(environ['PATH_INFO'], '')
+        self.assertTrue(environ['rutter.warmup'])
+        self.assertTrue('wsgi.input' in environ)
+        environ, = bar.environs
+        self.assertEqual(environ['HTTP_HOST'], 'example.com:8080')
+        self.assertTrue(foo.closed and bar.closed)
+
+    def test_w_paths(self):
+        foo, bar = WarmApp(), WarmApp()
+        urlmap = self._makeMap(**{'/foo': foo, '/bar': bar})
+        results = self._callFUT(urlmap, {'/foo/': ['/a', 'b?x=1']},
+                                default_paths=())
+        self.assertEqual(list(results), [(None, '/foo')])
+        self.assertEqual(results[(None, '/foo')]['statuses'],
+                         ['200 OK', '200 OK'])
+        self.assertEqual([(environ['PATH_INFO'], environ['QUERY_STRING'])
+                          for environ in foo.environs],
+                         [('/a', ''), ('/b', 'x=1')])
+        self.assertEqual(bar.environs, [])
+
+    def test_w_write_callable(self):
+        def _writing(environ, start_response):
+            write = start_response('200 OK', [])
+            write(b'legacy')
+            return []
+        results = self._callFUT(self._makeMap(**{'/w': _writing}))
+        self.assertEqual(results[(None, '/w')]['statuses'], ['200 OK'])
+
+    def test_errors(self):
+        def _raising(environ, start_response):
+            raise RuntimeError('boom')
+
+        def _silent(environ, start_response):
+            return []
+        urlmap = self._makeMap(**{
+            '/ok': WarmApp(),
+            '/fail': WarmApp('503 Service Unavailable'),
+            '/raise': _raising,
+            '/silent': _silent,
+        })
+        results = self._callFUT(urlmap, workers=2)
+        self.assertEqual(results[(None, '/ok')]['errors'], [])
+        self.assertEqual(results[(None, '/fail')]['errors'],
+                         ["GET '' answered '503 Service Unavailable'"])
+        self.assertEqual(results[(None, '/raise')]['statuses'], [None])
+        self.assertEqual(results[(None, '/raise')]['errors'],
+                         ["GET '' raised RuntimeError('boom')"])
+        self.assertEqual(results[(None, '/silent')]['errors'],
+                         ["GET '' did not start a response"])
+
+    def test_fail_on_error(self):
+        from ..warmup import WarmupError
+        first, second = WarmApp(), WarmApp('500 Internal Server Error')
+        urlmap = self._makeMap(**{'/ok': first, '/fail': second})
+        with self.assertRaises(WarmupError) as raised:
+            self._callFUT(urlmap, fail_on_error=True)
+        self.assertEqual(raised.exception.mount, (None, '/fail'))
+        self.assertTrue('500 Internal' in str(raised.exception))
+        self.assertEqual(len(first.environs), 1)  # all mounts were warmed
+
+    def test_fail_on_error_wo_errors(self):
+        urlmap = self._makeMap(**{'/ok': WarmApp()})
+        results = self._callFUT(urlmap, fail_on_error=True)
+        self.assertEqual(results[(None, '/ok')]['errors'], [])
+
+
+class WarmApp(object):
+
+    closed = False
+
+    def __init__(self, status='200 OK'):
+        self.status = status
+        self.environs = []
+
+    def __call__(self, environ, start_response):
+        self.environs.append(environ)
+        start_response(self.status, [('Content-Type', 'text/plain')])
+        return self
+
+    def __iter__(self):
+        return iter([b'warm'])
+
+    def close(self):
+        self.closed = True
@@ -10,10 +10,21 @@ try:
     from html import escape
 except ImportError:  # pragma: NO COVER Python2
     from cgi import escape
+from bisect import bisect_right
+import functools
+import gc
+import inspect
+import itertools
+import json
+import os
 import re
 
 from webob.exc import HTTPNotFound
 
+from ._util import _asbool
+from .compress import compress_factory
+from .ratelimit import ratelimit_factory
+
 def _parse_path_expression(path):
     """ Parse a path expression for a path alone.
     
@@ -58,6 +69,9 @@ def _parse_path_expression(path):
     return s
 
 
+_INDEX_FORMAT = 'rutter.urlmap.index'
+_INDEX_VERSION = 1
+
 _NORM_URL_RE = re.compile('//+')
 _DOMAIN_URL_RE = re.compile('^(http|https)://')
 
@@ -106,6 +120,123 @@ def _normalize_url(url, trim=True):
     return domain, url
 
 
+def _split_host(host, default_port):
+    """Return ``(host, 'host:port')`` for a request's host header.
+    """
+    host = host.lower()
+    i = host.find(':')
+    if i >= 0:
+        return host[:i], host
+    return host, host + ':' + default_port
+
+
+def _normalize_path_info(path_info):
+    """Return ``path_info`` normalized as by ``_normalize_url``, untrimmed.
+
+    Usual, already-normal paths are returned as is, without a regex call.
+    """
+    if path_info.startswith('/') and '//' not in path_info:
+        return path_info
+    return _normalize_url(path_info, False)[1]
+
+
+_NO_MATCH = (None, None)
+# Entries kept by each of ``URLMap.resolve_many``'s memos.
+_RESOLVE_MEMO_SIZE = 65536
+
+
+def _longest_prefix(paths, lengths, path_info):
+    """Return ``(app_url, app)`` for the longest mount in ``paths`` matching
+    ``path_info``, or ``(None, None)``.
+
+    ``paths`` maps each mounted path to its ``(app_url, app)`` match, which
+    is returned as is, without allocating a new tuple or string.  Only the
+    whole path and its prefixes ending just before a ``/`` can match;
+    ``lengths`` (the lengths of the mounted paths) lets us skip slicing
+    prefixes which cannot.
+    """
+    match = paths.get(path_info)
+    if match is not None:
+        return match
+    i = path_info.rfind('/')
+    while i >= 0:
+        if i in lengths:
+            match = paths.get(path_info[:i])
+            if match is not None:
+                return match
+        i = path_info.rfind('/', 0, i)
+    return _NO_MATCH
+
+
+class _RouteTable(object):
+    """Compiled routing index for a ``URLMap``.
+
+    Small tables are scanned, like ``URLMap._match_linear``, but over
+    precomputed ``(domain, app_url, app_url + '/', (app_url, app))``
+    entries.
+
+    Larger ones group the mounts by domain, each group mapping paths to
+    ``(app_url, app)`` matches, so that a lookup costs one dictionary probe
+    per candidate prefix of the request path, rather than a scan over all
+    mounts.  Built from the sorted applications, so that the first of any
+    duplicate keys wins, as in the linear scan.
+    """
+    __slots__ = ('scan', 'domains', 'wildcard', 'lengths')
+
+    SCAN_LIMIT = 8
+
+    def __init__(self, applications):
+        self.scan = None
+        if len(applications) <= self.SCAN_LIMIT:
+            self.scan = tuple(
+                (domain, app_url, app_url + '/', (app_url, app))
+                for (domain, app_url), app in applications)
+            return
+        self.domains = {}
+        self.wildcard = {}
+        lengths = set()
+        for (domain, app_url), app in applications:
+            if domain:
+                paths = self.domains.setdefault(domain, {})
+            else:
+                paths = self.wildcard
+            paths.setdefault(app_url, (app_url, app))
+            lengths.add(len(app_url))
+        self.lengths = frozenset(lengths)
+
+    def match(self, host, hostport, path_info):
+        """See ``URLMap._match``.
+        """
+        scan = self.scan
+        if scan is not None:
+            for domain, app_url, app_dir, match in scan:
+                if domain and domain != host and domain != hostport:
+                    continue
+                if path_info == app_url or path_info.startswith(app_dir):
+                    return match
+            return _NO_MATCH
+        domains, lengths = self.domains, self.lengths
+        # Domain groups are tried in sort order:  domain-less mounts sort
+        # as if their domain were '\xff'.  ``host`` sorts before
+        # ``hostport``, of which it is a prefix.
+        if domains:
+            for domain in (host, hostport):
+                paths = domains.get(domain)
+                if paths is not None and domain < '\xff':
+                    match = _longest_prefix(paths, lengths, path_info)
+                    if match is not _NO_MATCH:
+                        return match
+        match = _longest_prefix(self.wildcard, lengths, path_info)
+        if match is _NO_MATCH and domains:
+            for domain in (host, hostport):
+                paths = domains.get(domain)
+                if paths is not None and domain >= '\xff':
+                    match = _longest_prefix(paths, lengths, path_info)
+                    if match is not _NO_MATCH:
+                        break
+        return match
+
+
 class URLMap(MutableMapping):
     """Dispatch to one of several applications based on the URL.
 
@@ -119,21 +250,45 @@ class URLMap(MutableMapping):
     tuples ``('blah.com', '/foo')``.  This will match domain names; without
     the ``http://domain`` or with a domain of ``None`` any domain will be
     matched (so long as no other explicit domain matches).
+
+    Mutating the map builds a new applications list and routing table, and
+    publishes each with a single assignment, so that dispatch reads only
+    immutable routing data, and needs no locks even on free-threaded
+    Python builds.
+
+    Mounted ``URLMap`` instances (but not instances of subclasses) are
+    resolved by the outer map, in the same walk, against their current
+    routing tables:  the result is the same as calling them, without
+    parsing the host and path again at each level.
     """
+    # A ``rutter.capture.Recorder``, sampling dispatches, if set.
+    recorder = None
+
     def __init__(self, not_found_app=_default_not_found_app):
         self.applications = []
         self.not_found_application = not_found_app
+        self._table = _RouteTable(())
 
     def _sort_apps(self):
         """Sort applications, longest URLs first.
 
         Apps w/o domains sort *last*.
         """
+        self._publish(self.applications)
+
+    def _publish(self, applications):
+        """Sort ``applications``, then publish them with their routing table.
+
+        Both are built before either is published, so that a concurrent
+        request sees the map either before or after the change.
+        """
         def key(app_desc):
             dom_url, app = app_desc
             domain, url = dom_url
             return domain or '\xff', -len(url)
-        self.applications = sorted(self.applications, key=key)
+        applications = sorted(applications, key=key)
+        table = _RouteTable(applications)
+        self.applications, self._table = applications, table
 
     def __getitem__(self, url):
         dom_url = _normalize_url(url)
@@ -142,7 +297,7 @@ class URLMap(MutableMapping):
                 return app
         raise KeyError(
             "No application with the url %r (domain: %r; existing: %s)"
-            % (url[1], url[0] or '*', self.applications))
+            % (dom_url[1], dom_url[0] or '*', self.applications))
 
     def __setitem__(self, url, app):
         if app is None:
@@ -152,21 +307,49 @@ class URLMap(MutableMapping):
                 pass
             return
         dom_url = _normalize_url(url)
-        if dom_url in self:
-            del self[dom_url]
-        self.applications.append((dom_url, app))
-        self._sort_apps()
+        applications = [
+            (app_url, mounted) for app_url, mounted in self.applications
+            if app_url != dom_url]
+        applications.append((dom_url, app))
+        self._publish(applications)
 
     def __delitem__(self, url):
         url = _normalize_url(url)
-        for app_url, app in self.applications:
+        applications = self.applications
+        for i, (app_url, app) in enumerate(applications):
             if app_url == url:
-                self.applications.remove((app_url, app))
+                applications = applications[:i] + applications[i + 1:]
+                self.applications = applications
+                self._table = _RouteTable(applications)
                 break
         else:
             raise KeyError(
                 "No application with the url %r" % (url,))
 
+    def update(self, other=(), **kw):
+        """Mount several applications at once.
+
+        Accepts the same arguments as ``dict.update``.  As with
+        ``__setitem__``, mounting ``None`` removes any existing mount;
+        unlike repeated ``__setitem__`` calls, the applications are sorted
+        only once.
+        """
+        pending = {}
+        for source in (other, kw):
+            if hasattr(source, 'keys'):
+                items = ((url, source[url]) for url in source.keys())
+            else:
+                items = source
+            for url, app in items:
+                pending[_normalize_url(url)] = app
+        applications = [
+            (dom_url, app) for dom_url, app in self.applications
+            if dom_url not in pending]
+        applications.extend(
+            (dom_url, app) for dom_url, app in pending.items()
+            if app is not None)
+        self._publish(applications)
+
     def keys(self):
         return [app_url for app_url, app in self.applications]
 
@@ -176,31 +359,282 @@ class URLMap(MutableMapping):
     def __len__(self):
         return len(self.applications)
 
-    def __call__(self, environ, start_response):
-        host = environ.get('HTTP_HOST', environ.get('SERVER_NAME')).lower()
-        if ':' in host:
-            host, port = host.split(':', 1)
-        else:
-            if environ['wsgi.url_scheme'] == 'http':
-                port = '80'
-            else:
-                port = '443'
-        hostport = host + ':' + port
-        path_info = environ.get('PATH_INFO')
-        path_info = _normalize_url(path_info, False)[1]
+    def dump_index(self, fp):
+        """Write the routing index to the text file ``fp``.
+
+        Only the normalized ``(domain, path)`` keys are written, in dispatch
+        order;  the applications are not.  See ``load_index``.
+        """
+        json.dump({
+            'format': _INDEX_FORMAT,
+            'version': _INDEX_VERSION,
+            'routes': [list(dom_url) for dom_url in self.keys()],
+        }, fp, separators=(',', ':'))
+
+    @classmethod
+    def load_index(cls, fp, get_app, not_found_app=_default_not_found_app):
+        """Create a mapper from an index written by ``dump_index``.
+
+        ``get_app`` is called with each ``(domain, path)`` key and must
+        return the application to mount there.  The keys are already
+        normalized and sorted, so they are not re-parsed.
+        """
+        data = json.load(fp)
+        if (not isinstance(data, dict)
+                or data.get('format') != _INDEX_FORMAT
+                or data.get('version') != _INDEX_VERSION):
+            raise ValueError("Not a URLMap index (version %d)"
+                             % _INDEX_VERSION)
+        mapper = cls(not_found_app)
+        applications = []
+        for domain, path in data['routes']:
+            dom_url = (domain, path)
+            applications.append((dom_url, get_app(dom_url)))
+        # Already in order:  timsort just verifies that in linear time.
+        mapper._publish(applications)
+        return mapper
+
+    def prepare_for_fork(self):
+        """Finalize the routing structures before forking worker processes.
+
+        Call this in the master process of a preforking server, after the
+        application is loaded.  Besides finalizing the mapper, it moves all
+        objects tracked by the garbage collector into the permanent
+        generation (``gc.freeze``, where available), so that collections
+        in the workers do not write to (and thereby unshare) the pages
+        holding them.
+        """
+        self._sort_apps()
+        gc.collect()
+        freeze = getattr(gc, 'freeze', None)
+        if freeze is not None:
+            freeze()
+
+    def _match(self, host, hostport, path_info):
+        """Return ``(app_url, app)`` for the mount matching a request.
+
+        ``path_info`` must already be normalized.  Return ``(None, None)``
+        if no mount matches.
+        """
+        return self._table.match(host, hostport, path_info)
+
+    def _match_linear(self, host, hostport, path_info):
+        """Reference implementation of ``_match``:  scan the sorted mounts.
+        """
         for dom_url, app in self.applications:
             domain, app_url = dom_url
             if domain and domain != host and domain != hostport:
                 continue
             if (path_info == app_url
                 or path_info.startswith(app_url + '/')):
-                environ['SCRIPT_NAME'] += app_url
-                environ['PATH_INFO'] = path_info[len(app_url):]
-                return app(environ, start_response)
-        environ['paste.urlmap_object'] = self
-        return self.not_found_application(environ, start_response)
+                return app_url, app
+        return None, None
+
+    def _resolve(self, host, hostport, path_info, match=None):
+        """Resolve a request through this map and any nested ``URLMap``.
+
+        ``path_info`` must already be normalized;  ``match``, if given, is
+        this map's ``_match`` result for it.  Return ``(urlmap, app,
+        script_name, path_info)``:  the map which matched (or, if ``app``
+        is ``None``, failed to), and the ``SCRIPT_NAME`` suffix and
+        ``PATH_INFO`` for ``app``.
+        """
+        urlmap = self
+        if match is None:
+            match = self._match(host, hostport, path_info)
+        app_url, app = match
+        if app is None:
+            return self, None, '', path_info
+        script_name = app_url
+        path_info = path_info[len(app_url):]
+        # Resolve nested maps here, against their current tables, rather
+        # than calling them to parse the host and path all over again.
+        while type(app) is URLMap:
+            urlmap = app
+            app_url, app = urlmap._match(host, hostport, path_info)
+            if app is None:
+                break
+            script_name += app_url
+            path_info = path_info[len(app_url):]
+        return urlmap, app, script_name, path_info
+
+    def resolve(self, host, path, scheme='http'):
+        """Return the mount a request would be dispatched to, without
+        calling it.
+
+        ``host`` is as in the ``Host`` header (the port defaults to that of
+        ``scheme``);  ``path`` is the request's ``PATH_INFO``.  Return
+        ``(app, script_name, path_info)``, where ``script_name`` is the
+        suffix the dispatch adds to ``SCRIPT_NAME``, or ``None`` if no
+        mount (nor, for nested maps, any of theirs) matches.
+        """
+        host, hostport = _split_host(
+            host, '80' if scheme == 'http' else '443')
+        urlmap, app, script_name, path_info = self._resolve(
+            host, hostport, _normalize_path_info(path))
+        if app is None:
+            return None
+        return app, script_name, path_info
+
+    def resolve_many(self, pairs, scheme='http'):
+        """Return a list of ``resolve(host, path, scheme)`` results, one for
+        each ``(host, path)`` pair of the iterable ``pairs``.
+
+        Meant for offline analysis of large batches, such as access logs,
+        against one snapshot of this map's routing table:  each distinct
+        host is parsed once, and this map's mount looked up once per host
+        and distinct path prefix, up to just past the longest mount which
+        the path could match (which is all a match depends on).  Both memos
+        are cleared when they reach ``_RESOLVE_MEMO_SIZE`` entries.
+        """
+        default_port = '80' if scheme == 'http' else '443'
+        table = self._table
+        # Prefix length of paths, by length, for the memo of matches.
+        lengths = sorted(set(len(app_url) for (domain, app_url), app
+                             in self.applications))
+        split_hosts = {}
+        matches = {}
+        results = []
+        for host, path in pairs:
+            split = split_hosts.get(host)
+            if split is None:
+                if len(split_hosts) >= _RESOLVE_MEMO_SIZE:
+                    split_hosts.clear()
+                split = split_hosts[host] = _split_host(host, default_port)
+            path_info = _normalize_path_info(path)
+            index = bisect_right(lengths, len(path_info))
+            key = (split, path_info[:lengths[index - 1] + 1] if index else '')
+            match = matches.get(key)
+            if match is None:
+                if len(matches) >= _RESOLVE_MEMO_SIZE:
+                    matches.clear()
+                match = matches[key] = table.match(
+                    split[0], split[1], path_info)
+            app_url, app = match
+            if app is None:
+                results.append(None)
+            elif type(app) is not URLMap:
+                results.append((app, app_url, path_info[len(app_url):]))
+            else:
+                urlmap, app, script_name, path_info = self._resolve(
+                    split[0], split[1], path_info, match)
+                results.append(
+                    None if app is None else (app, script_name, path_info))
+        return results
+
+    def __call__(self, environ, start_response):
+        recorder = self.recorder
+        started = None if recorder is None else recorder.start()
+        scheme = environ['wsgi.url_scheme']
+        host, hostport = _split_host(
+            environ.get('HTTP_HOST', environ.get('SERVER_NAME')),
+            '80' if scheme == 'http' else '443')
+        urlmap, app, script_name, path_info = self._resolve(
+            host, hostport, _normalize_path_info(environ.get('PATH_INFO')))
+        if started is not None:
+            recorder.record(hostport, scheme, environ.get('PATH_INFO'),
+                            None if app is None else script_name, started)
+        if app is None:
+            if urlmap is not self:
+                environ['SCRIPT_NAME'] += script_name
+                environ['PATH_INFO'] = path_info
+            environ['paste.urlmap_object'] = urlmap
+            return urlmap.not_found_application(environ, start_response)
+        environ['SCRIPT_NAME'] += script_name
+        environ['PATH_INFO'] = path_info
+        return app(environ, start_response)
+
+# Per-mount options of ``urlmap_factory``:  name -> wrapper factory,
+# innermost first.
+_MOUNT_WRAPPERS = (
+    ('compress', compress_factory),
+    ('ratelimit', ratelimit_factory),
+)
+
+
+def _parse_app_expression(value):
+    """ Parse the value of a ``urlmap_factory`` mount.
+
+    E.g., for 'api compress compress_level=9', return
+    ``('api', {'compress': 'true', 'compress_level': '9'})``.
+    """
+    parts = value.split()
+    if not parts:
+        raise ValueError('No application name given')
+    options = {}
+    for part in parts[1:]:
+        name, eq, option = part.partition('=')
+        options[name] = option if eq else 'true'
+    return parts[0], options
+
+
+def _wrap_app(app, options):
+    """ Wrap ``app`` as configured by its mount's ``options``.
+
+    Each of ``_MOUNT_WRAPPERS`` is applied, in order, if its option is true,
+    or (absent the option) if any of its ``<name>_<param>`` options are
+    given;  those are passed to its factory as ``param``.  Other options,
+    including ``<name>_<param>`` options its factory does not accept, raise
+    ``ValueError``.
+    """
+    options = dict(options)
+    for name, factory in _MOUNT_WRAPPERS:
+        accepted = inspect.signature(factory).parameters
+        params = dict(
+            (key[len(name) + 1:], options.pop(key))
+            for key in list(options) if key.startswith(name + '_')
+            and key[len(name) + 1:] in accepted and key != name + '_app')
+        if _asbool(options.pop(name, bool(params))):
+            app = factory(app, **params)
+    if options:
+        raise ValueError('Unknown mount options: %s'
+                         % ', '.join(sorted(options)))
+    return app
+
 
 def urlmap_factory(loader, global_conf, **local_conf):
+    """``paste.composite_factory`` for ``URLMap``.
+
+    Each mount's value is an application name, optionally followed by
+    options, e.g. ``api compress compress_level=9`` (see
+    ``_MOUNT_WRAPPERS``).
+
+    Each application name is loaded only once, however many paths mount
+    it, unless ``share_apps`` is false.  The returned map's
+    ``shared_apps`` attribute maps each name mounted more than once to the
+    keys of its mounts.
+
+    If ``warmup`` is true, each mount is sent a warm-up request (see
+    ``rutter.warmup.warm_up``) before the map is returned;  a mount's
+    ``warmup=/path,/other`` option sets the paths to request from it
+    (just ``warmup`` requests the mount itself), even if ``warmup`` is
+    false.  Lazy mounts (below) are warmed only if they set ``warmup=``.
+    Up to ``warmup_workers`` mounts are warmed at once;  if
+    ``warmup_fail`` is true, a failed warm-up request raises
+    ``WarmupError``.  The map's ``warmup_results`` attribute holds the
+    per-mount results.
+
+    A mount's ``lazy`` option defers loading its application to the first
+    request (see ``rutter.lazy.LazyMount``).  The lazy mounts share the
+    map's ``lazy_pool``, which evicts the least recently used of them
+    beyond ``lazy_max_loaded``, and those idle for more than
+    ``lazy_idle_ttl`` seconds, checked at least that often even without
+    requests.
+
+    If ``metrics`` names a file, per-mount request metrics are recorded
+    there, shared by up to ``metrics_workers`` worker processes (see
+    ``rutter.metrics.instrument``);  the map's ``metrics`` attribute holds
+    the ``SharedMetrics``.
+    """
+    manifest = local_conf.pop('manifest', None)
+    share_apps = _asbool(local_conf.pop('share_apps', True))
+    warmup = _asbool(local_conf.pop('warmup', False))
+    warmup_workers = int(local_conf.pop('warmup_workers', 8))
+    warmup_fail = _asbool(local_conf.pop('warmup_fail', False))
+    lazy_max_loaded = local_conf.pop('lazy_max_loaded', None)
+    lazy_idle_ttl = local_conf.pop('lazy_idle_ttl', None)
+    metrics = local_conf.pop('metrics', None)
+    metrics_workers = int(local_conf.pop('metrics_workers', 64))
     if 'not_found_app' in local_conf:
         not_found_app = local_conf.pop('not_found_app')
     else:
@@ -211,8 +645,89 @@ def urlmap_factory(loader, global_conf, **local_conf):
         urlmap = URLMap(not_found_app=not_found_app)
     else:
         urlmap = URLMap()
-    for path, app_name in local_conf.items():
-        path = _parse_path_expression(path)
-        app = loader.get_app(app_name, global_conf=global_conf)
-        urlmap[path] = app
+    loaded = {}
+    bases = {}
+    warmup_paths = {}
+    urlmap.lazy_pool = None
+
+    def get_app(dom_url, expression):
+        app_name, options = _parse_app_expression(expression)
+        paths = options.pop('warmup', None)
+        lazy = _asbool(options.pop('lazy', False))
+        if lazy:
+            app = _lazy_app(app_name)
+        else:
+            app = loaded.get(app_name) if share_apps else None
+        if app is None:
+            app = loaded[app_name] = loader.get_app(
+                app_name, global_conf=global_conf)
+        if options:
+            wrapped = _wrap_app(app, options)
+            bases[id(wrapped)] = app
+            app = wrapped
+        if paths is not None:
+            warmup_paths[_normalize_url(dom_url)] = (
+                [''] if paths == 'true' else paths.split(','))
+        elif lazy and warmup:
+            # Warming would load every lazy mount at startup.
+            warmup_paths[_normalize_url(dom_url)] = []
+        return app
+
+    lazy_apps = {}
+
+    def _lazy_app(app_name):
+        from .lazy import LazyMount
+        from .lazy import MountPool
+        app = lazy_apps.get(app_name) if share_apps else None
+        if app is None:
+            if urlmap.lazy_pool is None:
+                urlmap.lazy_pool = MountPool(
+                    max_loaded=None if lazy_max_loaded is None
+                    else int(lazy_max_loaded),
+                    idle_ttl=None if lazy_idle_ttl is None
+                    else float(lazy_idle_ttl),
+                    sweep_interval=None if lazy_idle_ttl is None
+                    else float(lazy_idle_ttl))
+            app = lazy_apps[app_name] = LazyMount(
+                functools.partial(loader.get_app, app_name,
+                                  global_conf=global_conf),
+                urlmap.lazy_pool)
+        return app
+
+    mounts = [(_parse_path_expression(path), expression)
+              for path, expression in local_conf.items()]
+    urlmap.update((dom_url, get_app(dom_url, expression))
+                  for dom_url, expression in mounts)
+    if manifest:
+        from .manifest import _iter_source
+        if not os.path.isabs(manifest) and 'here' in global_conf:
+            manifest = os.path.join(global_conf['here'], manifest)
+        urlmap.update((dom_url, get_app(dom_url, spec))
+                      for dom_url, spec in _iter_source(manifest))
+    urlmap.shared_apps = {}
+    if share_apps:
+        mounts_by_app = {}
+        for dom_url, mounted in urlmap.applications:
+            base = bases.get(id(mounted), mounted)
+            mounts_by_app.setdefault(id(base), []).append(dom_url)
+        for app_name, app in itertools.chain(loaded.items(),
+                                             lazy_apps.items()):
+            keys = mounts_by_app.get(id(app), ())
+            if len(keys) > 1:
+                urlmap.shared_apps[app_name] = keys
+    urlmap.warmup_results = {}
+    if warmup or warmup_paths:
+        from .warmup import warm_up
+        urlmap.warmup_results = warm_up(
+            urlmap,
+            warmup_paths,
+            default_paths=('',) if warmup else (),
+            workers=warmup_workers,
+            fail_on_error=warmup_fail)
+    urlmap.metrics = None
+    if metrics:
+        from .metrics import instrument
+        if not os.path.isabs(metrics) and 'here' in global_conf:
+            metrics = os.path.join(global_conf['here'], metrics)
+        urlmap.metrics = instrument(urlmap, metrics, metrics_workers)
     return urlmap
@@ -0,0 +1,122 @@
+""" Warm up a ``URLMap``'s mounted applications.  See ``warm_up``
+"""
+from concurrent.futures import ThreadPoolExecutor
+import time
+from wsgiref.util import setup_testing_defaults
+
+from .urlmap import _normalize_url
+
+
+class WarmupError(Exception):
+    """ A warm-up request to a mounted application failed.
+
+    ``mount`` is the ``(domain, path)`` key of the mount.
+    """
+    def __init__(self, mount, message):
+        super(WarmupError, self).__init__('Mount %r: %s' % (mount, message))
+        self.mount = mount
+
+
+def _environ(dom_url, path):
+    domain, app_url = dom_url
+    path, _, query = path.partition('?')
+    if path and not path.startswith('/'):
+        path = '/' + path
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': app_url,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'rutter.warmup': True,
+    }
+    if domain:
+        environ['HTTP_HOST'] = domain
+    setup_testing_defaults(environ)
+    return environ
+
+
+def _request(app, environ):
+    """ Call ``app``, consuming its response;  return its status.
+    """
+    started = []
+
+    def _start_response(status, headers, exc_info=None):
+        started[:] = [status]
+        return _discard
+
+    iterable = app(environ, _start_response)
+    try:
+        for chunk in iterable:
+            pass
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+    return started[0] if started else None
+
+
+def _discard(data):
+    pass
+
+
+def _warm_mount(dom_url, app, paths):
+    """ Request each of ``paths`` from ``app``, in turn.
+    """
+    statuses, errors = [], []
+    started = time.perf_counter()
+    for path in paths:
+        try:
+            status = _request(app, _environ(dom_url, path))
+        except Exception as e:
+            statuses.append(None)
+            errors.append('GET %r raised %r' % (path, e))
+            continue
+        statuses.append(status)
+        if status is None:
+            errors.append('GET %r did not start a response' % (path,))
+        elif status.startswith('5'):
+            errors.append('GET %r answered %r' % (path, status))
+    return {'seconds': time.perf_counter() - started,
+            'statuses': statuses,
+            'errors': errors}
+
+
+def warm_up(urlmap, paths=None, default_paths=('',), workers=8,
+            fail_on_error=False):
+    """ Send synthetic ``GET`` requests to the applications of ``urlmap``.
+
+    ``paths`` maps mount keys (as for ``urlmap[key]``) to the paths (below
+    the mount, optionally with a query string) to request from each;  other
+    mounts get ``default_paths`` (by default, the mount itself), or, if
+    that is empty, are skipped.  Each mount's requests are made in turn,
+    with the mounts warmed concurrently in a pool of ``workers`` threads.
+    Requests have a ``rutter.warmup`` environ key, and their response
+    bodies are read and discarded.
+
+    Return a dict mapping each warmed mount's ``(domain, path)`` key to a
+    dict of its ``seconds``, ``statuses`` and ``errors``:  exceptions,
+    ``5xx`` statuses, and requests not starting a response.  If
+    ``fail_on_error``, raise ``WarmupError`` for the first mount (in
+    dispatch order) with any errors, once all are done.
+    """
+    per_mount = {}
+    for key, mount_paths in (paths or {}).items():
+        per_mount[_normalize_url(key)] = list(mount_paths)
+    mounts = [(dom_url, app, per_mount.get(dom_url, default_paths))
+              for dom_url, app in urlmap.applications]
+    mounts = [mount for mount in mounts if mount[2]]
+    results = {}
+    if mounts:
+        with ThreadPoolExecutor(workers) as executor:
+            futures = [(dom_url, executor.submit(_warm_mount, dom_url, app,
+                                                 mount_paths))
+                       for dom_url, app, mount_paths in mounts]
+            for dom_url, future in futures:
+                results[dom_url] = future.result()
+    if fail_on_error:
+        for dom_url, app, mount_paths in mounts:
+            errors = results[dom_url]['errors']
+            if errors:
+                raise WarmupError(dom_url, '; '.join(errors))
+    return results
+
@@ -63,5 +63,11 @@ setup(name="rutter",
       entry_points="""
       [paste.composite_factory]
       urlmap = rutter.urlmap:urlmap_factory
+      cascade = rutter.cascade:cascade_factory
+      [paste.app_factory]
+      static = rutter.static:static_factory
+      subinterp = rutter.subinterp:subinterp_factory
+      proxy = rutter.proxy:proxy_factory
+      metrics = rutter.metrics:metrics_factory
       """,
 )